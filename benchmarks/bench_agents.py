@@ -0,0 +1,86 @@
+"""Agent steps per second for per-agent stepping and AgentBatch.
+
+Moves N critters with random turns around a random maze, once by calling
+ContinuousAgent.go_forward on each agent and once with AgentBatch.step,
+and checks that both end up in the same places.
+
+    python benchmarks/bench_agents.py
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+from bench_detect import random_map  # noqa: E402
+from colour_critter import Cell  # noqa: E402
+
+
+def spawn(world, n, seed=0):
+    random.seed(seed)
+    return grid.AgentBatch.spawn(world, n)
+
+
+def turns(n, steps, seed=0):
+    return np.random.RandomState(seed).uniform(-0.2, 0.2, size=(steps, n))
+
+
+def run_agents(batch, turn, speed):
+    for amounts in turn:
+        for agent, amount in zip(batch.agents, amounts.tolist()):
+            agent.turn(amount)
+            agent.go_forward(speed)
+
+
+def run_batch(batch, turn, speed):
+    batch.speed[:] = speed
+    for amounts in turn:
+        batch.turn(amounts)
+        batch.step()
+    batch.sync()
+
+
+def main():
+    speed = 0.05
+    for directions in (4, 8):
+        world = grid.World(Cell, map=random_map(64, density=0.2),
+                           directions=directions)
+        a = spawn(world, 50)
+        b = spawn(world, 50)
+        b.x[:], b.y[:], b.dir[:] = a.x, a.y, a.dir
+        b.cell_x[:], b.cell_y[:] = a.cell_x, a.cell_y
+        turn = turns(50, 200)
+        run_agents(a, turn, speed)
+        run_batch(b, turn, speed)
+        a.pull()
+        assert np.allclose(a.x, b.x) and np.allclose(a.y, b.y)
+
+    print('%-8s %12s %16s %16s %8s' % (
+        'agents', 'steps', 'per-agent /s', 'batch /s', 'speedup'))
+    world = grid.World(Cell, map=random_map(256, density=0.2), directions=4)
+    for n in (10, 100, 1000, 10000):
+        steps = max(10, 20000 // n)
+        turn = turns(n, steps)
+
+        batch = spawn(world, n)
+        start = time.perf_counter()
+        run_agents(batch, turn, speed)
+        per_agent = n * steps / (time.perf_counter() - start)
+
+        batch.pull()
+        start = time.perf_counter()
+        run_batch(batch, turn, speed)
+        batched = n * steps / (time.perf_counter() - start)
+        for agent in batch.agents:
+            world.remove(agent)
+
+        print('%-8d %12d %16.0f %16.0f %7.1fx' % (
+            n, steps, per_agent, batched, batched / per_agent))
+
+
+if __name__ == '__main__':
+    main()
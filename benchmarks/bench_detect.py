@@ -0,0 +1,96 @@
+"""Sensor calls per second for ContinuousAgent.detect.
+
+Compares the exact ray caster with the original step-halving marcher on the
+``mymap`` maze from colour_critter and on larger random mazes, and reports
+how often the two disagree.  Most disagreements are the marcher stepping a
+whole cell at a time and tunnelling through wall corners, so they are split
+into cases where the ray saw a nearer wall and cases where it saw a further
+one (corner grazes that the marcher resolves differently).
+
+    python benchmarks/bench_detect.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+from colour_critter import Cell, mymap  # noqa: E402
+
+
+def random_map(size, density=0.3, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for j in range(size):
+        row = []
+        for i in range(size):
+            border = i in (0, size - 1) or j in (0, size - 1)
+            row.append('#' if border or rng.random() < density else ' ')
+        rows.append(''.join(row))
+    return '\n'.join(rows)
+
+
+def make_agent(world, seed=0):
+    rng = random.Random(seed)
+    body = grid.ContinuousAgent()
+    world.add(body, dir=0)
+    body.x += rng.uniform(-0.4, 0.4)
+    body.y += rng.uniform(-0.4, 0.4)
+    return body
+
+
+def calls_per_second(body, method, max_distance, n_dirs=64, duration=0.5):
+    directions = [body.world.directions * i / n_dirs for i in range(n_dirs)]
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for d in directions:
+            body.detect(d, max_distance=max_distance, method=method)
+        calls += n_dirs
+    return calls / (time.perf_counter() - start)
+
+
+def mismatches(world, max_distance, n_agents=50, n_dirs=64):
+    total = 0
+    nearer = 0
+    further = 0
+    for seed in range(n_agents):
+        body = make_agent(world, seed)
+        for i in range(n_dirs):
+            body.detect(world.directions * i / n_dirs,
+                        max_distance=max_distance, method='compare')
+            total += 1
+        for x, y, d, ray, march in body.__dict__.get('detect_mismatches', ()):
+            if ray[0] < march[0]:
+                nearer += 1
+            else:
+                further += 1
+        world.remove(body)
+    return nearer, further, total
+
+
+def main():
+    random.seed(0)
+    cases = [('mymap', mymap)] + [
+        ('random %dx%d' % (n, n), random_map(n)) for n in (64, 256, 1024)]
+    print('%-16s %4s %6s %12s %12s %8s %8s %8s' % (
+        'map', 'dirs', 'range', 'march/s', 'ray/s', 'speedup',
+        'nearer', 'further'))
+    for name, text in cases:
+        for directions in (4, 8):
+            world = grid.World(Cell, map=text, directions=directions)
+            for max_distance in (4, 32):
+                body = make_agent(world)
+                march = calls_per_second(body, 'march', max_distance)
+                ray = calls_per_second(body, 'ray', max_distance)
+                world.remove(body)
+                nearer, further, total = mismatches(world, max_distance)
+                print('%-16s %4d %6d %12.0f %12.0f %7.1fx %7.1f%% %7.1f%%' % (
+                    name, directions, max_distance, march, ray, ray / march,
+                    100.0 * nearer / total, 100.0 * further / total))
+
+
+if __name__ == '__main__':
+    main()
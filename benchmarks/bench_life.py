@@ -0,0 +1,83 @@
+"""Ticks per second of World.update for a Game of Life cell.
+
+Compares the per-cell update() path in list and array storage with the
+batched update_arrays() path of an array-backed World, and checks that all
+three evolve the same way.
+
+    python benchmarks/bench_life.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+
+
+class LifeCell(grid.Cell):
+    alive = False
+    array_fields = grid.Cell.array_fields + (('alive', np.bool_),)
+
+    def update(self):
+        n = 0
+        for c in self.neighbours:
+            if c.alive:
+                n += 1
+        self.alive = n == 3 or (self.alive and n == 2)
+
+
+class BatchedLifeCell(LifeCell):
+    @classmethod
+    def update_arrays(cls, world, old, new):
+        n = world.neighbour_sum(old['alive'].view(np.uint8))
+        new['alive'][...] = (n == 3) | (old['alive'] & (n == 2))
+
+
+def make_world(cell, size, storage, seed=0):
+    world = grid.World(cell, width=size, height=size, storage=storage)
+    alive = np.random.RandomState(seed).rand(size, size) < 0.3
+    if storage == 'array':
+        world.arrays['alive'][...] = alive
+    else:
+        for y, row in enumerate(world.grid):
+            for x, c in enumerate(row):
+                c.alive = bool(alive[y, x])
+    return world
+
+
+def ticks_per_second(world, duration=1.0, max_ticks=1000):
+    ticks = 0
+    start = time.perf_counter()
+    while ticks < max_ticks and time.perf_counter() - start < duration:
+        world.update()
+        ticks += 1
+    return ticks / (time.perf_counter() - start)
+
+
+def main():
+    a = make_world(LifeCell, 64, 'list')
+    b = make_world(LifeCell, 64, 'array')
+    c = make_world(BatchedLifeCell, 64, 'array')
+    for i in range(10):
+        a.update()
+        b.update()
+        c.update()
+    assert (a.get_array('alive') == b.arrays['alive']).all()
+    assert (a.get_array('alive') == c.arrays['alive']).all()
+
+    print('%-10s %-28s %12s' % ('size', 'path', 'ticks/s'))
+    for size in (100, 1000):
+        for name, cell, storage in (
+                ('per-cell update (list)', LifeCell, 'list'),
+                ('per-cell update (array)', LifeCell, 'array'),
+                ('update_arrays (array)', BatchedLifeCell, 'array')):
+            world = make_world(cell, size, storage)
+            print('%-10s %-28s %12.2f' % (
+                '%dx%d' % (size, size), name, ticks_per_second(world)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Load and save times for ASCII and binary maps.
+
+Times the ASCII map in list and array storage, then the .npz archive and the
+memory-mapped .npy directory written by World.save_binary; that every
+format round-trips is tested in tests/test_grid_io.py.  Opening a .npy
+directory does not depend on the size of the map, since cells and pages are
+only read as they are touched.
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py 10000
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+from colour_critter import Cell  # noqa: E402
+
+
+def random_colour_map(size, density=0.3, seed=0):
+    rng = np.random.RandomState(seed)
+    chars = np.array(list(' GRBMY#'))
+    p = [(1 - density) * 0.9] + [(1 - density) * 0.02] * 5 + [density]
+    codes = rng.choice(len(chars), size=(size, size), p=p)
+    codes[[0, -1], :] = codes[:, [0, -1]] = len(chars) - 1
+    return '\n'.join(''.join(row) for row in chars[codes])
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    tmp = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            text = random_colour_map(size)
+            txt = os.path.join(tmp, 'map%d.txt' % size)
+            with open(txt, 'w') as f:
+                f.write(text + '\n')
+            print('%dx%d' % (size, size))
+
+            if size <= 1000:
+                t = timed(grid.World, Cell, filename=txt, storage='list')[1]
+                print('  ascii, list storage   %8.3fs' % t)
+            world, t = timed(grid.World, Cell, filename=txt, storage='array')
+            print('  ascii, array storage  %8.3fs' % t)
+            t = timed(world.save)[1]
+            print('  save ascii            %8.3fs' % t)
+
+            npz = os.path.join(tmp, 'map%d.npz' % size)
+            npy = os.path.join(tmp, 'map%d' % size)
+            t = timed(world.save_binary, npz)[1]
+            print('  save .npz             %8.3fs  %6.1f MB' % (
+                t, os.path.getsize(npz) / 1e6))
+            t = timed(world.save_binary, npy)[1]
+            print('  save .npy             %8.3fs  %6.1f MB' % (t, sum(
+                os.path.getsize(os.path.join(npy, n)) for n in os.listdir(npy)) / 1e6))
+
+            t = timed(grid.World, Cell, filename=npz)[1]
+            print('  load .npz             %8.3fs' % t)
+            t = timed(grid.World, Cell, filename=npy)[1]
+            print('  open .npy (mmap)      %8.3fs' % t)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [100, 1000, 4096])
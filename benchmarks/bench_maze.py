@@ -0,0 +1,48 @@
+"""Generation time of each maze method, and a check that mazes are trees.
+
+    python benchmarks/bench_maze.py
+    python benchmarks/bench_maze.py 4096
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import maze  # noqa: E402
+
+
+def open_cells_reached(wall, directions):
+    # flood fill from one open cell, without wrapping
+    reached = np.zeros_like(wall)
+    reached.reshape(-1)[np.flatnonzero(~wall)[0]] = True
+    while True:
+        grown = reached | (maze.neighbour_count(~reached, directions) < directions)
+        grown &= ~wall
+        if np.array_equal(grown, reached):
+            return np.count_nonzero(reached)
+        reached = grown
+
+
+def main(sizes):
+    for size in sizes:
+        print('%dx%d' % (size, size))
+        for method in maze.methods:
+            for directions in (4, 6):
+                start = time.perf_counter()
+                arrays = maze.generate(size, size, method, directions, seed=1)
+                elapsed = time.perf_counter() - start
+                again = maze.generate(size, size, method, directions, seed=1)
+                assert all(np.array_equal(arrays[k], again[k]) for k in arrays)
+                note = ''
+                if method != 'caves' and size <= 256:
+                    open_cells = np.count_nonzero(~arrays['wall'])
+                    assert open_cells_reached(arrays['wall'], directions) == open_cells
+                    note = 'connected'
+                print('  %-12s %d directions %8.2fs  %s' % (method, directions, elapsed, note))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [64, 256, 1024])
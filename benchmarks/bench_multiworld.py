@@ -0,0 +1,94 @@
+"""multiworld.WorldHost against one grid.BridgeOutput per world.
+
+Steps the same worlds and random commands both ways, checks that the
+sensors agree on every step, and reports world-steps per second (worlds
+times steps); then times colour_critter.make_population with the
+reference counter against as many single-critter simulators.
+
+    python benchmarks/bench_multiworld.py
+    python benchmarks/bench_multiworld.py 1 10 100 1000
+"""
+import os
+import random
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import colour_critter  # noqa: E402
+import grid  # noqa: E402
+import maze  # noqa: E402
+import multiworld  # noqa: E402
+
+
+def make_worlds(n, size=32):
+    worlds = []
+    for i in range(n):
+        text = maze.to_text(maze.generate(size, size, 'prim', seed=i, colour_density=0.05))
+        world = grid.World(colour_critter.Cell, map=text, directions=4, storage='array')
+        cells = list(world.find_cells(lambda c: not c.wall))
+        world.add(grid.ContinuousAgent(), cell=random.Random(i).choice(cells), dir=i % 4)
+        worlds.append(world)
+    return worlds
+
+
+def commands(n, steps, seed=0):
+    rng = np.random.RandomState(seed)
+    c = rng.uniform(-1, 1, (steps, n, 3))
+    c[:, :, 2] = 1
+    return c
+
+
+def environments(n, steps):
+    cmds = commands(n, steps)
+    bridges = [grid.BridgeOutput(w, w.agents[0]) for w in make_worlds(n)]
+    host = multiworld.WorldHost(make_worlds(n))
+
+    # the same commands both ways give the same sensors
+    check = min(steps, 200)
+    for step in range(check):
+        expected = np.array([b(0, c) for b, c in zip(bridges, cmds[step])])
+        assert np.allclose(expected, host.step(cmds[step])), step
+
+    start = time.perf_counter()
+    for step in range(check, steps):
+        for b, c in zip(bridges, cmds[step]):
+            b(0, c)
+    separate = (steps - check) * n / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for step in range(check, steps):
+        host.step(cmds[step])
+    hosted = (steps - check) * n / (time.perf_counter() - start)
+    print('%6d worlds  %10.0f world-steps/s separate  %10.0f hosted  %5.1fx' % (
+        n, separate, hosted, hosted / separate))
+
+
+def critters(n, duration=0.2):
+    start = time.perf_counter()
+    for i in range(n):
+        critter = colour_critter.make_critter(seed=i, bridge=True, counter='reference')
+        critter.sim.run(duration, progress_bar=False)
+    separate = time.perf_counter() - start
+    start = time.perf_counter()
+    population = colour_critter.make_population([colour_critter.mymap] * n, seed=0,
+                                                counter='reference')
+    population.sim.run(duration, progress_bar=False)
+    hosted = time.perf_counter() - start
+    print('%6d critters  %.2fs as separate simulators  %.2fs as one population' % (
+        n, separate, hosted))
+
+
+def main(sizes=(1, 10, 100, 1000)):
+    warnings.simplefilter('ignore')
+    for n in sizes:
+        environments(n, steps=max(400, 20000 // n))
+    for n in sizes:
+        if n <= 100:
+            critters(n)
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or (1, 10, 100, 1000))
@@ -0,0 +1,60 @@
+"""Agent.go_towards with and without a planning.Planner.
+
+Agents start in random cells of a maze and head for one target.  Without a
+planner they step greedily and mostly get stuck; with one they follow the
+cached flow field and all arrive.
+
+    python benchmarks/bench_planning.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+import maze  # noqa: E402
+import planning  # noqa: E402
+from colour_critter import Cell  # noqa: E402
+
+
+def run(size, n_agents, plan, max_steps):
+    world = maze.make_world(Cell, maze.generate(size, size, 'prim', seed=1))
+    if plan:
+        planner = planning.Planner(world)
+    rng = random.Random(0)
+    open_cells = list(world.find_cells(lambda c: not c.wall))
+    target = open_cells[-1]
+    agents = []
+    for i in range(n_agents):
+        agent = grid.Agent()
+        world.add(agent, cell=rng.choice(open_cells))
+        agents.append(agent)
+    start = time.perf_counter()
+    steps = 0
+    for i in range(max_steps):
+        moving = [a for a in agents if a.cell is not target]
+        if not moving:
+            break
+        for agent in moving:
+            agent.go_towards(target)
+            steps += 1
+    elapsed = time.perf_counter() - start
+    arrived = sum(a.cell is target for a in agents)
+    print('  %-8s %4d/%d arrived  %10.0f steps/s' % (
+        'planner' if plan else 'greedy', arrived, n_agents, steps / elapsed))
+    if plan:
+        print('           %s' % planner.stats())
+
+
+def main():
+    for size in (65, 257):
+        print('%dx%d' % (size, size))
+        for plan in (False, True):
+            # greedy agents that have not arrived after a few crossings never will
+            run(size, 200, plan, max_steps=size * size // 2 if plan else 10 * size)
+
+
+if __name__ == '__main__':
+    main()
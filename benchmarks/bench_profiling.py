@@ -0,0 +1,63 @@
+"""Overhead of profiling and a per-step breakdown of the critter.
+
+Runs the critter (with its GridNode) with profiling disabled, enabled, and
+disabled again, then prints the report and writes the JSON and folded
+flame-graph output.
+
+    python benchmarks/bench_profiling.py
+    flamegraph.pl critter.folded > critter.svg
+"""
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import colour_critter  # noqa: E402
+import grid  # noqa: E402
+import profiling  # noqa: E402
+
+
+def steps_per_second(sim, duration):
+    start = time.perf_counter()
+    sim.run(duration, progress_bar=False)
+    return duration / sim.dt / (time.perf_counter() - start)
+
+
+def calls_per_second(f, n=200000):
+    start = time.perf_counter()
+    for i in range(n):
+        f(None)
+    return n / (time.perf_counter() - start)
+
+
+def main(duration=0.5, out='critter'):
+    warnings.simplefilter('ignore')
+    original = grid.ContinuousAgent.detect
+    critter = colour_critter.make_critter(render=True)
+    with critter.sim as sim:
+        sim.run(0.05, progress_bar=False)
+        print('disabled   %8.0f steps/s' % steps_per_second(sim, duration))
+        profiling.enable()
+        print('enabled    %8.0f steps/s' % steps_per_second(sim, duration))
+        profiling.disable()
+        print('disabled   %8.0f steps/s' % steps_per_second(sim, duration))
+    assert grid.ContinuousAgent.detect is original
+
+    # the flag check in instrument() is all an instrumented function costs
+    # while profiling is disabled
+    f = colour_critter.passthrough.__wrapped__
+    print('passthrough %8.0f calls/s, instrumented %8.0f calls/s' % (
+        calls_per_second(lambda t: f(t, 0)),
+        calls_per_second(lambda t: colour_critter.passthrough(t, 0))))
+
+    print()
+    print(profiling.report())
+    profiling.save_json(out + '.json')
+    profiling.save_folded(out + '.folded')
+    print('\nwrote %s.json and %s.folded' % (out, out))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
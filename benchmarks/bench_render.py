@@ -0,0 +1,72 @@
+"""Render time and bytes per frame for GridNode's SVG renderer.
+
+Renders a random map with a handful of wandering agents and a wall that
+comes and goes, once rebuilding every frame from scratch and once
+incrementally, in list and array storage, and checks that both produce
+the same SVG.
+
+    python benchmarks/bench_render.py
+"""
+import itertools
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+from bench_detect import random_map  # noqa: E402
+
+
+class Cell(grid.Cell):
+    def color(self):
+        if self.wall:
+            return 'black'
+
+    def load(self, char):
+        if char == '#':
+            self.wall = True
+
+
+def run(world, agents, renderer, frames, move_every):
+    rng = random.Random(0)
+    for frame in range(frames):
+        if frame % move_every == 0:
+            for agent in agents:
+                agent.turn(rng.uniform(-0.5, 0.5))
+                agent.go_forward(0.05)
+            cell = world.get_cell(1 + frame % (world.width - 2), 1)
+            cell.wall = not cell.wall
+        renderer.render()
+    return renderer.stats()
+
+
+def main():
+    frames = 50
+    print('%-10s %-7s %-6s %-12s %12s %14s %14s %8s' % (
+        'size', 'storage', 'moves', 'mode', 'ms/frame', 'built B/frame', 'out B/frame',
+        'cached'))
+    for n in (50, 200, 400):
+        text = random_map(n, density=0.2)
+        for storage, move_every in itertools.product(('list', 'array'), (1, 10)):
+            outputs = []
+            for incremental in (False, True):
+                random.seed(1)
+                world = grid.World(Cell, map=text, directions=4, storage=storage)
+                agents = [grid.ContinuousAgent() for i in range(5)]
+                for agent in agents:
+                    world.add(agent)
+                renderer = grid.SVGRenderer(world, incremental=incremental)
+                stats = run(world, agents, renderer, frames, move_every)
+                outputs.append(renderer.svg)
+                print('%-10s %-7s %-6s %-12s %12.3f %14.0f %14.0f %8d' % (
+                    '%dx%d' % (n, n), storage, '1/%d' % move_every,
+                    'incremental' if incremental else 'full',
+                    stats['time_per_frame'] * 1000,
+                    stats['bytes_built_per_frame'],
+                    stats['bytes_out_per_frame'], stats['cached_frames']))
+            assert sorted(outputs[0].split('/>')) == sorted(outputs[1].split('/>'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Accuracy, memory and speed of grid.SensorField against exact rays.
+
+For a few resolutions and heading counts, builds a SensorField over a
+generated maze, reports how far detect(method='field') is from cast_ray
+from random positions and directions and how long an incremental update
+takes after walls change, then times both methods.  The error bounds and
+the incremental update are tested in tests/test_sensor_field.py.
+
+    python benchmarks/bench_sensor_field.py
+    python benchmarks/bench_sensor_field.py 128
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+import maze  # noqa: E402
+from colour_critter import Cell  # noqa: E402
+
+max_distance = 4
+configs = ((2, 32, np.float32), (4, 64, np.float32), (4, 64, np.uint8), (8, 128, np.float32))
+
+
+def error_bound(resolution):
+    # a read is from a sample up to one sample width away, in a heading up
+    # to half a heading step off; rays grazing corners are out by more
+    return 1.5 / resolution
+
+
+def make_world(size, directions):
+    arrays = maze.generate(size, size, 'prim', seed=1, colour_density=0.05)
+    return grid.World(Cell, map=maze.to_text(arrays), directions=directions, storage='array')
+
+
+def place(agent, cell, x, y):
+    agent.cell = cell
+    agent.x = x
+    agent.y = y
+
+
+def errors(agent, cells, rng, n=5000):
+    found = []
+    for i in range(n):
+        cell = rng.choice(cells)
+        place(agent, cell, cell.x + rng.uniform(-0.5, 0.5), cell.y + rng.uniform(-0.5, 0.5))
+        direction = rng.uniform(0, agent.world.directions)
+        exact = agent.cast_ray(direction, max_distance)
+        read = agent.detect(direction, max_distance, method='field')
+        found.append(abs(exact[0] - read[0]))
+    return np.array(found)
+
+
+def reads_per_second(agent, cells, method, n=20000):
+    rng = random.Random(3)
+    queries = []
+    for i in range(200):
+        cell = rng.choice(cells)
+        queries.append((cell, cell.x + rng.uniform(-0.5, 0.5), cell.y + rng.uniform(-0.5, 0.5),
+                        rng.uniform(0, agent.world.directions)))
+    start = time.perf_counter()
+    for i in range(n // len(queries)):
+        for cell, x, y, direction in queries:
+            agent.__dict__['x'] = x
+            agent.__dict__['y'] = y
+            agent.detect(direction, max_distance, method=method)
+    return n / (time.perf_counter() - start)
+
+
+def main(size=64):
+    for directions in (4, 8):
+        world = make_world(size, directions)
+        agent = grid.ContinuousAgent()
+        world.add(agent, dir=0)
+        cells = [c for c in world.find_cells(lambda c: not c.wall)]
+        print('%dx%d maze, %d directions, max_distance %d' % (size, size, directions, max_distance))
+        for resolution, headings, dtype in configs:
+            rng = random.Random(0)
+            start = time.perf_counter()
+            field = grid.SensorField(world, max_distance, resolution, headings, dtype)
+            build = time.perf_counter() - start
+            e = errors(agent, cells, rng)
+            # integer tables also round to steps of field.unit
+            quantum = field.unit if field.dtype.kind in 'ui' else 0.0
+            bound = error_bound(resolution) + quantum
+            within = np.mean(e <= bound)
+            print('  res %d, %3d headings, %-7s %6.1f MB, build %5.2fs | error median %.3f '
+                  'p90 %.3f p99 %.3f, %.1f%% within %.3f' % (
+                      resolution, headings, np.dtype(dtype).name, field.table.nbytes / 1e6,
+                      build, np.median(e), np.percentile(e, 90), np.percentile(e, 99),
+                      within * 100, bound))
+
+            for i in range(5):
+                rng.choice(cells).wall = True
+            start = time.perf_counter()
+            agent.detect(0.0, max_distance, method='field')
+            update = time.perf_counter() - start
+            print('    5 walls added, updated in %.3fs' % update)
+            for cell in cells:
+                cell.wall = False
+            field.close()
+
+        field = grid.SensorField(world, max_distance, 4, 64)
+        print('  ray   %8.0f reads/s' % reads_per_second(agent, cells, 'ray'))
+        print('  field %8.0f reads/s' % reads_per_second(agent, cells, 'field'))
+        field.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
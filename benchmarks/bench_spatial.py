@@ -0,0 +1,94 @@
+"""Moves, removal and neighbourhood queries with many agents.
+
+Scatters ContinuousAgents over an open world and compares scanning every
+agent with a grid.SpatialHash for radius and k-nearest queries, checking
+both give the same answers.  Also times moves with and without the hash
+and removing every agent from the world.
+
+    python benchmarks/bench_spatial.py
+    python benchmarks/bench_spatial.py 10000
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+
+
+def make_world(n, size, spatial):
+    world = grid.World(grid.Cell, size, size, directions=8)
+    if spatial:
+        grid.SpatialHash(world, bucket_size=2.0)
+    rng = random.Random(0)
+    for i in range(n):
+        agent = grid.ContinuousAgent()
+        world.add(agent, x=rng.randrange(size), y=rng.randrange(size), dir=0)
+        agent.x += rng.uniform(-0.5, 0.5)
+        agent.y += rng.uniform(-0.5, 0.5)
+    return world
+
+
+def moves_per_second(world, steps=3):
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for i in range(steps):
+        for agent in world.agents:
+            agent.go_in_direction(rng.uniform(0, 8), distance=0.3)
+    return steps * len(world.agents) / (time.perf_counter() - start)
+
+
+def scan_within(world, x, y, radius):
+    return [a for a in world.agents
+            if (a.x - x) ** 2 + (a.y - y) ** 2 <= radius * radius]
+
+
+def scan_nearest(world, x, y, k):
+    return sorted(world.agents, key=lambda a: ((a.x - x) ** 2 + (a.y - y) ** 2, id(a)))[:k]
+
+
+def queries_per_second(query, queries):
+    start = time.perf_counter()
+    results = [query(*q) for q in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def main(n):
+    size = int((n / 0.25) ** 0.5)
+    print('%d agents in %dx%d' % (n, size, size))
+    plain = make_world(n, size, spatial=False)
+    hashed = make_world(n, size, spatial=True)
+    print('  moves/s, no hash     %10.0f' % moves_per_second(plain))
+    print('  moves/s, hash        %10.0f' % moves_per_second(hashed))
+
+    rng = random.Random(2)
+    points = [(rng.uniform(0, size), rng.uniform(0, size)) for i in range(200)]
+    spatial = hashed.spatial
+    for radius in (2.0, 5.0):
+        queries = [(x, y, radius) for x, y in points]
+        scanned, slow = queries_per_second(lambda x, y, r: scan_within(hashed, x, y, r), queries)
+        found, fast = queries_per_second(spatial.within, queries)
+        assert all(set(a) == set(b) for a, b in zip(scanned, found))
+        print('  within %.0f: scan %8.0f/s  hash %8.0f/s  (%.1f agents)' % (
+            radius, slow, fast, sum(map(len, found)) / float(len(found))))
+    for k in (1, 10):
+        queries = [(x, y, k) for x, y in points]
+        scanned, slow = queries_per_second(lambda x, y, k: scan_nearest(hashed, x, y, k), queries)
+        found, fast = queries_per_second(spatial.nearest, queries)
+        assert scanned == found
+        print('  nearest %-2d: scan %7.0f/s  hash %8.0f/s' % (k, slow, fast))
+
+    for name, world in (('no hash', plain), ('hash', hashed)):
+        agents = list(world.agents)
+        random.Random(3).shuffle(agents)
+        start = time.perf_counter()
+        for agent in agents:
+            world.remove(agent)
+        assert len(world.agents) == 0 and (world.spatial is None or len(world.spatial) == 0)
+        print('  remove all, %-8s %10.3fs' % (name, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
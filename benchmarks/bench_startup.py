@@ -0,0 +1,56 @@
+"""Startup time of the colour_critter model.
+
+Times importing the module, building the default model, building a
+Critter from scratch, and getting one from CritterBuilder's memory and
+disk caches (the latter in a fresh process, as a new run would).
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+
+def in_subprocess(code):
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, '-W', 'ignore', '-c', code], cwd=root)
+    return time.perf_counter() - start
+
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def main():
+    warnings.simplefilter('ignore')
+    cache_dir = tempfile.mkdtemp()
+    rows = [
+        ('python -c pass', in_subprocess('pass')),
+        ('import colour_critter', in_subprocess('import colour_critter')),
+        ('colour_critter.model', in_subprocess(
+            'import colour_critter; colour_critter.model')),
+    ]
+
+    import colour_critter
+    builder = colour_critter.CritterBuilder(cache_dir=cache_dir)
+    rows.append(('make_critter', timed(colour_critter.make_critter)))
+    rows.append(('builder, cold', timed(builder.build)))
+    rows.append(('builder, memory hit', timed(builder.build)))
+    rows.append(('builder, disk hit (new process)', in_subprocess(
+        'import colour_critter; colour_critter.CritterBuilder(%r).build()'
+        % cache_dir)))
+
+    for name, seconds in rows:
+        print('%-34s %8.3fs' % (name, seconds))
+
+
+if __name__ == '__main__':
+    main()
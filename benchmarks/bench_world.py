@@ -0,0 +1,78 @@
+"""Construction time, memory per cell and lookup cost of World storage.
+
+Compares the default list-of-Cell storage with storage='array' on random
+maps of increasing size.
+
+    python benchmarks/bench_world.py
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import grid  # noqa: E402
+from bench_detect import random_map  # noqa: E402
+
+
+class Cell(grid.Cell):
+    array_fields = grid.Cell.array_fields + (('cellcolor', np.uint8),)
+
+    def load(self, char):
+        self.cellcolor = 0
+        if char == '#':
+            self.wall = True
+        elif char == 'G':
+            self.cellcolor = 1
+
+
+def build(text, storage):
+    tracemalloc.start()
+    start = time.perf_counter()
+    world = grid.World(Cell, map=text, directions=8, storage=storage)
+    world.neighbour_index
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return world, elapsed, size
+
+
+def lookups_per_second(world, n=200000):
+    rng = random.Random(0)
+    points = [(rng.randrange(world.width), rng.randrange(world.height))
+              for i in range(n)]
+    g = world.grid
+    start = time.perf_counter()
+    for x, y in points:
+        g[y][x].wall
+    return n / (time.perf_counter() - start)
+
+
+def array_lookups_per_second(world, n=200000):
+    rng = np.random.RandomState(0)
+    xs = rng.randint(world.width, size=n)
+    ys = rng.randint(world.height, size=n)
+    walls = world.get_array('wall')
+    start = time.perf_counter()
+    walls[ys, xs]
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    print('%-10s %-6s %10s %12s %14s %14s' % (
+        'size', 'store', 'build s', 'bytes/cell', 'cell.wall/s', 'array/s'))
+    for n in (100, 300, 1000):
+        text = random_map(n)
+        for storage in ('list', 'array'):
+            world, elapsed, size = build(text, storage)
+            print('%-10s %-6s %10.3f %12.1f %14.0f %14.0f' % (
+                '%dx%d' % (n, n), storage, elapsed, size / float(n * n),
+                lookups_per_second(world), array_lookups_per_second(world)))
+
+
+if __name__ == '__main__':
+    main()
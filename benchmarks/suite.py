@@ -0,0 +1,432 @@
+"""Benchmark suite for the grid hot paths and the critter model.
+
+Every benchmark runs on maps generated by maze.generate with fixed seeds, so
+runs are comparable.  Each one is timed like timeit: calls are repeated
+until a batch takes at least --min-time, and the best of --repeat batches
+is kept.  Results are compared against a stored baseline, and the suite
+fails if any benchmark is slower than the baseline by more than
+--threshold (or the benchmark's own, for the noisier ones), after
+re-timing it --retries times with twice the repeats, once the rest have
+run, to rule out a busy machine.  Whole critter steps vary too much from
+run to run to be compared, so they are only reported:
+
+    python benchmarks/suite.py                    # compare with baseline.json
+    python benchmarks/suite.py -k detect          # only matching benchmarks
+    python benchmarks/suite.py --save-baseline    # record a new baseline
+    python benchmarks/suite.py -k critter --save-baseline  # just these
+    python benchmarks/suite.py --out results.json
+
+Baselines are only meaningful on the machine they were recorded on.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np  # noqa: E402
+
+import grid  # noqa: E402
+import maze  # noqa: E402
+import multiworld  # noqa: E402
+import raster  # noqa: E402
+import viewer  # noqa: E402
+from colour_critter import Cell  # noqa: E402
+
+here = os.path.dirname(os.path.abspath(__file__))
+default_baseline = os.path.join(here, 'baseline.json')
+
+map_sizes = (32, 128, 512)
+
+# name -> function returning the callable to time
+benchmarks = {}
+# name -> the repeat, min_time and threshold a benchmark needs instead of
+# the command line's, for ones noisier than the rest, and gate=False for
+# ones that are reported but never compared with or saved to the baseline
+options = {}
+
+
+def benchmark(name, **kwargs):
+    def register(f):
+        benchmarks[name] = f
+        options[name] = kwargs
+        return f
+    return register
+
+
+_fixtures = {}
+
+
+def fixture_map(size, method='prim', directions=4):
+    """A generated ASCII maze with colour tiles, the same on every run."""
+    key = (size, method, directions)
+    if key not in _fixtures:
+        _fixtures[key] = maze.to_text(maze.generate(
+            size, size, method, directions, seed=size, colour_density=0.05))
+    return _fixtures[key]
+
+
+def open_cells(world, n, seed=0):
+    rng = random.Random(seed)
+    cells = [c for c in world.find_cells(lambda c: not c.wall)]
+    return [rng.choice(cells) for i in range(n)]
+
+
+def add_world_benchmarks(size):
+    for storage in ('list', 'array'):
+        if storage == 'list' and size > 128:
+            continue
+
+        @benchmark('World(map) %s %d' % (storage, size))
+        def construct(storage=storage):
+            text = fixture_map(size)
+            return lambda: grid.World(Cell, map=text, directions=4, storage=storage)
+
+        @benchmark('World.save %s %d' % (storage, size))
+        def save(storage=storage):
+            world = grid.World(Cell, map=fixture_map(size), directions=4, storage=storage)
+            return world.save
+
+        @benchmark('World.load %s %d' % (storage, size))
+        def load(storage=storage):
+            text = fixture_map(size)
+            world = grid.World(Cell, map=text, directions=4, storage=storage)
+            return lambda: world.load(map=text)
+
+        @benchmark('Cell.neighbours %s %d' % (storage, size))
+        def neighbours(storage=storage):
+            world = grid.World(Cell, map=fixture_map(size), directions=8, storage=storage)
+            cells = open_cells(world, 100)
+
+            def resolve():
+                for cell in cells:
+                    for name in grid.neighbour_synonyms:
+                        cell.__dict__.pop(name, None)
+                    cell.neighbours
+            return resolve
+
+    @benchmark('SVGRenderer full %d' % size)
+    def render_full():
+        world = grid.World(Cell, map=fixture_map(size), directions=4, storage='array')
+        return grid.SVGRenderer(world, incremental=False).render
+
+    @benchmark('SVGRenderer incremental %d' % size)
+    def render_incremental():
+        world = grid.World(Cell, map=fixture_map(size), directions=4, storage='array')
+        agent = grid.ContinuousAgent()
+        world.add(agent, cell=open_cells(world, 1)[0], dir=0)
+        renderer = grid.SVGRenderer(world)
+        cells = open_cells(world, 64, seed=1)
+        state = {'i': 0}
+
+        def frame():
+            # one agent moves and one cell changes colour per frame
+            i = state['i'] = state['i'] + 1
+            agent.dir = i % 4
+            cell = cells[i % len(cells)]
+            cell.cellcolor = (cell.cellcolor + 1) % 6
+            return renderer.render()
+        return frame
+
+    # at 512 the frame is 3 MB, so this is timing the memory bus, which
+    # varies from run to run by more than the usual threshold; losing the
+    # incremental update would still cost several times over
+    @benchmark('Rasteriser incremental %d' % size, threshold=1.0 if size >= 512 else 0)
+    def raster_incremental():
+        world = grid.World(Cell, map=fixture_map(size), directions=4, storage='array')
+        agent = grid.ContinuousAgent()
+        world.add(agent, cell=open_cells(world, 1)[0], dir=0)
+        rasteriser = raster.Rasteriser(world, scale=2)
+        cells = open_cells(world, 64, seed=1)
+        out = np.empty((rasteriser.height, rasteriser.width, 3), dtype=np.uint8)
+        state = {'i': 0}
+
+        def frame():
+            i = state['i'] = state['i'] + 1
+            agent.dir = i % 4
+            cell = cells[i % len(cells)]
+            cell.cellcolor = (cell.cellcolor + 1) % 6
+            return rasteriser.render(out)
+        return frame
+
+    @benchmark('WorldStream capture and delta %d' % size)
+    def stream_delta():
+        world = grid.World(Cell, map=fixture_map(size), directions=4, storage='array')
+        agent = grid.ContinuousAgent()
+        world.add(agent, cell=open_cells(world, 1)[0], dir=0)
+        stream = viewer.WorldStream(world)
+        cells = open_cells(world, 64, seed=1)
+        state = {'i': 0}
+
+        def frame():
+            # the simulation's capture, then the server's frame for a client
+            # one version behind
+            i = state['i'] = state['i'] + 1
+            agent.dir = i % 4
+            cell = cells[i % len(cells)]
+            cell.cellcolor = (cell.cellcolor + 1) % 6
+            stream.capture()
+            return stream.frame(stream.version - 1)
+        return frame
+
+
+for size in map_sizes:
+    add_world_benchmarks(size)
+
+
+def add_detect_benchmark(max_distance):
+    @benchmark('ContinuousAgent.detect max_distance=%d' % max_distance)
+    def detect():
+        world = grid.World(Cell, map=fixture_map(128), directions=4, storage='array')
+        agent = grid.ContinuousAgent()
+        world.add(agent, cell=open_cells(world, 1)[0], dir=0)
+        directions = [4.0 * i / 64 for i in range(64)]
+
+        def cast():
+            for d in directions:
+                agent.detect(d, max_distance=max_distance)
+        return cast
+
+
+for max_distance in (2, 8, 32):
+    add_detect_benchmark(max_distance)
+
+
+@benchmark('ContinuousAgent.detect field max_distance=4')
+def detect_field():
+    world = grid.World(Cell, map=fixture_map(128), directions=4, storage='array')
+    agent = grid.ContinuousAgent()
+    world.add(agent, cell=open_cells(world, 1)[0], dir=0)
+    grid.SensorField(world, max_distance=4)
+    directions = [4.0 * i / 64 for i in range(64)]
+
+    def read():
+        for d in directions:
+            agent.detect(d, max_distance=4, method='field')
+    return read
+
+
+@benchmark('ContinuousAgent.go_in_direction')
+def go_in_direction():
+    world = grid.World(Cell, 16, 16, directions=4)
+    agent = grid.ContinuousAgent()
+    world.add(agent, x=8, y=8, dir=0)
+
+    def step():
+        # to and fro across a cell boundary
+        agent.go_in_direction(0.5, distance=0.3)
+        agent.go_in_direction(2.5, distance=0.3)
+    return step
+
+
+@benchmark('WorldHost.step 100 worlds')
+def host_step():
+    worlds = []
+    for i in range(100):
+        world = grid.World(Cell, map=fixture_map(32), directions=4, storage='array')
+        world.add(grid.ContinuousAgent(), cell=open_cells(world, 1, seed=i)[0], dir=i % 4)
+        worlds.append(world)
+    host = multiworld.WorldHost(worlds)
+    commands = np.random.RandomState(0).uniform(-1, 1, (100, 3))
+    commands[:, 2] = 1
+    return lambda: host.step(commands)
+
+
+def add_critter_benchmark(name, **kwargs):
+    # a nengo step varies by more from run to run than the differences
+    # between these, so they are timed for longer and only reported; the
+    # node benchmarks below are what is gated
+    @benchmark(name, repeat=9, min_time=0.5, gate=False)
+    def critter_step():
+        import colour_critter
+        critter = colour_critter.make_critter(**kwargs)
+        sim = critter.sim
+        sim.run(0.01, progress_bar=False)
+        return sim.step
+
+
+add_critter_benchmark('critter Simulator.step', render=True)
+# without the GridNode, to compare like with like against the bridge
+add_critter_benchmark('critter Simulator.step separate')
+add_critter_benchmark('critter Simulator.step bridge', bridge=True)
+add_critter_benchmark('critter Simulator.step bridge every=10', bridge=10)
+
+
+def critter_body():
+    import colour_critter
+    world = colour_critter.make_world()
+    body = grid.ContinuousAgent()
+    world.add(body, x=1, y=2, dir=2)
+    return world, body
+
+
+# the neurons dominate a critter step, so what the bridge saves is timed
+# on the node functions alone: one tick of the critter's environment
+@benchmark('critter nodes separate', repeat=9, min_time=0.5, threshold=0.5)
+def nodes_separate():
+    import colour_critter
+    world, body = critter_body()
+    movement = colour_critter.Movement(body)
+    radar = colour_critter.Radar(world, body)
+    colour = colour_critter.CurrentColour(body)
+    command = np.array([0.3, 0.1, 1.0])
+
+    def tick():
+        movement(0.0, command)
+        radar(0.0)
+        colour(0.0)
+    return tick
+
+
+def add_bridge_nodes_benchmark(every):
+    @benchmark('critter nodes bridge every=%d' % every, repeat=9, min_time=0.5, threshold=0.5)
+    def nodes_bridge():
+        world, body = critter_body()
+        output = grid.BridgeOutput(world, body, every=every)
+        command = np.array([0.3, 0.1, 1.0])
+        return lambda: output(0.0, command)
+
+
+for every in (1, 10):
+    add_bridge_nodes_benchmark(every)
+
+
+def _time_batch(f, n):
+    # like timeit, without the garbage collector going off mid-batch
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for i in range(n):
+            f()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def time_benchmark(make, repeat=7, min_time=0.1):
+    """Best seconds per call over repeat batches of at least min_time."""
+    f = make()
+    f()
+    n = 1
+    while True:
+        elapsed = _time_batch(f, n)
+        if elapsed >= min_time:
+            break
+        n *= 2 if elapsed == 0 else max(2, int(min_time / elapsed * 1.2))
+    best = elapsed / n
+    for r in range(repeat - 1):
+        best = min(best, _time_batch(f, n) / n)
+    return best
+
+
+def machine():
+    return dict(python=platform.python_version(), machine=platform.machine(),
+                processor=platform.processor(), system=platform.system())
+
+
+def gated(name):
+    return options.get(name, {}).get('gate', True)
+
+
+def settings(name, repeat, min_time, threshold):
+    """(repeat, min_time, threshold) for a benchmark, the given ones by default."""
+    own = options.get(name, {})
+    return (max(repeat, own.get('repeat', 0)), max(min_time, own.get('min_time', 0)),
+            max(threshold, own.get('threshold', 0)))
+
+
+def run(names, repeat, min_time):
+    results = {}
+    for name in names:
+        n, seconds = settings(name, repeat, min_time, 0)[:2]
+        results[name] = time_benchmark(benchmarks[name], n, seconds)
+        yield name, results[name]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='filter', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fail when slower than the baseline by this fraction')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.1)
+    parser.add_argument('--retries', type=int, default=2,
+                        help='times to re-run the benchmarks that look slower, '
+                             'after the rest, keeping their best time')
+    parser.add_argument('--out', help='also write the results here as JSON')
+    args = parser.parse_args(args)
+    warnings.simplefilter('ignore')
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    baseline = dict((name, seconds) for name, seconds in baseline.items() if gated(name))
+
+    names = [name for name in benchmarks if args.filter in name]
+    results = dict(run(names, args.repeat, args.min_time))
+
+    def slower(name):
+        threshold = settings(name, args.repeat, args.min_time, args.threshold)[2]
+        return name in baseline and results[name] > baseline[name] * (1 + threshold)
+
+    if not args.save_baseline:
+        # a real regression stays slow; a busy machine rarely does, so the
+        # slow ones are timed again, for longer, once the rest have run,
+        # keeping the best
+        for retry in range(args.retries):
+            slow = [name for name in names if slower(name)]
+            for name, seconds in run(slow, 2 * args.repeat, args.min_time):
+                results[name] = min(results[name], seconds)
+
+    regressions = []
+    print('%-45s %12s %12s %8s' % ('benchmark', 'us/call', 'baseline', 'ratio'))
+    for name in names:
+        seconds = results[name]
+        line = '%-45s %12.1f' % (name, seconds * 1e6)
+        if not gated(name):
+            line += ' %12s' % '(not gated)'
+        elif name in baseline and not args.save_baseline:
+            threshold = settings(name, args.repeat, args.min_time, args.threshold)[2]
+            ratio = seconds / baseline[name]
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  SLOWER'
+                regressions.append(name)
+            elif ratio < 1 - threshold:
+                flag = '  faster'
+            line += ' %12.1f %7.2fx%s' % (baseline[name] * 1e6, ratio, flag)
+        print(line)
+
+    record = dict(machine=machine(), time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  results=results)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(record, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        # benchmarks that were not run keep their old baseline
+        baseline.update((name, seconds) for name, seconds in results.items() if gated(name))
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(record, results=baseline), f, indent=2, sort_keys=True)
+        print('saved baseline to %s' % args.baseline)
+    elif regressions:
+        print('%d benchmarks slower than the baseline by more than %d%%' % (
+            len(regressions), args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
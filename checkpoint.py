@@ -0,0 +1,318 @@
+"""Checkpoint and resume a World, its agents and a nengo Simulator.
+
+A checkpoint is one .npz file holding:
+
+- the cell fields listed in Cell.array_fields, as World.save_binary writes
+  them
+- every agent's class, x, y, dir and cell, in world.agents order
+- the world's age and the state of the random and numpy.random generators
+- optionally the simulator: its time, the value of every signal it writes
+  and what its probes have recorded so far
+- the state of any node output with checkpoint_state() and
+  restore_state() methods, such as grid.BridgeOutput and
+  colour_critter.Tracker
+
+    checkpoint.save('run.npz', world, sim)
+    ...
+    checkpoint.restore('run.npz', world, sim)
+
+restore() needs a world of the same size and, for the simulator, the one
+that was saved or a copy of it, such as a CritterBuilder build with the
+same parameters.  nengo's optimiser merges signals differently every time
+a model is built, so a simulator built again from scratch only matches if
+both were built with optimize=False.
+Agents are updated in place, or created from their saved class when the
+world has none.  Random processes, such as noise, keep their own
+generators inside nengo and are not restored.
+
+What probes have recorded is only reachable through the Simulator's
+private _sim_data and _probe_step_time, as they are in nengo 4.1 (see
+requirements.txt); a Simulator without them is refused with a
+CheckpointError rather than saved or restored in part.
+
+run() runs a simulator in chunks, saving a checkpoint every so many seconds
+of simulated time:
+
+    checkpoint.run(sim, 3600.0, world, 'run.npz', every=60.0)
+"""
+import hashlib
+import importlib
+import json
+import os
+import random
+
+import numpy as np
+
+version = 1
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def class_name(cls):
+    """'module:qualname' of a class, as load_class takes."""
+    return '%s:%s' % (cls.__module__, cls.__qualname__)
+
+
+def load_class(name):
+    """The class named by class_name."""
+    module, qualname = name.split(':')
+    owner = importlib.import_module(module)
+    for part in qualname.split('.'):
+        owner = getattr(owner, part)
+    return owner
+
+
+def _state_nodes(sim):
+    """The outputs of sim's nodes that can save their own state, in order."""
+    network = sim.model.toplevel
+    if network is None:
+        return []
+    return [node.output for node in network.all_nodes
+            if hasattr(node.output, 'checkpoint_state')]
+
+
+def _check_internals(sim):
+    for name in ('_sim_data', '_probe_step_time'):
+        if not hasattr(sim, name):
+            raise CheckpointError('the simulator has no %s, which checkpoints need; they '
+                                  'were written for nengo 4.1' % name)
+
+
+def _signals(sim):
+    # The base signals the simulator writes, which views share, in the
+    # order of the model's operators.  sim.signals itself is filled in an
+    # order that changes from one Simulator to the next.
+    signals = []
+    seen = set()
+    for op in sim.model.operators:
+        for signal in op.all_signals:
+            base = signal.base
+            if base not in seen and not base.readonly:
+                seen.add(base)
+                signals.append((base, sim.signals[base]))
+    return signals
+
+
+def _signature(signals):
+    h = hashlib.sha1()
+    for signal, value in signals:
+        # unnamed signals are named by their id, so only shapes are compared
+        h.update(('%s %s\n' % (value.dtype, value.shape)).encode())
+    return h.hexdigest()
+
+
+def world_state(world):
+    """The world's cells and agents as a dict of arrays and metadata."""
+    arrays = {}
+    for name, dtype in world.Cell.array_fields:
+        arrays['cells/' + name] = np.asarray(world.get_array(name), dtype=dtype)
+    agents = world.agents
+    arrays['agents/x'] = np.array([a.x for a in agents], dtype=float)
+    arrays['agents/y'] = np.array([a.y for a in agents], dtype=float)
+    arrays['agents/dir'] = np.array([a.dir for a in agents], dtype=float)
+    arrays['agents/cell'] = np.array([a.cell.y * world.width + a.cell.x for a in agents],
+                                     dtype=np.int64)
+    meta = dict(width=world.width, height=world.height, directions=world.directions,
+                age=world.age, agents=[class_name(type(a)) for a in agents])
+    return arrays, meta
+
+
+def random_state():
+    arrays = {}
+    py_version, py_state, gauss = random.getstate()
+    arrays['random/python'] = np.array(py_state, dtype=np.uint32)
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    arrays['random/numpy'] = keys
+    meta = dict(python=[py_version, gauss],
+                numpy=[name, int(pos), int(has_gauss), float(cached)])
+    return arrays, meta
+
+
+def sim_state(sim, probes=True):
+    _check_internals(sim)
+    arrays = {}
+    signals = _signals(sim)
+    for i, (signal, value) in enumerate(signals):
+        arrays['signals/%d' % i] = value
+    if probes:
+        for i, probe in enumerate(sim.model.probes):
+            data = sim._sim_data[probe]
+            if len(data):
+                arrays['probes/%d' % i] = np.asarray(data)
+    nodes = []
+    for i, output in enumerate(_state_nodes(sim)):
+        state = output.checkpoint_state()
+        for key, value in state.items():
+            arrays['nodes/%d/%s' % (i, key)] = np.asarray(value)
+        nodes.append(sorted(state))
+    meta = dict(n_steps=sim.n_steps, time=sim.time, dt=sim.dt, seed=sim.seed,
+                signals=len(signals), signature=_signature(signals),
+                probes=len(sim.model.probes) if probes else None, nodes=nodes)
+    return arrays, meta
+
+
+def save(filename, world=None, sim=None, probes=True, compressed=False):
+    """
+    Write a checkpoint of world and sim, either of which may be None.
+    :param probes: also save what sim's probes have recorded so far
+    :param compressed: compress the file, which is slower to write
+    """
+    arrays = {}
+    meta = dict(version=version)
+    if world is not None:
+        a, meta['world'] = world_state(world)
+        arrays.update(a)
+    a, meta['random'] = random_state()
+    arrays.update(a)
+    if sim is not None:
+        a, meta['sim'] = sim_state(sim, probes)
+        arrays.update(a)
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    # written to the side and moved into place, so an interrupted save
+    # leaves the previous checkpoint intact
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        if compressed:
+            np.savez_compressed(f, **arrays)
+        else:
+            np.savez(f, **arrays)
+    os.replace(tmp, filename)
+
+
+def restore(filename, world=None, sim=None, probes=True):
+    """
+    Restore world, sim and the random generators from a checkpoint.
+    :return: the checkpoint's metadata
+    :rtype: dict
+    """
+    with np.load(filename) as data:
+        data = dict(data.items())
+    meta = json.loads(str(data['meta']))
+    if meta.get('version') != version:
+        raise CheckpointError('%s is checkpoint version %r, not %d' % (
+            filename, meta.get('version'), version))
+    if world is not None and 'world' not in meta:
+        raise CheckpointError('%s has no world' % filename)
+    if sim is not None and 'sim' not in meta:
+        raise CheckpointError('%s has no simulator' % filename)
+    # everything is checked before anything is changed
+    if sim is not None:
+        check_sim(sim, meta['sim'])
+    if world is not None:
+        check_world(world, meta['world'])
+    if sim is not None:
+        restore_sim(sim, data, meta['sim'], probes)
+    if world is not None:
+        restore_world(world, data, meta['world'])
+    restore_random(data, meta['random'])
+    return meta
+
+
+def check_world(world, meta):
+    """Raise CheckpointError unless the checkpointed world fits world."""
+    if (meta['width'], meta['height']) != (world.width, world.height):
+        raise CheckpointError('checkpoint is %dx%d, the world %dx%d' % (
+            meta['width'], meta['height'], world.width, world.height))
+    agents = list(world.agents)
+    if not agents:
+        for name in meta['agents']:
+            try:
+                load_class(name)
+            except (ImportError, AttributeError):
+                raise CheckpointError('cannot find the agent class %s' % name)
+    elif [class_name(type(a)) for a in agents] != meta['agents']:
+        raise CheckpointError('the world has different agents to the checkpoint')
+
+
+def restore_world(world, data, meta):
+    check_world(world, meta)
+    world.set_arrays(dict((name[6:], a) for name, a in data.items()
+                          if name.startswith('cells/')))
+    world.age = meta['age']
+
+    agents = list(world.agents)
+    if not agents:
+        for name in meta['agents']:
+            agent = load_class(name)()
+            world.add(agent, x=0, y=0, dir=0)
+            agents.append(agent)
+    xs = data['agents/x'].tolist()
+    ys = data['agents/y'].tolist()
+    dirs = data['agents/dir'].tolist()
+    cells = data['agents/cell'].tolist()
+    for agent, x, y, dir, cell in zip(agents, xs, ys, dirs, cells):
+        agent.cell = world.get_cell_at_index(cell)
+        agent.x = x
+        agent.y = y
+        agent.dir = dir
+
+
+def restore_random(data, meta):
+    py_version, gauss = meta['python']
+    random.setstate((py_version, tuple(data['random/python'].tolist()), gauss))
+    name, pos, has_gauss, cached = meta['numpy']
+    np.random.set_state((name, data['random/numpy'], pos, has_gauss, cached))
+
+
+def check_sim(sim, meta):
+    """
+    Raise CheckpointError unless sim was built from the checkpointed model.
+    :return: sim's signals and stateful node outputs
+    """
+    _check_internals(sim)
+    signals = _signals(sim)
+    if _signature(signals) != meta['signature'] or sim.dt != meta['dt']:
+        # nengo's optimiser merges signals differently every build
+        raise CheckpointError('the simulator was not built from the checkpointed model; '
+                              'restore into the same simulator, a copy of it (see '
+                              'colour_critter.CritterBuilder) or one built with '
+                              'optimize=False')
+    outputs = _state_nodes(sim)
+    if len(outputs) != len(meta['nodes']):
+        raise CheckpointError('the simulator has different stateful nodes to the checkpoint')
+    return signals, outputs
+
+
+def restore_sim(sim, data, meta, probes=True):
+    signals, outputs = check_sim(sim, meta)
+    for i, (signal, value) in enumerate(signals):
+        value[...] = data['signals/%d' % i]
+    sim._probe_step_time()
+
+    if probes and meta['probes'] is not None:
+        for i, probe in enumerate(sim.model.probes):
+            recorded = sim._sim_data[probe]
+            del recorded[:]
+            if 'probes/%d' % i in data:
+                recorded.extend(data['probes/%d' % i])
+
+    for i, (output, keys) in enumerate(zip(outputs, meta['nodes'])):
+        output.restore_state(dict((key, data['nodes/%d/%s' % (i, key)]) for key in keys))
+
+
+def run(sim, duration, world=None, filename=None, every=None, resume=True, probes=True):
+    """
+    Run sim for duration seconds of simulated time in total, saving a
+    checkpoint to filename every this many seconds and at the end.
+    :param resume: if filename exists, restore it first and only run the
+        time that is left
+    :return: whether it resumed from a checkpoint
+    :rtype: bool
+    """
+    resumed = False
+    if filename is not None and resume and os.path.exists(filename):
+        restore(filename, world, sim, probes)
+        resumed = True
+    steps = int(round(duration / sim.dt)) - sim.n_steps
+    chunk = steps if not every else max(1, int(round(every / sim.dt)))
+    while steps > 0:
+        n = min(chunk, steps)
+        sim.run_steps(n, progress_bar=False)
+        steps -= n
+        if filename is not None:
+            save(filename, world, sim, probes)
+    return resumed
+
@@ -1,10 +1,23 @@
+import hashlib
 import math
+import os
+import pickle
+import random
 
 import nengo
 import nengo.spa as spa
 import numpy as np
 
 import grid
+import multiworld
+import profiling
+import raster
+import recording
+
+try:
+    import cloudpickle
+except ImportError:
+    cloudpickle = None
 
 MAX_COLOURS = 3  # change if you want to detect more or less colours
 
@@ -18,22 +31,27 @@ mymap = """
 """
 
 
+# The colours a cell can have: cellcolor i (from 1; 0 is no colour) is
+# palette[i - 1], its map character, semantic pointer and display colour.
+PALETTE = (
+    ('G', 'GREEN', 'green'),
+    ('R', 'RED', 'red'),
+    ('B', 'BLUE', 'blue'),
+    ('M', 'MAGENTA', 'magenta'),
+    ('Y', 'YELLOW', 'yellow'),
+)
+
+
 class Cell(grid.Cell):
+    array_fields = grid.Cell.array_fields + (('cellcolor', np.uint8),)
+    palette = PALETTE
 
     def color(self):
         if self.wall:
             return 'black'
-        elif self.cellcolor == 1:
-            return 'green'
-        elif self.cellcolor == 2:
-            return 'red'
-        elif self.cellcolor == 3:
-            return 'blue'
-        elif self.cellcolor == 4:
-            return 'magenta'
-        elif self.cellcolor == 5:
-            return 'yellow'
-
+        c = self.cellcolor
+        if 0 < c <= len(self.palette):
+            return self.palette[c - 1][2]
         return None
 
     def load(self, char):
@@ -41,181 +59,730 @@ class Cell(grid.Cell):
         if char == '#':
             self.wall = True
 
-        if char == 'G':
-            self.cellcolor = 1
-        elif char == 'R':
-            self.cellcolor = 2
-        elif char == 'B':
-            self.cellcolor = 3
-        elif char == 'M':
-            self.cellcolor = 4
-        elif char == 'Y':
-            self.cellcolor = 5
+        for i, colour in enumerate(self.palette):
+            if char == colour[0]:
+                self.cellcolor = i + 1
+                break
 
+    def save(self):
+        if self.wall:
+            return '#'
+        c = getattr(self, 'cellcolor', 0)
+        return self.palette[c - 1][0] if c else ' '
 
-world = grid.World(Cell, map=mymap, directions=4)
 
-body = grid.ContinuousAgent()
-world.add(body, x=1, y=2, dir=2)
+def make_world(map=mymap, directions=4, storage='list'):
+    """
+    Builds the maze the critter explores.
+    :param map: ASCII map, see Cell.load for the characters
+    :type map: str
+    :return: the world
+    :rtype: grid.World
+    """
+    return grid.World(Cell, map=map, directions=directions, storage=storage)
+
 
+# The node and connection functions below are classes and module-level
+# functions rather than closures so that a built model can be pickled (see
+# CritterBuilder).  profiling times the classes by patching them while it
+# is enabled; nengo keeps the functions themselves, so they are
+# instrumented up front.
 
-def move(t, x):
+class Movement(object):
     """
     This function calculates the rotation speed and moving speed of the agent.
-    :param x: State Input
-    :type x: float
     """
-    speed, rotation, run_stop = x
-    dt = 0.001
-    max_speed = 10.0
-    max_rotate = 10.0
-    body.turn(rotation * dt * max_rotate * run_stop)
-    body.go_forward(speed * dt * max_speed * run_stop)
+
+    def __init__(self, body, dt=0.001, max_speed=10.0, max_rotate=10.0):
+        self.body = body
+        self.dt = dt
+        self.max_speed = max_speed
+        self.max_rotate = max_rotate
+
+    def __call__(self, t, x):
+        """
+        :param x: State Input
+        :type x: float
+        """
+        speed, rotation, run_stop = x
+        self.body.turn(rotation * self.dt * self.max_rotate * run_stop)
+        self.body.go_forward(speed * self.dt * self.max_speed * run_stop)
 
 
-# Your model might not be a nengo.Netowrk() - SPA is permitted:q
-model = spa.SPA()
-with model:
+class Radar(object):
+    """
+    This function calculates the distance of the agent from the walls in all three direction
+    left, right and forward
+    """
 
-    env = grid.GridNode(world, dt=0.005)
-    movement = nengo.Node(move, size_in=3)
+    def __init__(self, world, body, max_distance=4):
+        self.world = world
+        self.body = body
+        self.max_distance = max_distance
 
-    def detect(t):
+    def __call__(self, t):
         """
-        This function calculates the distance of the agent from the walls in all three direction
-        left, right and forward
         :return: sensory information about the distance from walls
         :rtype: list
         """
-        angles = (np.linspace(-0.5, 0.5, 3) + body.dir) % world.directions
-        return [body.detect(d, max_distance=4)[0] for d in angles]
+        angles = (np.linspace(-0.5, 0.5, 3) + self.body.dir) % self.world.directions
+        return [self.body.detect(d, max_distance=self.max_distance)[0] for d in angles]
 
-    def movement_func(x):
-        # x[0] = senosor in the left --> np "first black square to the critter
-        # x[1] = sensory in the front.
-        # the closer the wall is the slower it goes.
-        turn = x[2] - x[0]
-        spd = x[1] - 0.5
-        return spd, turn
 
-    stim_radar = nengo.Node(detect)
-    radar = nengo.Ensemble(n_neurons=500, dimensions=3, radius=4)
+@profiling.instrument('movement_func')
+def movement_func(x):
+    # x[0] = senosor in the left --> np "first black square to the critter
+    # x[1] = sensory in the front.
+    # the closer the wall is the slower it goes.
+    turn = x[2] - x[0]
+    spd = x[1] - 0.5
+    return spd, turn
 
-    nengo.Connection(stim_radar, radar)
-    nengo.Connection(radar, movement[:2], function=movement_func)
 
-    # This node returns the colour of the cell currently occupied. Note that you might want to transform this into
-    # something else (see the assignment)
-    current_color = nengo.Node(lambda t: body.cell.cellcolor)
+class CurrentColour(object):
+    """
+    This node returns the colour of the cell currently occupied.
+    """
 
-    # Variables used in the code
-    D = 32
-    n_neurons = 1000
+    def __init__(self, body):
+        self.body = body
 
-    # The list of colours available in the environment/maze
-    color_list = ["GREEN", "RED", "YELLOW", "MAGENTA", "BLUE"]
-    colour_vocab = spa.Vocabulary(D)
-    colour_vocab.parse("+".join(color_list))
-    colour_vocab.parse("WHITE")
+    def __call__(self, t):
+        return self.body.cell.cellcolor
 
-    colour_state_vocab = spa.Vocabulary(D)
-    colour_state_vocab.parse("YES+NO")  # this is what freddy helped us with
 
-    # make the list of colours / adding all the colour states
-    for color in color_list:
-        exec(f"model.{color.lower()} = spa.State(D, vocab=colour_state_vocab)")
+class ColourConverter(object):
+    """
+    This function converts the integral value into the corresponding semantic pointer representing the colour.
+    The pointers are looked up in a read-only matrix whose row i is the
+    pointer of cellcolor i, so a step neither searches nor allocates.
+    """
 
+    def __init__(self, vocab, colours):
+        """
+        :param vocab: vocabulary holding WHITE and the colours
+        :param colours: pointer names of cellcolor 1, 2, ...
+        :type colours: list
+        """
+        table = np.array([vocab[name].v for name in ('WHITE',) + tuple(colours)])
+        table.flags.writeable = False
+        self.table = table
+        self.rows = list(table)
 
-    # the colour detection. convert numbers into a spa vector (?)
-    def convert(x):
+    def __call__(self, x):
         """
-        This function converts the integral value into the corresponding semantic pointer representing the colour
         :param x: State input
         :type x: float
-        :return: Semantic pointer
+        :return: Semantic pointer, WHITE for anything but a colour
         :rtype: Vector
         """
-        if x == 1:
-            return colour_vocab['GREEN'].v.reshape(D)
-        elif x == 2:
-            return colour_vocab['RED'].v.reshape(D)
-        elif x == 3:
-            return colour_vocab['BLUE'].v.reshape(D)
-        elif x == 4:
-            return colour_vocab['MAGENTA'].v.reshape(D)
-        elif x == 5:
-            return colour_vocab['YELLOW'].v.reshape(D)
-        else:
-            return colour_vocab['WHITE'].v.reshape(D)
-
-
-    # model.clean = memory clean up to stabalize
-    # and all the connections
-    for color in color_list:
-        exec(f"model.clean_{color.lower()} = spa.AssociativeMemory(colour_state_vocab, wta_output=True, threshold=0.3)")
-        exec(f"nengo.Connection(model.{color.lower()}.output, model.clean_{color.lower()}.input, synapse=0.01)")
-        exec(f"nengo.Connection(model.clean_{color.lower()}.output, model.{color.lower()}.output, synapse=0.01)")
+        i = int(x[0])
+        if i != x[0] or not 0 < i < len(self.rows):
+            i = 0
+        return self.rows[i]
 
-    model.converter = spa.State(D, vocab=colour_vocab)
-    nengo.Connection(current_color, model.converter.input, function=convert)
 
-    # if a colour is detected, then output YES for that colour
-    actions = spa.Actions(
-        'dot(converter, GREEN) --> green=YES',
-        'dot(converter, RED) --> red=YES',
-        'dot(converter, BLUE) --> blue=YES',
-        'dot(converter, MAGENTA) --> magenta=YES',
-        'dot(converter, YELLOW) --> yellow=YES',
-        '0.5 --> '
-    )
-    model.bg = spa.BasalGanglia(actions)
-    model.thalamus = spa.Thalamus(model.bg)
+class SpaToNengo(object):
+    """
+    Converting spa input into float value for the nengo Ensemble
+    """
 
+    def __init__(self, vocab):
+        self.yes = vocab["YES"].v.copy()
+        self.yes.flags.writeable = False
+        self.on = np.ones(1)
+        self.off = np.zeros(1)
+        self.on.flags.writeable = self.off.flags.writeable = False
 
-    def spa_to_nengo(x):
+    def __call__(self, x):
         """
-        Converting spa input into float value for the nengo Ensemble
         :param x: State Input
         :type x: float
         :return: 1 or 0 based on if the colour state is activated
         :rtype: list
         """
-        return [1.] if colour_vocab["YES"].dot(x) else [0.]
-
-    # Ensemble that counts the number of coloured tiles agent has seen.
-    model.counter = nengo.Ensemble(1000, 1, radius=5)
+        return self.on if np.dot(self.yes, x) else self.off
 
-    # Thijs Gelton helped us with the implementation of this part.
-    for colour in color_list:
-        exec(f"model.clean_{colour.lower()}.output.output = lambda t, x:x")
-        exec(f"nengo.Connection(model.clean_{colour.lower()}.output, model.counter, function=spa_to_nengo)")
 
-    model.stop = nengo.Ensemble(n_neurons, 1)
-    inhib = nengo.Node(size_in=1)
+class Inhibit(object):
+    """
+    This function triggers the inhib node which in turns set the value
+    of the stop neurons to exact 0 (i.e They are inhibited)
+    """
 
+    def __init__(self, max_colours):
+        self.max_colours = max_colours
 
-    def inhibit(x):
-        """
-        This function triggers the inhib node which in turns set the value
-        of the stop neurons to exact 0 (i.e They are inhibited)
-        """
-        if math.isclose(x[0], MAX_COLOURS):
+    def __call__(self, x):
+        if math.isclose(x[0], self.max_colours):
             return [1.]
-        elif x[0] > MAX_COLOURS:
+        elif x[0] > self.max_colours:
             # This is just in case we have colours in sequential pattern
             return [1.]
         else:
             return [0.]
 
 
-    # Provides input to the inhibit node to stop neuron activity when the agent has crossed the threshold
-    nengo.Connection(model.counter, inhib, function=inhibit)
+class ReferenceCounter(object):
+    """
+    Counts colours with a grid.ColourTracker rather than neurons: outputs
+    the number of distinct colours the critter has stood on, and 1 until
+    that reaches max_colours, then 0.
+    """
+
+    def __init__(self, tracker, max_colours):
+        self.tracker = tracker
+        self.max_colours = max_colours
+        self.output = np.array([0., 1.])
+
+    def __call__(self, t):
+        self.tracker(t)
+        count = self.tracker.counts[0]
+        self.output[0] = count
+        self.output[1] = count < self.max_colours
+        return self.output
+
+    def checkpoint_state(self):
+        return self.tracker.checkpoint_state()
+
+    def restore_state(self, state):
+        self.tracker.restore_state(state)
+
+
+@profiling.instrument('run_while_counting')
+def run_while_counting(x):
+    return x / x
+
+
+@profiling.instrument('passthrough')
+def passthrough(t, x):
+    return x
+
+
+def build_navigation(model, world, body, render=True, bridge=False, radar_neurons=500,
+                     port=None):
+    """
+    Adds the radar and movement to model: the critter wanders the maze,
+    slowing down and turning away as walls get close.  movement[2] is left
+    unconnected; it scales the movement (1 to run, 0 to stop).
+    :param render: also add the GridNode showing the world in nengo_gui
+    :param bridge: instead of separate movement, radar and colour nodes,
+        use one grid.SensorBridge (model.bridge, also model.movement) that
+        steps the world every bridge ticks; True for every tick
+    :param radar_neurons: neurons in the radar ensemble
+    :param port: a multiworld.AgentPort to sense and move body through
+        instead (model.port), with model.movement passing the commands on
+    """
+    with model:
+        if render:
+            model.env = grid.GridNode(world, dt=0.005)
+        model.radar = nengo.Ensemble(n_neurons=radar_neurons, dimensions=3, radius=4)
+        if port is not None:
+            model.port = port
+            model.movement = nengo.Node(size_in=3)
+            nengo.Connection(model.movement, port.command, synapse=None)
+            nengo.Connection(port.radar, model.radar)
+        elif bridge:
+            model.bridge = grid.SensorBridge(world, body, every=int(bridge))
+            model.movement = model.bridge
+            nengo.Connection(model.bridge[model.bridge.radar], model.radar)
+        else:
+            model.movement = nengo.Node(Movement(body), size_in=3)
+            model.stim_radar = nengo.Node(Radar(world, body))
+            nengo.Connection(model.stim_radar, model.radar)
+        nengo.Connection(model.radar, model.movement[:2], function=movement_func)
+    return model
+
+
+def build_colour_counter(model, body, max_colours=MAX_COLOURS, palette=PALETTE, D=32,
+                         n_neurons=1000, memory_threshold=0.3, memory_synapse=0.01):
+    """
+    Adds the colour memories and counter to model, stopping the critter
+    through model.movement once it has seen max_colours colours.
+    :param palette: the colours cells can have, as Cell.palette
+    :param D: dimensions of the colour and state vocabularies
+    :param n_neurons: neurons in the counter and stop ensembles
+    :param memory_threshold: threshold of the associative memories that
+        clean up each colour's state
+    :param memory_synapse: synapse of the loops between each colour's state
+        and its memory
+    """
+    with model:
+        # This node returns the colour of the cell currently occupied. Note that you might want to transform this into
+        # something else (see the assignment)
+        bridge = getattr(model, 'bridge', None)
+        port = getattr(model, 'port', None)
+        if port is not None:
+            model.current_color = port.colour
+        elif bridge is not None:
+            model.current_color = bridge[bridge.colour]
+        else:
+            model.current_color = nengo.Node(CurrentColour(body))
+
+        # The list of colours available in the environment/maze
+        color_list = [name for char, name, colour in palette]
+        colour_vocab = spa.Vocabulary(D)
+        colour_vocab.parse("+".join(color_list))
+        colour_vocab.parse("WHITE")
+
+        colour_state_vocab = spa.Vocabulary(D)
+        colour_state_vocab.parse("YES+NO")  # this is what freddy helped us with
+
+        # make the list of colours / adding all the colour states
+        for color in color_list:
+            setattr(model, color.lower(), spa.State(D, vocab=colour_state_vocab))
+
+        # model.clean = memory clean up to stabalize
+        # and all the connections
+        for color in color_list:
+            state = getattr(model, color.lower())
+            clean = spa.AssociativeMemory(colour_state_vocab, wta_output=True,
+                                          threshold=memory_threshold)
+            setattr(model, 'clean_' + color.lower(), clean)
+            nengo.Connection(state.output, clean.input, synapse=memory_synapse)
+            nengo.Connection(clean.output, state.output, synapse=memory_synapse)
+
+        # the colour detection. convert numbers into a spa vector (?)
+        model.converter = spa.State(D, vocab=colour_vocab)
+        nengo.Connection(model.current_color, model.converter.input,
+                         function=ColourConverter(colour_vocab, color_list))
+
+        # if a colour is detected, then output YES for that colour
+        actions = spa.Actions(*(
+            ['dot(converter, %s) --> %s=YES' % (color, color.lower()) for color in color_list] +
+            ['0.5 --> ']
+        ))
+        model.bg = spa.BasalGanglia(actions)
+        model.thalamus = spa.Thalamus(model.bg)
+
+        # Ensemble that counts the number of coloured tiles agent has seen.
+        model.counter = nengo.Ensemble(n_neurons, 1, radius=5)
+
+        # Thijs Gelton helped us with the implementation of this part.
+        for colour in color_list:
+            clean = getattr(model, 'clean_' + colour.lower())
+            clean.output.output = passthrough
+            nengo.Connection(clean.output, model.counter, function=SpaToNengo(colour_vocab))
+
+        model.stop = nengo.Ensemble(n_neurons, 1)
+        model.inhib = nengo.Node(size_in=1)
+
+        # Provides input to the inhibit node to stop neuron activity when the agent has crossed the threshold
+        nengo.Connection(model.counter, model.inhib, function=Inhibit(max_colours))
+
+        # Stops the neuron activity
+        nengo.Connection(
+            model.inhib, model.stop.neurons,
+            transform=-10 * np.ones((n_neurons, 1))
+        )
+        nengo.Connection(model.counter, model.stop, function=run_while_counting)
+        # Updating the movement function to make the agent move or stop at its track
+        nengo.Connection(model.stop, model.movement[2])
+    return model
+
+
+def build_reference_counter(model, world, body, max_colours=MAX_COLOURS):
+    """
+    Adds a grid.ColourTracker (model.colour_tracker) in place of the neural
+    colour stages of build_colour_counter.  model.counter is the number of
+    distinct colours body has stood on and model.stop is 1 until that
+    reaches max_colours, then 0, stopping the critter through
+    model.movement.
+    """
+    with model:
+        model.colour_tracker = grid.ColourTracker(world, [body])
+        model.reference = nengo.Node(ReferenceCounter(model.colour_tracker, max_colours),
+                                     size_out=2)
+        model.counter = model.reference[0]
+        model.stop = model.reference[1]
+        nengo.Connection(model.stop, model.movement[2], synapse=None)
+    return model
+
+
+def build_model(world, body, max_colours=MAX_COLOURS, seed=None, render=True,
+                bridge=False, palette=None, D=32, n_neurons=1000, radar_neurons=500,
+                memory_threshold=0.3, memory_synapse=0.01, counter='neural'):
+    """
+    Builds the SPA model that drives body around world, counting colours
+    until it has seen max_colours of them.
+    :param world: the maze, see make_world
+    :type world: grid.World
+    :param body: the critter, already added to world
+    :type body: grid.ContinuousAgent
+    :param render: include the GridNode used by nengo_gui
+    :param bridge: drive the critter through one grid.SensorBridge, see
+        build_navigation
+    :param palette: the colours to count, by default those of world's cells
+    :param D: dimensions of the colour vocabularies
+    :param n_neurons: neurons in the counter and stop ensembles
+    :param radar_neurons: neurons in the radar ensemble
+    :param memory_threshold: threshold of the colour memories
+    :param memory_synapse: synapse of the colour memory loops
+    :param counter: 'neural' to count colours with the SPA model, or
+        'reference' to count them exactly with build_reference_counter,
+        e.g. to check the neural count or to study navigation alone
+    :return: the model; the nodes and ensembles are attributes of it
+    :rtype: spa.SPA
+    """
+    # Your model might not be a nengo.Netowrk() - SPA is permitted:q
+    model = spa.SPA(seed=seed)
+    build_navigation(model, world, body, render=render, bridge=bridge,
+                     radar_neurons=radar_neurons)
+    if counter == 'reference':
+        return build_reference_counter(model, world, body, max_colours=max_colours)
+    if counter != 'neural':
+        raise ValueError('Unknown counter %r' % counter)
+    if palette is None:
+        palette = getattr(world.Cell, 'palette', PALETTE)
+    build_colour_counter(model, body, max_colours=max_colours, palette=palette, D=D,
+                         n_neurons=n_neurons, memory_threshold=memory_threshold,
+                         memory_synapse=memory_synapse)
+    return model
+
+
+class Tracker(object):
+    """
+    Follows the critter every step, measuring the length of its path and
+    the colours it has actually stood on, with the time each was first
+    stood on in times, and passes each step on to its
+    recorders, such as a recording.Recorder, raster.FrameWriter or
+    viewer.WorldStream.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.start_x = self.x = body.x
+        self.start_y = self.y = body.y
+        self.path_length = 0.0
+        self.colours = set()
+        self.times = []
+        self.recorders = []
+
+    def __call__(self, t):
+        body = self.body
+        self.path_length += ((body.x - self.x) ** 2 + (body.y - self.y) ** 2) ** 0.5
+        self.x = body.x
+        self.y = body.y
+        colour = body.cell.cellcolor
+        if colour and colour not in self.colours:
+            self.colours.add(colour)
+            self.times.append(t)
+        for recorder in self.recorders:
+            recorder(t)
+
+    def checkpoint_state(self):
+        return dict(start=(self.start_x, self.start_y), position=(self.x, self.y),
+                    path_length=self.path_length, colours=sorted(self.colours),
+                    times=self.times)
+
+    def restore_state(self, state):
+        self.start_x, self.start_y = state['start'].tolist()
+        self.x, self.y = state['position'].tolist()
+        self.path_length = float(state['path_length'])
+        self.colours = set(state['colours'].tolist())
+        self.times = state['times'].tolist() if 'times' in state else []
+
+
+class Critter(object):
+    """
+    A built critter ready to run: its world, body, model, simulator, the
+    tracker and probes on the stop and counter ensembles.  decoder_stats
+    holds the decoder cache lookups, hits and misses of the build, if it
+    was built with a decoder_cache.DecoderCache.
+    """
+
+    def __init__(self, world, body, model, sim, tracker, stop_probe, counter_probe,
+                 decoder_stats=None):
+        self.world = world
+        self.body = body
+        self.model = model
+        self.sim = sim
+        self.tracker = tracker
+        self.stop_probe = stop_probe
+        self.counter_probe = counter_probe
+        self.decoder_stats = decoder_stats
+
+    def record(self, directory, **kwargs):
+        """
+        Start recording the critter every step into directory, along with
+        the SensorBridge output if it has one.
+        :return: the recording.Recorder, to close once the run is over
+        """
+        bridge = getattr(self.model, 'bridge', None)
+        if bridge is not None:
+            kwargs.setdefault('sensors', bridge.bridge_output.output)
+        recorder = recording.Recorder(self.world, directory, [self.body], **kwargs)
+        self.tracker.recorders.append(recorder)
+        return recorder
+
+    def export_frames(self, directory, **kwargs):
+        """
+        Start saving frames of the world into directory, see
+        raster.FrameWriter for the options.
+        :return: the raster.FrameWriter, to close once the run is over
+        """
+        writer = raster.FrameWriter(self.world, directory, **kwargs)
+        self.tracker.recorders.append(writer)
+        return writer
 
-    # Stops the neuron activity
-    nengo.Connection(
-        inhib, model.stop.neurons,
-        transform=-10 * np.ones((n_neurons, 1))
-    )
-    nengo.Connection(model.counter, model.stop, function=lambda x: x / x)
-    # Updating the movement function to make the agent move or stop at its track
-    nengo.Connection(model.stop, movement[2])
+    def stream(self, server, name=None):
+        """
+        Start showing the world live on a viewer.ViewServer.
+        :return: the viewer.WorldStream, to close once the run is over
+        """
+        stream = server.stream(self.world, name)
+        self.tracker.recorders.append(stream)
+        return stream
+
+
+def _source_hash():
+    h = hashlib.sha1(nengo.__version__.encode())
+    for filename in (grid.__file__, __file__):
+        with open(filename, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class CritterBuilder(object):
+    """
+    Builds Critters, reusing earlier builds with the same parameters.
+
+    A build is pickled before it first runs and kept in memory and, if
+    cache_dir is given, on disk, so later builds with the same parameters
+    and seed just unpickle a fresh copy instead of rebuilding the model.
+    Cached builds are keyed on the nengo version and the source of this
+    module and grid, so editing either invalidates them.
+
+    nengo's AssociativeMemory uses local functions, which the standard
+    pickle module cannot handle, so caching needs cloudpickle; without it
+    every build is made from scratch, and asking for a cache_dir is an
+    error.
+    """
+
+    def __init__(self, cache_dir=None, memory=True, decoder_cache=None):
+        if cache_dir is not None and cloudpickle is None:
+            raise ImportError('CritterBuilder(cache_dir=...) needs cloudpickle to pickle '
+                              'built models; pip install cloudpickle')
+        self.cache_dir = cache_dir
+        self.memory = {} if memory else None
+        self.decoder_cache = decoder_cache
+        self.hits = 0
+        self.misses = 0
+        self._source = None
+
+    def key(self, params):
+        if self._source is None:
+            self._source = _source_hash()
+        return hashlib.sha1(
+            (self._source + repr(sorted(params.items()))).encode()).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, 'critter-%s.pkl' % key)
+
+    def build(self, map=mymap, start=(1, 2), dir=2, max_colours=MAX_COLOURS,
+              seed=0, dt=0.001, render=False, bridge=False, sensor_field=False,
+              D=32, n_neurons=1000, radar_neurons=500, memory_threshold=0.3,
+              memory_synapse=0.01, counter='neural'):
+        """
+        :param start: (x, y) of the starting cell, or None for a random
+            free cell chosen with the given seed
+        :return: a Critter whose simulator has not been run
+        """
+        params = dict(map=map, start=start, dir=dir, max_colours=max_colours,
+                      seed=seed, dt=dt, render=render, bridge=bridge,
+                      sensor_field=sensor_field, D=D, n_neurons=n_neurons,
+                      radar_neurons=radar_neurons, memory_threshold=memory_threshold,
+                      memory_synapse=memory_synapse, counter=counter)
+        key = self.key(params)
+        data = None
+        if self.memory is not None:
+            data = self.memory.get(key)
+        if data is None and self.cache_dir is not None:
+            try:
+                with open(self._filename(key), 'rb') as f:
+                    data = f.read()
+            except IOError:
+                pass
+        if data is not None:
+            self.hits += 1
+            if self.memory is not None:
+                self.memory[key] = data
+            critter = pickle.loads(data)
+            critter.decoder_stats = None
+            return critter
+
+        self.misses += 1
+        critter = make_critter(decoder_cache=self.decoder_cache, **params)
+        if cloudpickle is None:
+            return critter
+        data = cloudpickle.dumps(critter, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.memory is not None:
+            self.memory[key] = data
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            filename = self._filename(key)
+            with open(filename + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(filename + '.tmp', filename)
+        return critter
+
+
+def make_critter(map=mymap, start=(1, 2), dir=2, max_colours=MAX_COLOURS,
+                 seed=0, dt=0.001, render=False, bridge=False, sensor_field=False,
+                 D=32, n_neurons=1000, radar_neurons=500, memory_threshold=0.3,
+                 memory_synapse=0.01, counter='neural', decoder_cache=None):
+    """
+    Builds a Critter from scratch; see CritterBuilder for the cached version.
+    D, n_neurons, radar_neurons, memory_threshold, memory_synapse and
+    counter are passed on to build_model.
+    :param sensor_field: read the radar from a precomputed grid.SensorField
+        rather than casting rays
+    :param decoder_cache: a decoder_cache.DecoderCache to solve decoders
+        through, by default nengo's own
+    """
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    world = make_world(map)
+    body = grid.ContinuousAgent()
+    if start is None:
+        world.add(body, dir=dir)
+    else:
+        world.add(body, x=start[0], y=start[1], dir=dir)
+    if sensor_field:
+        grid.SensorField(world, max_distance=4)
+        body.detect_method = 'field'
+    model = build_model(world, body, max_colours=max_colours, seed=seed, render=render,
+                        bridge=bridge, D=D, n_neurons=n_neurons, radar_neurons=radar_neurons,
+                        memory_threshold=memory_threshold, memory_synapse=memory_synapse,
+                        counter=counter)
+    tracker = Tracker(body)
+    with model:
+        nengo.Node(tracker)
+        stop_probe = nengo.Probe(model.stop, synapse=0.01)
+        counter_probe = nengo.Probe(model.counter, synapse=0.01)
+    if decoder_cache is None:
+        sim = nengo.Simulator(model, dt=dt, seed=seed, progress_bar=False)
+        return Critter(world, body, model, sim, tracker, stop_probe, counter_probe)
+
+    decoder_cache.reset_stats()
+    sim = nengo.Simulator(model, dt=dt, seed=seed, progress_bar=False,
+                          model=nengo.builder.Model(dt=dt, decoder_cache=decoder_cache))
+    # the cache is only needed while building, and holds open files
+    sim.model.decoder_cache = nengo.cache.NoDecoderCache()
+    return Critter(world, body, model, sim, tracker, stop_probe, counter_probe,
+                   decoder_stats=decoder_cache.stats())
+
+
+class Population(object):
+    """
+    Many critters, one per world, run by one multiworld.WorldHost in a
+    single simulator: the worlds and bodies, the host, the network whose
+    members are each critter's own model, the simulator and probes on every
+    critter's stop and counter.
+    """
+
+    def __init__(self, worlds, bodies, host, model, sim, stop_probes, counter_probes):
+        self.worlds = worlds
+        self.bodies = bodies
+        self.host = host
+        self.model = model
+        self.sim = sim
+        self.stop_probes = stop_probes
+        self.counter_probes = counter_probes
+
+    def sync(self):
+        """Move the bodies to where the host has them, e.g. to render them."""
+        self.host.sync()
+
+
+def make_population(maps, starts=None, dir=2, max_colours=MAX_COLOURS, seed=0, dt=0.001,
+                    every=1, counter='neural', D=32, n_neurons=1000, radar_neurons=500,
+                    memory_threshold=0.3, memory_synapse=0.01):
+    """
+    Builds a Population with one critter in a world of each map.
+    :param starts: (x, y) of each critter's starting cell, None for a random
+        free cell, or None for all of them
+    :param every: step the worlds every this many ticks
+    :param counter: 'neural' for every critter's own SPA colour counter,
+        'reference' for the host's exact counts, or 'none' to only navigate
+    """
+    if counter not in ('neural', 'reference', 'none'):
+        raise ValueError('Unknown counter %r' % counter)
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    if starts is None:
+        starts = [None] * len(maps)
+    worlds = []
+    bodies = []
+    for map, start in zip(maps, starts):
+        world = make_world(map, storage='array')
+        body = grid.ContinuousAgent()
+        if start is None:
+            world.add(body, dir=dir)
+        else:
+            world.add(body, x=start[0], y=start[1], dir=dir)
+        worlds.append(world)
+        bodies.append(body)
+    host = multiworld.WorldHost(worlds, dt=dt, every=every)
+
+    model = nengo.Network(label='population', seed=seed)
+    stop_probes = []
+    counter_probes = []
+    with model:
+        model.host = multiworld.HostNode(host)
+        if counter == 'reference':
+            model.counts = nengo.Node(multiworld.HostCounter(host, max_colours))
+        elif counter == 'none':
+            model.run = nengo.Node(1.)
+        model.members = []
+        for i, (world, body) in enumerate(zip(worlds, bodies)):
+            member = spa.SPA(label='critter %d' % i, seed=seed + i)
+            build_navigation(member, world, body, render=False, radar_neurons=radar_neurons,
+                             port=model.host.port(i))
+            if counter == 'neural':
+                build_colour_counter(member, body, max_colours=max_colours, D=D,
+                                     n_neurons=n_neurons, memory_threshold=memory_threshold,
+                                     memory_synapse=memory_synapse)
+                stop_probes.append(nengo.Probe(member.stop, synapse=0.01))
+                counter_probes.append(nengo.Probe(member.counter, synapse=0.01))
+            elif counter == 'reference':
+                member.counter = model.counts[2 * i]
+                member.stop = model.counts[2 * i + 1]
+                nengo.Connection(member.stop, member.movement[2], synapse=None)
+                stop_probes.append(nengo.Probe(member.stop, synapse=0.01))
+                counter_probes.append(nengo.Probe(member.counter, synapse=0.01))
+            else:
+                nengo.Connection(model.run, member.movement[2], synapse=None)
+            model.members.append(member)
+    sim = nengo.Simulator(model, dt=dt, seed=seed, progress_bar=False)
+    return Population(worlds, bodies, host, model, sim, stop_probes, counter_probes)
+
+
+# nengo_gui runs this file with __page__ defined and expects the model and
+# the names used in colour_critter.py.cfg at the top level.  Anywhere else
+# nothing is built until one of those names is first used.
+_gui_names = ('world', 'body', 'model', 'env', 'movement', 'stim_radar',
+              'radar', 'current_color', 'inhib')
+
+
+def _build_gui_model(namespace):
+    world = make_world()
+
+    body = grid.ContinuousAgent()
+    world.add(body, x=1, y=2, dir=2)
+
+    model = build_model(world, body)
+    namespace.update(world=world, body=body, model=model, env=model.env,
+                     movement=model.movement, stim_radar=model.stim_radar,
+                     radar=model.radar, current_color=model.current_color,
+                     inhib=model.inhib)
+
+
+if '__page__' in globals() or __name__ == '__main__':
+    _build_gui_model(globals())
+else:
+    def __getattr__(name):
+        if name in _gui_names:
+            _build_gui_model(globals())
+            return globals()[name]
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
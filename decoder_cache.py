@@ -0,0 +1,52 @@
+"""An on-disk decoder cache that reports how often it is hit.
+
+nengo solves the decoders of every connection from an ensemble when a model
+is built.  nengo.cache.DecoderCache stores those solutions on disk, keyed on
+the solver, neuron type, gains, biases, evaluation points, function targets
+and seed, so any change to an ensemble, its function or the seed is a miss.
+When the cache grows past its size the least recently accessed files are
+removed.  This subclass lets the location and size be chosen per cache and
+counts lookups, hits and misses, which make_critter reports per build.
+"""
+import numpy as np
+import nengo.cache
+
+
+class DecoderCache(nengo.cache.DecoderCache):
+    """
+    :param cache_dir: directory to keep decoders in, by default nengo's
+    :param size: maximum size of the cache, in bytes or as a string such as
+        "512 MB"; by default nengo's decoder_cache.size setting
+    """
+
+    def __init__(self, cache_dir=None, size=None, readonly=False):
+        super(DecoderCache, self).__init__(readonly=readonly, cache_dir=cache_dir)
+        self.size = size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.lookups = 0
+        self.misses = 0
+
+    def stats(self):
+        hits = self.lookups - self.misses
+        return dict(lookups=self.lookups, hits=hits, misses=self.misses,
+                    hit_rate=hits / float(self.lookups) if self.lookups else None)
+
+    def shrink(self, limit=None):
+        if limit is None:
+            limit = self.size
+        super(DecoderCache, self).shrink(limit)
+
+    def wrap_solver(self, solver_fn):
+        def counted_solver_fn(*args, **kwargs):
+            self.misses += 1
+            return solver_fn(*args, **kwargs)
+
+        cached_solver = super(DecoderCache, self).wrap_solver(counted_solver_fn)
+
+        def solver(conn, gain, bias, x, targets, rng=np.random, **kwargs):
+            self.lookups += 1
+            return cached_solver(conn, gain, bias, x, targets, rng=rng, **kwargs)
+
+        return solver
@@ -2,18 +2,140 @@
 # see https://github.com/tcstewar/syde556-1/
 
 import math
+import os
 import random
+import time
+
+import numpy as np
 
 neighbour_synonyms = ('neighbours', 'neighbors', 'neighbour', 'neighbor')
 
+_square4 = ((0, -1), (1, 0), (0, 1), (-1, 0))
+_square8 = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+
+
+class Topology(object):
+    """How the cells of a width x height world connect.
+
+    offsets holds the (dx, dy) of each direction for cells in even and odd
+    rows; only the hexagonal layout depends on the row.  Worlds wrap around
+    at their edges unless wrap is False, in which case a cell's neighbour
+    past an edge is the cell itself and nothing can move off the world.
+    The flat neighbour index of every cell is worked out once, when first
+    used, for bulk lookups.
+    """
+
+    directions = None
+    offsets = None
+
+    def __init__(self, width, height, wrap=True):
+        self.width = width
+        self.height = height
+        self.wrap = wrap
+        # (parity, direction, xy)
+        self.table = np.array(self.offsets, dtype=np.int64)
+        self._neighbour_index = None
+
+    def offset(self, y, dir):
+        return self.offsets[y & 1][dir]
+
+    def point(self, x, y, dir):
+        """The x, y of the cell in direction dir of the cell at x, y."""
+        dx, dy = self.offsets[y & 1][dir]
+        x2 = x + dx
+        y2 = y + dy
+        if self.wrap:
+            return x2 % self.width, y2 % self.height
+        if 0 <= x2 < self.width and 0 <= y2 < self.height:
+            return x2, y2
+        return x, y
+
+    def vector(self, y, direction):
+        """(dx, dy) of a fractional direction from a cell in row y."""
+        offsets = self.offsets[y & 1]
+        dir1 = int(direction)
+        dx1, dy1 = offsets[dir1]
+        dx2, dy2 = offsets[(dir1 + 1) % self.directions]
+        scale = direction % 1
+        return dx2 * scale + dx1 * (1 - scale), dy2 * scale + dy1 * (1 - scale)
+
+    def contains(self, x, y):
+        """Whether the point x, y is on the world; always, if it wraps."""
+        return self.wrap or (-0.5 <= x < self.width - 0.5 and -0.5 <= y < self.height - 0.5)
+
+    @property
+    def neighbour_index(self):
+        """(height, width, directions) array of flat neighbour indices."""
+        if self._neighbour_index is None:
+            ys, xs = np.mgrid[0:self.height, 0:self.width]
+            x, y = self.points(xs[:, :, None], ys[:, :, None], np.arange(self.directions))
+            self._neighbour_index = (y * self.width + x).astype(np.int32)
+        return self._neighbour_index
+
+    def points(self, x, y, dir):
+        """point() over arrays of x, y and dir, which broadcast together."""
+        x = np.asarray(x)
+        y = np.asarray(y)
+        offsets = self.table[y & 1, dir]
+        x2 = x + offsets[..., 0]
+        y2 = y + offsets[..., 1]
+        if self.wrap:
+            return x2 % self.width, y2 % self.height
+        outside = (x2 < 0) | (x2 >= self.width) | (y2 < 0) | (y2 >= self.height)
+        return np.where(outside, x, x2), np.where(outside, y, y2)
+
+    def neighbours(self, indices, dir=None):
+        """
+        Flat indices of the neighbours of the cells at flat indices: all
+        of them, one row per cell, or those in direction dir.
+        """
+        table = self.neighbour_index.reshape(-1, self.directions)
+        if dir is None:
+            return table[indices]
+        return table[indices, dir]
+
+
+class Square4(Topology):
+    directions = 4
+    offsets = (_square4, _square4)
+
+
+class Square8(Topology):
+    directions = 8
+    offsets = (_square8, _square8)
+
+
+class Hex6(Topology):
+    directions = 6
+    offsets = (((1, 0), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1)),
+               ((1, 0), (1, 1), (0, 1), (-1, 0), (0, -1), (1, -1)))
+
+
+topologies = {4: Square4, 6: Hex6, 8: Square8}
+
+# (dx, dy) of each direction for cells in even and odd rows
+direction_offsets = dict((d, t.offsets) for d, t in topologies.items())
+
+
+# attributes that place a cell rather than change it
+_cell_bookkeeping = frozenset(('x', 'y', 'world', 'agents', '__dict__'))
+
 
 class Cell(object):
     wall = False
+    # (name, dtype) of the attributes kept in World.arrays when the World
+    # uses storage='array'; subclasses extend this with their own state.
+    # Cells of an array-backed World whose class defines a classmethod
+    # update_arrays(world, old, new) are updated a whole grid at a time
+    # through it instead of calling update() on every cell.  Without it,
+    # update() still works but every field access goes through a
+    # descriptor, which makes it slower than in a list-backed World.
+    array_fields = (('wall', np.bool_),)
 
     def __getattr__(self, key):
         if key in neighbour_synonyms:
-            pts = [self.world.get_point_in_direction(
-                self.x, self.y, dir) for dir in range(self.world.directions)]
+            point = self.world.topology.point
+            pts = [point(self.x, self.y, dir) for dir in range(self.world.directions)]
             ns = tuple([self.world.grid[y][x] for (x, y) in pts])
             for n in neighbour_synonyms:
                 self.__dict__[n] = ns
@@ -21,9 +143,146 @@ class Cell(object):
         raise AttributeError(key)
 
 
+def _reporting_setattr(cell, key, value):
+    # __setattr__ of the cells of a watched list-backed World, which report
+    # their own changes as ArrayField does for array-backed ones
+    super(cell.world.ListCell, cell).__setattr__(key, value)
+    if key not in _cell_bookkeeping:
+        cell.world.mark_dirty(cell.x, cell.y)
+
+
+class ArrayField(object):
+    """Descriptor mapping a cell attribute onto one element of a World array."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, cell, owner):
+        if cell is None:
+            return self
+        return cell.world.arrays[self.name][cell.y, cell.x].item()
+
+    def __set__(self, cell, value):
+        world = cell.world
+        world.write_arrays[self.name][cell.y, cell.x] = value
+        if world.watchers:
+            world.mark_dirty(cell.x, cell.y)
+
+
+class RowField(object):
+    """ArrayField for World.update's per-cell pass over an array-backed World.
+
+    Reads the cell's current value from the world's read_rows and writes
+    its next one to write_rows, nested lists the world copies from and
+    back into its arrays around the pass.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, cell, owner):
+        if cell is None:
+            return self
+        return cell.world.read_rows[self.name][cell.y][cell.x]
+
+    def __set__(self, cell, value):
+        cell.world.write_rows[self.name][cell.y][cell.x] = value
+
+
+class ArrayCell(object):
+    """Mixin for cells that are views over an array-backed World."""
+
+    def __getattr__(self, key):
+        if key in neighbour_synonyms:
+            world = self.world
+            ns = tuple([world.get_cell_at_index(i)
+                        for i in world.neighbour_index[self.y, self.x].tolist()])
+            for n in neighbour_synonyms:
+                self.__dict__[n] = ns
+            return ns
+        return super(ArrayCell, self).__getattr__(key)
+
+
+class AgentList(list):
+    """A list of agents with O(1) append and remove.
+
+    Each agent keeps its index in the list as the attribute named by slot,
+    and removing an agent moves the last one into its place, so the order
+    of the list is not preserved.
+    """
+    __slots__ = ('slot',)
+
+    def __init__(self, slot):
+        list.__init__(self)
+        self.slot = slot
+
+    def append(self, agent):
+        agent.__dict__[self.slot] = len(self)
+        list.append(self, agent)
+
+    def remove(self, agent):
+        i = agent.__dict__.pop(self.slot, None)
+        if i is None or i >= len(self) or self[i] is not agent:
+            # the list was changed some other way
+            list.remove(self, agent)
+            return
+        last = list.pop(self)
+        if last is not agent:
+            self[i] = last
+            last.__dict__[self.slot] = i
+
+
+class CellAgents(AgentList):
+    """The agents in one array-backed cell, kept in step with World.occupancy."""
+    __slots__ = ('occupancy', 'index')
+
+    def __init__(self, occupancy, index):
+        AgentList.__init__(self, '_cell_index')
+        self.occupancy = occupancy
+        self.index = index
+
+    def append(self, agent):
+        AgentList.append(self, agent)
+        self.occupancy[self.index] += 1
+
+    def remove(self, agent):
+        AgentList.remove(self, agent)
+        self.occupancy[self.index] -= 1
+
+
+class GridRow(object):
+    """One row of an array-backed World, creating cell views on first use."""
+
+    def __init__(self, world, y):
+        self.world = world
+        self.y = y
+        self.cells = {}
+
+    def __len__(self):
+        return self.world.width
+
+    def __getitem__(self, x):
+        cell = self.cells.get(x)
+        if cell is None:
+            if x < 0:
+                return self[x + self.world.width]
+            if x >= self.world.width:
+                raise IndexError(x)
+            cell = self.world._make_cell(x, self.y)
+            self.cells[x] = cell
+        return cell
+
+    def __iter__(self):
+        for x in range(self.world.width):
+            yield self[x]
+
+
 class Agent(object):
     world = None
     cell = None
+    # continuous agents move within cells; others are always at x, y of
+    # their cell
+    continuous = False
 
     def __setattr__(self, key, val):
         if key == 'cell':
@@ -32,7 +291,16 @@ class Agent(object):
                 old.agents.remove(self)
             if val is not None:
                 val.agents.append(self)
+                if not self.continuous and 'x' in self.__dict__:
+                    self.__dict__['x'] = val.x
+                    self.__dict__['y'] = val.y
+        elif key != 'x' and key != 'y':
+            self.__dict__[key] = val
+            return
         self.__dict__[key] = val
+        world = self.world
+        if world is not None and world.spatial is not None:
+            world.spatial.move(self)
 
     def __getattr__(self, key):
         if key == 'left_cell':
@@ -57,7 +325,7 @@ class Agent(object):
 
     def go_in_direction(self, dir):
         target = self.cell.neighbour[dir]
-        if getattr(target, 'wall', False):
+        if getattr(target, 'wall', False) or target is self.cell:
             return False
         self.cell = target
         return True
@@ -89,6 +357,12 @@ class Agent(object):
             raise CellularException('Agent has not been put in a World')
         if self.cell == target:
             return
+        if self.world.planner is not None:
+            dir = self.world.planner.next_direction(self.cell, target)
+            if dir is None:
+                return False
+            self.dir = dir
+            return self.go_in_direction(dir)
         best = None
         for i, n in enumerate(self.cell.neighbours):
             if n == target:
@@ -114,32 +388,51 @@ class Agent(object):
 
 
 class World(object):
-    def __init__(self, cell=None, width=None, height=None, directions=8, filename=None, map=None):
+    # a planning.Planner attaches itself here to steer Agent.go_towards
+    planner = None
+    # a SpatialHash attaches itself here and follows the agents as they move
+    spatial = None
+    # a SensorField attaches itself here for detect(method='field')
+    sensor_field = None
+
+    def __init__(self, cell=None, width=None, height=None, directions=8, filename=None, map=None,
+                 storage=None, mmap_mode='c', wrap=True):
         if cell is None:
             cell = Cell
+        binary = is_binary_map(filename)
+        if storage is None:
+            storage = 'array' if binary else 'list'
+        if storage not in ('list', 'array'):
+            raise CellularException('Unknown storage %r' % storage)
+        if directions not in topologies:
+            raise CellularException('Unknown number of directions %r' % directions)
         self.Cell = cell
+        self.storage = storage
         self.directions = directions
-        if filename or map:
-            if filename:
-                data = file(filename).readlines()
-            else:
-                data = map.splitlines()
-                if len(data[0]) == 0:
-                    del data[0]
+        arrays = lines = None
+        if binary:
+            arrays = read_binary_map(filename, mmap_mode=mmap_mode)
+            height, width = next(iter(arrays.values())).shape
+        elif filename or map:
+            lines = read_ascii_map(filename, map)
             if height is None:
-                height = len(data)
+                height = len(lines)
             if width is None:
-                width = max([len(x.rstrip()) for x in data])
+                width = max([len(x) for x in lines])
         if width is None:
             width = 20
         if height is None:
             height = 20
         self.width = width
         self.height = height
+        self.topology = topologies[directions](width, height, wrap)
         self.image = None
+        self.watchers = []
         self.reset()
-        if filename or map:
-            self.load(filename=filename, map=map)
+        if arrays is not None:
+            self.set_arrays(arrays)
+        elif lines is not None and hasattr(self.Cell, 'load'):
+            self._load_lines(lines)
 
     def get_cell(self, x, y):
         return self.grid[y][x]
@@ -151,21 +444,107 @@ class World(object):
                     yield cell
 
     def reset(self):
-        self.grid = [[self._make_cell(
-            i, j) for i in range(self.width)] for j in range(self.height)]
-        self.dictBackup = [[{} for i in range(self.width)]
-                           for j in range(self.height)]
-        self.agents = []
+        if self.storage == 'array':
+            shape = (self.height, self.width)
+            self.arrays = {}
+            for name, dtype in self.Cell.array_fields:
+                self.arrays[name] = np.full(
+                    shape, getattr(self.Cell, name, 0), dtype=dtype)
+            self.write_arrays = self.arrays
+            self.back_arrays = None
+            self.occupancy = np.zeros(shape, dtype=np.uint16)
+            self.ViewCell = type(self.Cell.__name__, (ArrayCell, self.Cell), dict(
+                (name, ArrayField(name)) for name, dtype in self.Cell.array_fields))
+            self.grid = [GridRow(self, j) for j in range(self.height)]
+            self.dictBackup = None
+        else:
+            self.arrays = None
+            self.write_arrays = None
+            self.occupancy = None
+            # a class of the world's own, which is given _reporting_setattr
+            # while the world is watched
+            self.ListCell = type(self.Cell.__name__, (self.Cell,), {})
+            self.grid = [[self._make_cell(
+                i, j) for i in range(self.width)] for j in range(self.height)]
+            self.dictBackup = [[{} for i in range(self.width)]
+                               for j in range(self.height)]
+            self._report_changes(bool(self.watchers))
+        self.agents = AgentList('_world_index')
         self.age = 0
+        if self.spatial is not None:
+            self.spatial.clear()
+        self.mark_dirty()
+
+    def watch(self, dirty=None):
+        """Return a set collecting the (x, y) of every cell marked dirty.
+
+        None in the set means any cell may have changed.  The owner clears
+        the set once it has caught up and calls unwatch() when done.  Any
+        other object with an add() method can be given to collect them
+        instead.
+
+        Cells mark themselves when one of their attributes is set, in
+        either storage, and reset(), set_arrays() and update() mark every
+        cell.  Changes made any other way, such as writing to world.arrays
+        directly or mutating a value in place, need mark_dirty().
+        """
+        if dirty is None:
+            dirty = set()
+        dirty.add(None)
+        self.watchers.append(dirty)
+        self._report_changes(True)
+        return dirty
+
+    def unwatch(self, dirty):
+        self.watchers.remove(dirty)
+        self._report_changes(bool(self.watchers))
+
+    def _report_changes(self, on):
+        # the cells of a list-backed world only pay for reporting their
+        # changes while something watches it
+        if self.arrays is None:
+            if on:
+                self.ListCell.__setattr__ = _reporting_setattr
+            elif '__setattr__' in self.ListCell.__dict__:
+                del self.ListCell.__setattr__
+
+    def mark_dirty(self, x=None, y=None):
+        key = None if x is None else (x, y)
+        for dirty in self.watchers:
+            dirty.add(key)
 
     def _make_cell(self, x, y):
-        c = self.Cell()
+        if self.arrays is None:
+            c = self.ListCell()
+            c.agents = AgentList('_cell_index')
+        else:
+            c = self.ViewCell()
+            c.agents = CellAgents(self.occupancy.reshape(-1), y * self.width + x)
         c.x = x
         c.y = y
         c.world = self
-        c.agents = []
         return c
 
+    def get_cell_at_index(self, index):
+        return self.grid[index // self.width][index % self.width]
+
+    @property
+    def neighbour_index(self):
+        """(height, width, directions) array of flat neighbour indices."""
+        return self.topology.neighbour_index
+
+    def get_array(self, name):
+        """The named cell attribute as a (height, width) array.
+
+        Array-backed worlds return their live storage; list-backed worlds
+        return a snapshot.
+        """
+        if self.arrays is not None and name in self.arrays:
+            return self.arrays[name]
+        default = getattr(self.Cell, name, 0)
+        return np.array([[getattr(c, name, default) for c in row]
+                         for row in self.grid])
+
     def randomize(self):
         if not hasattr(self.Cell, 'randomize'):
             return
@@ -176,33 +555,67 @@ class World(object):
     def save(self, f=None):
         if not hasattr(self.Cell, 'save'):
             return
-        if isinstance(f, type('')):
-            f = file(f, 'w')
-
-        total = ''
-        for j in range(self.height):
-            line = ''
-            for i in range(self.width):
-                line += self.grid[j][i].save()
-            total += '%s\n' % line
+        if isinstance(f, str):
+            f = open(f, 'w')
+
+        if self.arrays is not None:
+            total = self._save_arrays_ascii()
+        else:
+            total = ''.join(['%s\n' % ''.join([c.save() for c in row])
+                             for row in self.grid])
         if f is not None:
             f.write(total)
             f.close()
         else:
             return total
 
+    def _save_arrays_ascii(self):
+        # as with loading, Cell.save is run once per distinct combination of
+        # field values on a scratch cell
+        names = [name for name, dtype in self.Cell.array_fields]
+        keys, combos = _combination_keys([self.arrays[name] for name in names])
+        codes = np.zeros(len(combos), dtype='<u4')
+        for i, combo in enumerate(combos):
+            scratch = self.Cell()
+            for name, value in zip(names, combo):
+                setattr(scratch, name, value)
+            codes[i] = ord(scratch.save())
+        text = np.empty((self.height, self.width + 1), dtype='<u4')
+        text[:, :-1] = codes[keys]
+        text[:, -1] = ord('\n')
+        return text.tobytes().decode('utf-32-le')
+
+    def save_binary(self, filename, compressed=True):
+        """Save the cell fields listed in Cell.array_fields.
+
+        A filename ending in .npz gives a single NumPy archive; anything else
+        is a directory of .npy files, one per field, which World(filename=...)
+        opens memory-mapped.
+        """
+        arrays = dict((name, np.asarray(self.get_array(name), dtype=dtype))
+                      for name, dtype in self.Cell.array_fields)
+        if filename.endswith('.npz'):
+            if compressed:
+                np.savez_compressed(filename, **arrays)
+            else:
+                np.savez(filename, **arrays)
+        else:
+            if not os.path.isdir(filename):
+                os.makedirs(filename)
+            for name, a in arrays.items():
+                np.save(os.path.join(filename, name + '.npy'), a)
+
     def load(self, filename=None, map=None):
+        if is_binary_map(filename):
+            arrays = read_binary_map(filename)
+            self.reset()
+            self.set_arrays(arrays)
+            return
         if not hasattr(self.Cell, 'load'):
             return
-        if filename:
-            if isinstance(filename, type('')):
-                filename = file(filename)
-            lines = filename.readlines()
-        else:
-            lines = map.splitlines()
-            if len(lines[0]) == 0:
-                del lines[0]
-        lines = [x.rstrip() for x in lines]
+        self._load_lines(read_ascii_map(filename, map))
+
+    def _load_lines(self, lines):
         fh = len(lines)
         fw = max([len(x) for x in lines])
         if fh > self.height:
@@ -217,23 +630,131 @@ class World(object):
             startx = int((self.width - fw) / 2)
 
         self.reset()
+        if self.arrays is not None:
+            self._load_arrays(lines, fw, fh, startx, starty)
+            return
         for j in range(fh):
+            row = self.grid[starty + j]
             line = lines[j]
             for i in range(min(fw, len(line))):
-                self.grid[starty + j][startx + i].load(line[i])
+                row[startx + i].load(line[i])
+
+    def _load_arrays(self, lines, fw, fh, startx, starty):
+        # Cell.load is expected to depend only on the character, so it is
+        # run once per distinct character on a scratch cell and the results
+        # are written into the arrays through a lookup table per field
+        codes = np.zeros((fh, fw), dtype='<u4')
+        for j in range(fh):
+            line = lines[j][:fw]
+            if line:
+                codes[j, :len(line)] = np.frombuffer(line.encode('utf-32-le'), dtype='<u4')
+        present = np.flatnonzero(np.bincount(codes.ravel()))
+        tables = {}
+        for name, dtype in self.Cell.array_fields:
+            tables[name] = np.full(present[-1] + 1, getattr(self.Cell, name, 0), dtype=dtype)
+        for code in present:
+            if code == 0:
+                # nothing here; keep the defaults
+                continue
+            scratch = self.Cell()
+            scratch.load(chr(code))
+            lost = sorted(set(scratch.__dict__) - set(tables))
+            if lost:
+                raise CellularException(
+                    '%s.load(%r) sets %s, which array storage cannot hold; add them to '
+                    'array_fields or use storage=\'list\'' % (
+                        self.Cell.__name__, chr(code), ', '.join(lost)))
+            for name in tables:
+                if name in scratch.__dict__:
+                    tables[name][code] = scratch.__dict__[name]
+        for name, table in tables.items():
+            self.arrays[name][starty:starty + fh, startx:startx + fw] = table[codes]
+
+    def set_arrays(self, arrays):
+        """Replace cell fields with the given (height, width) arrays.
+
+        Array-backed worlds keep the arrays themselves, so memory-mapped
+        arrays are only read from disk as cells are touched.
+        """
+        for name, dtype in self.Cell.array_fields:
+            if name not in arrays:
+                continue
+            a = arrays[name]
+            if a.shape != (self.height, self.width):
+                raise CellularException('%s is %dx%d, not %dx%d' % (
+                    name, a.shape[1], a.shape[0], self.width, self.height))
+            if self.arrays is not None:
+                self.arrays[name] = a if a.dtype == dtype else a.astype(dtype)
+            else:
+                for row, values in zip(self.grid, a.tolist()):
+                    for cell, value in zip(row, values):
+                        setattr(cell, name, value)
+        if self.arrays is not None:
+            self.write_arrays = self.arrays
+            self.back_arrays = None
+        self.mark_dirty()
+
+    def _begin_array_update(self):
+        # cells read the current state and write the next; both are held
+        # as nested lists while the cells update, since indexing numpy
+        # arrays one element at a time costs several times as much
+        if self.dictBackup is None:
+            self.dictBackup = [[{} for i in range(self.width)]
+                               for j in range(self.height)]
+        self.read_rows = dict((name, a.tolist()) for name, a in self.arrays.items())
+        self.write_rows = dict((name, [row[:] for row in rows])
+                               for name, rows in self.read_rows.items())
+        for name in self.read_rows:
+            setattr(self.ViewCell, name, RowField(name))
+
+    def _end_array_update(self):
+        if self.back_arrays is None:
+            self.back_arrays = dict((name, np.empty_like(a)) for name, a in self.arrays.items())
+        for name, rows in self.write_rows.items():
+            self.back_arrays[name][...] = rows
+            setattr(self.ViewCell, name, ArrayField(name))
+        self.read_rows = self.write_rows = None
+        self.arrays, self.back_arrays = self.back_arrays, self.arrays
+        self.write_arrays = self.arrays
+
+    def neighbour_sum(self, values):
+        """Sum of each cell's neighbours in a (height, width) array."""
+        return values.reshape(-1)[self.neighbour_index].sum(axis=-1)
+
+    def _update_arrays(self):
+        # Cell.update_arrays(world, old, new) computes the next state of the
+        # whole grid from the current arrays into the back buffer
+        if self.back_arrays is None:
+            self.back_arrays = dict((name, a.copy()) for name, a in self.arrays.items())
+        else:
+            for name, a in self.arrays.items():
+                np.copyto(self.back_arrays[name], a)
+        self.Cell.update_arrays(self, self.arrays, self.back_arrays)
+        self.arrays, self.back_arrays = self.back_arrays, self.arrays
+        self.write_arrays = self.arrays
+        self.mark_dirty()
+        for a in self.agents:
+            a.update()
+        self.age += 1
 
     def update(self):
+        if self.arrays is not None and hasattr(self.Cell, 'update_arrays'):
+            return self._update_arrays()
         if hasattr(self.Cell, 'update'):
-            for j, row in enumerate(self.grid):
-                for i, c in enumerate(row):
-                    self.dictBackup[j][i].update(c.__dict__)
-                    c.update()
-                    c.__dict__, self.dictBackup[j][
-                        i] = self.dictBackup[j][i], c.__dict__
-            for j, row in enumerate(self.grid):
-                for i, c in enumerate(row):
-                    c.__dict__, self.dictBackup[j][
-                        i] = self.dictBackup[j][i], c.__dict__
+            if self.arrays is not None:
+                self._begin_array_update()
+                try:
+                    self._update_cells()
+                finally:
+                    self._end_array_update()
+            else:
+                # every cell is marked below, so they need not report
+                self._report_changes(False)
+                try:
+                    self._update_cells()
+                finally:
+                    self._report_changes(bool(self.watchers))
+            self.mark_dirty()
             for a in self.agents:
                 a.update()
         else:
@@ -242,40 +763,28 @@ class World(object):
                 a.update()
         self.age += 1
 
+    def _update_cells(self):
+        for j, row in enumerate(self.grid):
+            for i, c in enumerate(row):
+                self.dictBackup[j][i].update(c.__dict__)
+                c.update()
+                c.__dict__, self.dictBackup[j][
+                    i] = self.dictBackup[j][i], c.__dict__
+        for j, row in enumerate(self.grid):
+            for i, c in enumerate(row):
+                c.__dict__, self.dictBackup[j][
+                    i] = self.dictBackup[j][i], c.__dict__
+
     def get_offset_in_direction(self, x, y, dir):
-        if self.directions == 8:
-            dx, dy = [(0, -1), (1, -1), (
-                1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)][dir]
-        elif self.directions == 4:
-            dx, dy = [(0, -1), (1, 0), (0, 1), (-1, 0)][dir]
-        elif self.directions == 6:
-            if y % 2 == 0:
-                dx, dy = [(1, 0), (0, 1), (-1, 1), (-1, 0),
-                          (-1, -1), (0, -1)][dir]
-            else:
-                dx, dy = [(1, 0), (1, 1), (0, 1), (-1, 0),
-                          (0, -1), (1, -1)][dir]
-        return dx, dy
+        return self.topology.offsets[y & 1][dir]
 
     def get_point_in_direction(self, x, y, dir):
-        dx, dy = self.get_offset_in_direction(x, y, dir)
-
-        x2 = x + dx
-        y2 = y + dy
-
-        if x2 < 0:
-            x2 += self.width
-        if y2 < 0:
-            y2 += self.height
-        if x2 >= self.width:
-            x2 -= self.width
-        if y2 >= self.height:
-            y2 -= self.height
-
-        return x2, y2
+        return self.topology.point(x, y, dir)
 
     def remove(self, agent):
         self.agents.remove(agent)
+        if self.spatial is not None:
+            self.spatial.remove(agent)
         agent.world = None
         agent.cell = None
 
@@ -307,25 +816,422 @@ class World(object):
         agent.world = self
         agent.x = x
         agent.y = y
+        if self.spatial is not None:
+            self.spatial.move(agent)
 
 
 class CellularException(Exception):
     pass
 
 
-class ContinuousAgent(Agent):
-    def go_in_direction(self, dir, distance=1, return_obstacle=False):
+class SpatialHash(object):
+    """Agents bucketed by position, for radius and nearest-neighbour queries.
+
+    The hash attaches itself as world.spatial and follows every agent as
+    its x, y or cell changes, in O(1) per move.  Distances are Euclidean
+    between agents' x, y, without wrapping around the world.
+
+    :param bucket_size: width of the square buckets; queries are quickest
+        when it is close to the usual query radius
+    """
+
+    def __init__(self, world, bucket_size=1.0):
+        self.world = world
+        self.bucket_size = float(bucket_size)
+        self.clear()
+        for agent in world.agents:
+            self.move(agent)
+        world.spatial = self
+
+    def close(self):
+        if self.world.spatial is self:
+            self.world.spatial = None
+
+    def clear(self):
+        self.buckets = {}
+        self.keys = {}
+        self.bounds = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key(self, x, y):
+        return (int(math.floor(x / self.bucket_size)),
+                int(math.floor(y / self.bucket_size)))
+
+    def move(self, agent):
+        position = agent.__dict__
+        if 'x' not in position or 'y' not in position:
+            return
+        key = self.key(position['x'], position['y'])
+        old = self.keys.get(agent)
+        if old == key:
+            return
+        if old is not None:
+            bucket = self.buckets[old]
+            del bucket[agent]
+            if not bucket:
+                del self.buckets[old]
+        self.keys[agent] = key
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {}
+            if self.bounds is None:
+                self.bounds = [key[0], key[1], key[0], key[1]]
+            else:
+                b = self.bounds
+                b[0] = min(b[0], key[0])
+                b[1] = min(b[1], key[1])
+                b[2] = max(b[2], key[0])
+                b[3] = max(b[3], key[1])
+        bucket[agent] = None
+
+    def remove(self, agent):
+        key = self.keys.pop(agent, None)
+        if key is not None:
+            bucket = self.buckets[key]
+            del bucket[agent]
+            if not bucket:
+                del self.buckets[key]
+
+    def within(self, x, y, radius, exclude=None):
+        """The agents within radius of x, y, in no particular order."""
+        x0, y0 = self.key(x - radius, y - radius)
+        x1, y1 = self.key(x + radius, y + radius)
+        r2 = radius * radius
+        found = []
+        buckets = self.buckets
+        for bx in range(x0, x1 + 1):
+            for by in range(y0, y1 + 1):
+                bucket = buckets.get((bx, by))
+                if bucket is None:
+                    continue
+                for agent in bucket:
+                    p = agent.__dict__
+                    if (p['x'] - x) ** 2 + (p['y'] - y) ** 2 <= r2 and agent is not exclude:
+                        found.append(agent)
+        return found
+
+    def nearest(self, x, y, k=1, exclude=None):
+        """The k agents nearest x, y, nearest first."""
+        if self.bounds is None:
+            return []
+        cx, cy = self.key(x, y)
+        x0, y0, x1, y1 = self.bounds
+        last = max(cx - x0, x1 - cx, cy - y0, y1 - cy)
+        found = []
+        ring = 0
+        while ring <= last:
+            for key in _ring(cx, cy, ring):
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    continue
+                for agent in bucket:
+                    if agent is not exclude:
+                        p = agent.__dict__
+                        found.append(((p['x'] - x) ** 2 + (p['y'] - y) ** 2, id(agent), agent))
+            # anything in a further ring is at least this far away
+            reach = ring * self.bucket_size
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= reach * reach:
+                    break
+            ring += 1
+        found.sort()
+        return [agent for d, i, agent in found[:k]]
+
+
+def _ring(cx, cy, ring):
+    # the bucket keys at Chebyshev distance ring from cx, cy
+    if ring == 0:
+        yield cx, cy
+        return
+    for bx in range(cx - ring, cx + ring + 1):
+        yield bx, cy - ring
+        yield bx, cy + ring
+    for by in range(cy - ring + 1, cy + ring):
+        yield cx - ring, by
+        yield cx + ring, by
+
+
+class SensorField(object):
+    """Precomputed wall distances for constant-time ContinuousAgent.detect.
+
+    Holds the distance to the nearest wall, within max_distance, from
+    resolution x resolution sample points in every cell along headings
+    evenly spaced directions, and attaches itself as world.sensor_field.
+    detect(method='field') then looks up the sample nearest the agent and
+    the heading nearest the direction, falling back to cast_ray for
+    longer ranges and hex worlds.  Distances are out by about the distance
+    between samples, more where a ray grazes a corner; raise resolution
+    and headings for accuracy, or store them as uint8 or uint16 (in steps
+    of about max_distance / 254 or / 65534) for memory.  The table takes
+    width * height * resolution ** 2 * headings values.
+
+    The field watches the world and, when walls change, recasts only the
+    samples within max_distance of them.  The obstacle returned is the
+    cell just past the distance found, which is normally, but not always,
+    the wall cast_ray would return.
+    """
+
+    def __init__(self, world, max_distance=4, resolution=4, headings=64, dtype=np.float32):
+        if world.directions == 6:
+            raise CellularException('SensorField needs a square grid')
+        self.world = world
+        self.max_distance = float(max_distance)
+        self.resolution = resolution
+        self.headings = headings
+        self.dtype = np.dtype(dtype)
+        self.per_direction = float(headings) / world.directions
+        # the (dx, dy) of each heading, interpolated as in cast_ray
+        self.vectors = [world.topology.vector(0, h / self.per_direction)
+                        for h in range(headings)]
+        self.lengths = [math.sqrt(dx * dx + dy * dy) for dx, dy in self.vectors]
+        self.units = [(dx / length, dy / length)
+                      for (dx, dy), length in zip(self.vectors, self.lengths)]
+        # as in cast_ray, the range is measured along the (dx, dy) vector,
+        # which is not always of unit length; rays that reach it are stored
+        # as missing (inf, or the largest integer)
+        if self.dtype.kind in 'ui':
+            self.missing = np.iinfo(self.dtype).max
+            self.unit = self.max_distance * max(self.lengths) / (self.missing - 1)
+        else:
+            self.missing = np.inf
+            self.unit = 1.0
+        self.dirty = world.watch()
+        self.rebuilds = 0
+        self.updates = 0
+        self.rebuild()
+        world.sensor_field = self
+
+    def close(self):
+        if self.dirty is not None:
+            self.world.unwatch(self.dirty)
+            self.dirty = None
+        if self.world.sensor_field is self:
+            self.world.sensor_field = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['values']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.values = memoryview(self.table.reshape(-1))
+
+    def rebuild(self):
+        world = self.world
+        self.walls = world.get_array('wall').astype(bool)
+        rows = world.height * self.resolution
+        cols = world.width * self.resolution
+        self.table = np.empty((rows, cols, self.headings), dtype=self.dtype)
+        # a few rows at a time, to bound the memory of the casts
+        step = max(1, 65536 // cols)
+        for r in range(0, rows, step):
+            sy, sx = np.mgrid[r:min(r + step, rows), 0:cols]
+            self.table[r:r + step] = self.cast(sy.ravel(), sx.ravel()).reshape(
+                len(sy), cols, self.headings)
+        # indexing a memoryview gives Python numbers without numpy's overhead
+        self.values = memoryview(self.table.reshape(-1))
+        self.dirty.clear()
+        self.rebuilds += 1
+
+    def cast(self, sy, sx):
+        """(n, headings) distances from the samples at rows sy, columns sx."""
+        world = self.world
+        walls = self.walls
+        width = world.width
+        height = world.height
+        wrap = world.topology.wrap
+        res = self.resolution
+        limit = self.max_distance
+        out = np.empty((len(sy), self.headings), dtype=self.dtype)
+        # sample positions, shifted by half a cell as in cast_ray
+        px0 = (sx + 0.5) / res
+        py0 = (sy + 0.5) / res
+        for h, (dx, dy) in enumerate(self.vectors):
+            length = self.lengths[h]
+            px = px0
+            py = py0
+            ix = np.floor(px).astype(np.int64)
+            iy = np.floor(py).astype(np.int64)
+            if dx > 0:
+                step_x, t_x, dt_x = 1, (ix + 1 - px) / dx, 1.0 / dx
+            elif dx < 0:
+                step_x, t_x, dt_x = -1, (ix - px) / dx, -1.0 / dx
+            else:
+                step_x, t_x, dt_x = 0, np.full(len(px), np.inf), np.inf
+            if dy > 0:
+                step_y, t_y, dt_y = 1, (iy + 1 - py) / dy, 1.0 / dy
+            elif dy < 0:
+                step_y, t_y, dt_y = -1, (iy - py) / dy, -1.0 / dy
+            else:
+                step_y, t_y, dt_y = 0, np.full(len(py), np.inf), np.inf
+
+            # walk every ray one cell boundary at a time, dropping the rays
+            # that have hit a wall or run out of range
+            distance = np.full(len(px), np.inf)
+            alive = np.arange(len(px))
+            while len(alive):
+                across = t_x < t_y
+                t = np.where(across, t_x, t_y)
+                ix = ix + np.where(across, step_x, 0)
+                iy = iy + np.where(across, 0, step_y)
+                t_x = t_x + np.where(across, dt_x, 0)
+                t_y = t_y + np.where(across, 0, dt_y)
+                within = t < limit
+                hit = walls[iy % height, ix % width]
+                if not wrap:
+                    # the edges of a bounded world stop rays like walls
+                    hit |= (ix < 0) | (ix >= width) | (iy < 0) | (iy >= height)
+                hit &= within
+                distance[alive[hit]] = t[hit] * length
+                keep = within & ~hit
+                alive, ix, iy, t_x, t_y = (
+                    alive[keep], ix[keep], iy[keep], t_x[keep], t_y[keep])
+            if self.dtype.kind in 'ui':
+                missing = np.isinf(distance)
+                distance = np.round(distance / self.unit)
+                distance[missing] = self.missing
+            out[:, h] = distance
+        return out
 
-        dir1 = int(dir)
-        dir2 = (dir1 + 1) % self.world.directions
+    def update(self):
+        """Recast the samples near walls that have changed."""
+        dirty = self.dirty
+        walls = self.world.get_array('wall').astype(bool)
+        if None in dirty:
+            changed = np.argwhere(walls != self.walls)
+        else:
+            changed = [(y, x) for x, y in dirty if walls[y, x] != self.walls[y, x]]
+        dirty.clear()
+        if not len(changed):
+            return
+        self.walls = walls
+        world = self.world
+        res = self.resolution
+        reach = int(math.ceil(self.max_distance)) + 1
+        if len(changed) * (2 * reach + 1) ** 2 > world.width * world.height // 2:
+            self.rebuild()
+            return
+        # every sample that can see a changed cell is within reach of it
+        cells = set()
+        for y, x in changed:
+            for j in range(y - reach, y + reach + 1):
+                for i in range(x - reach, x + reach + 1):
+                    cells.add((j % world.height, i % world.width))
+        cells = np.array(sorted(cells))
+        sub_y, sub_x = np.mgrid[0:res, 0:res]
+        sy = (cells[:, 0, None] * res + sub_y.ravel()).ravel()
+        sx = (cells[:, 1, None] * res + sub_x.ravel()).ravel()
+        self.table[sy, sx] = self.cast(sy, sx)
+        self.updates += 1
+
+    def detect(self, x, y, direction, max_distance):
+        """(distance, obstacle) from x, y in direction, as ContinuousAgent.detect."""
+        if self.dirty:
+            self.update()
+        world = self.world
+        res = self.resolution
+        headings = self.headings
+        rows, cols = self.table.shape[:2]
+        sy = math.floor((y + 0.5) * res) % rows
+        sx = math.floor((x + 0.5) * res) % cols
+        h = math.floor(direction * self.per_direction + 0.5) % headings
+        value = self.values[(sy * cols + sx) * headings + h]
+        distance = value * self.unit
+        if value == self.missing or distance >= max_distance * self.lengths[h]:
+            return float(max_distance), None
+        ux, uy = self.units[h]
+        past = distance + 0.5 / res
+        cx = math.floor(x + 0.5 + ux * past)
+        cy = math.floor(y + 0.5 + uy * past)
+        if world.topology.wrap:
+            cx %= world.width
+            cy %= world.height
+        else:
+            cx = min(max(cx, 0), world.width - 1)
+            cy = min(max(cy, 0), world.height - 1)
+        return distance, world.grid[cy][cx]
 
-        dx1, dy1 = self.world.get_offset_in_direction(self.cell.x, self.cell.y, dir1)
-        dx2, dy2 = self.world.get_offset_in_direction(self.cell.x, self.cell.y, dir2)
 
-        scale = dir % 1
+def is_binary_map(filename):
+    return isinstance(filename, str) and (
+        filename.endswith('.npz') or os.path.isdir(filename))
 
-        x = self.x + distance * (dx2 * scale + dx1 * (1 - scale))
-        y = self.y + distance * (dy2 * scale + dy1 * (1 - scale))
+
+def read_ascii_map(filename=None, map=None):
+    if filename:
+        if isinstance(filename, str):
+            with open(filename) as f:
+                lines = f.read().splitlines()
+        else:
+            lines = filename.read().splitlines()
+    else:
+        lines = map.splitlines()
+        if len(lines[0]) == 0:
+            del lines[0]
+    return [x.rstrip() for x in lines]
+
+
+def read_binary_map(filename, mmap_mode='c'):
+    """The arrays of a map written by World.save_binary, by field name.
+
+    .npy directories are memory-mapped with mmap_mode; the default 'c' is
+    copy-on-write, so changes to the world are not written back.
+    """
+    if filename.endswith('.npz'):
+        with np.load(filename) as data:
+            return dict(data.items())
+    arrays = {}
+    for name in sorted(os.listdir(filename)):
+        if name.endswith('.npy'):
+            arrays[name[:-4]] = np.load(os.path.join(filename, name), mmap_mode=mmap_mode)
+    if not arrays:
+        raise CellularException('No .npy files in %s' % filename)
+    return arrays
+
+
+def _combination_keys(arrays):
+    """Number the distinct combinations of values across same-shaped arrays.
+
+    Returns an array of keys shaped like the inputs, and the combination of
+    values for each key.
+    """
+    shape = np.shape(arrays[0])
+    flat = [np.asarray(a).reshape(-1) for a in arrays]
+    if all(a.dtype.kind in 'bu' for a in flat):
+        # mixed-radix keys are small enough to count without sorting
+        sizes = [int(a.max()) + 1 if a.size else 1 for a in flat]
+        if np.prod(sizes, dtype=float) < 2 ** 24:
+            key = np.ravel_multi_index(flat, sizes)
+            used = np.flatnonzero(np.bincount(key))
+            lookup = np.zeros(int(np.prod(sizes)), dtype=np.intp)
+            lookup[used] = np.arange(len(used))
+            values = np.unravel_index(used, sizes)
+            combos = list(zip(*[v.astype(a.dtype).tolist()
+                                for v, a in zip(values, flat)]))
+            return lookup[key].reshape(shape), combos
+    combos, inverse = np.unique(np.stack(flat, axis=-1), axis=0, return_inverse=True)
+    return inverse.reshape(shape), [tuple(c) for c in combos.tolist()]
+
+
+class ContinuousAgent(Agent):
+    continuous = True
+
+    def go_in_direction(self, dir, distance=1, return_obstacle=False):
+        topology = self.world.topology
+        dx, dy = topology.vector(self.cell.y, dir)
+        x = self.x + distance * dx
+        y = self.y + distance * dy
+
+        if not topology.wrap and not topology.contains(x, y):
+            # the edge of a bounded world is an obstacle; its cell stands in
+            # for the wall
+            if return_obstacle:
+                return self.cell
+            return False
 
         closest = self.cell
         dist = (x - self.cell.x) ** 2 + (y - self.cell.y) ** 2
@@ -357,7 +1263,110 @@ class ContinuousAgent(Agent):
     def go_backward(self, distance=1):
         return self.go_in_direction(self.dir, distance=-distance)
 
-    def detect(self, direction, max_distance=None):
+    # 'ray' casts exactly through the grid, 'march' is the original
+    # step-halving search and 'compare' runs both, keeping any disagreements
+    # in self.detect_mismatches.  'field' looks the distance up in the
+    # world's SensorField, casting a ray when it has none or max_distance
+    # is out of its range.  Hex worlds always use 'march'.
+    #
+    # 'ray' changes what an existing model senses, not just how fast: the
+    # marcher steps a whole cell at a time and tunnels through wall
+    # corners, so with max_distance=4 the ray sees a nearer wall on about
+    # 15% of reads on colour_critter's mymap with 4 directions and 10-20%
+    # on random mazes, and a further one on under 1% (measured with
+    # 'compare', see benchmarks/bench_detect.py).  Set detect_method to
+    # 'march' on an agent or this class to keep the original readings.
+    detect_method = 'ray'
+    detect_tolerance = 1.0 / 32
+
+    def detect(self, direction, max_distance=None, method=None):
+        if method is None:
+            method = self.detect_method
+        if method == 'field':
+            field = self.world.sensor_field
+            if (field is not None and max_distance is not None
+                    and max_distance <= field.max_distance):
+                return field.detect(self.x, self.y, direction, max_distance)
+            method = 'ray'
+        if method == 'march' or self.world.directions == 6:
+            return self.march(direction, max_distance)
+        elif method == 'ray':
+            return self.cast_ray(direction, max_distance)
+        elif method == 'compare':
+            ray = self.cast_ray(direction, max_distance)
+            march = self.march(direction, max_distance)
+            if not self.detections_agree(ray, march, max_distance):
+                if 'detect_mismatches' not in self.__dict__:
+                    self.detect_mismatches = []
+                self.detect_mismatches.append(
+                    (self.x, self.y, direction, ray, march))
+            return ray
+        raise CellularException('Unknown detect method %r' % method)
+
+    def detections_agree(self, a, b, max_distance=None):
+        if max_distance is None:
+            max_distance = self.world.width + self.world.height
+        if abs(a[0] - b[0]) > self.detect_tolerance:
+            return False
+        if a[1] is not b[1]:
+            # a wall right at the range limit may be seen by only one of them
+            return min(a[0], b[0]) >= max_distance - self.detect_tolerance
+        return True
+
+    def cast_ray(self, direction, max_distance=None):
+        world = self.world
+        if max_distance is None:
+            max_distance = world.width + world.height
+
+        dx, dy = world.topology.vector(self.cell.y, direction)
+
+        # cells are centred on integer coordinates, so shift by half a cell
+        # and walk the cell boundaries the ray crosses (Amanatides & Woo)
+        px = self.x + 0.5
+        py = self.y + 0.5
+        ix = int(math.floor(px))
+        iy = int(math.floor(py))
+        if dx > 0:
+            step_x, t_x, dt_x = 1, (ix + 1 - px) / dx, 1.0 / dx
+        elif dx < 0:
+            step_x, t_x, dt_x = -1, (ix - px) / dx, -1.0 / dx
+        else:
+            step_x, t_x, dt_x = 0, math.inf, math.inf
+        if dy > 0:
+            step_y, t_y, dt_y = 1, (iy + 1 - py) / dy, 1.0 / dy
+        elif dy < 0:
+            step_y, t_y, dt_y = -1, (iy - py) / dy, -1.0 / dy
+        else:
+            step_y, t_y, dt_y = 0, math.inf, math.inf
+
+        grid = world.grid
+        walls = world.arrays['wall'] if world.arrays is not None else None
+        width = world.width
+        height = world.height
+        wrap = world.topology.wrap
+        while True:
+            if t_x < t_y:
+                t = t_x
+                ix += step_x
+                t_x += dt_x
+            else:
+                t = t_y
+                iy += step_y
+                t_y += dt_y
+            if t >= max_distance:
+                return float(max_distance), None
+            if not wrap and not (0 <= ix < width and 0 <= iy < height):
+                # the edge of a bounded world stops the ray at the edge cell
+                return (t * math.sqrt(dx * dx + dy * dy),
+                        grid[min(max(iy, 0), height - 1)][min(max(ix, 0), width - 1)])
+            if walls is None:
+                cell = grid[iy % height][ix % width]
+                if cell.wall:
+                    return t * math.sqrt(dx * dx + dy * dy), cell
+            elif walls[iy % height, ix % width]:
+                return t * math.sqrt(dx * dx + dy * dy), grid[iy % height][ix % width]
+
+    def march(self, direction, max_distance=None):
         start_x = self.x
         start_y = self.y
         cell = self.cell
@@ -396,66 +1405,499 @@ class ContinuousAgent(Agent):
         return math.sqrt(dx ** 2 + dy ** 2)
 
 
-import nengo
+class AgentBatch(object):
+    """Steps many ContinuousAgents at once using arrays.
+
+    The positions, headings and speeds of the agents are held in arrays and
+    moved together by step(), which follows the same rule as
+    ContinuousAgent.go_in_direction: an agent moves to the closest of its
+    cell and that cell's neighbours, unless that cell is a wall, in which
+    case it does not move.  The Agent objects themselves are only updated
+    by sync().
+    """
+
+    def __init__(self, world, agents):
+        self.world = world
+        self.agents = list(agents)
+        # (parity, direction, xy) offsets, and the same with the cell itself
+        # prepended as the first candidate of every move
+        self.offsets = world.topology.table.astype(float)
+        self.candidates = np.concatenate(
+            [np.zeros((2, 1, 2)), self.offsets], axis=1)
+        self.refresh_walls()
+        self.pull()
+
+    @classmethod
+    def spawn(cls, world, n, agent_class=None, **kwargs):
+        """Add n new agents to the world and return a batch holding them."""
+        if agent_class is None:
+            agent_class = ContinuousAgent
+        agents = []
+        for i in range(n):
+            agent = agent_class()
+            world.add(agent, **kwargs)
+            agents.append(agent)
+        return cls(world, agents)
+
+    def __len__(self):
+        return len(self.agents)
+
+    def refresh_walls(self):
+        self.walls = self.world.get_array('wall').astype(bool)
+
+    def pull(self):
+        """Read the state of the Agent objects into the arrays."""
+        agents = self.agents
+        self.x = np.array([a.x for a in agents], dtype=float)
+        self.y = np.array([a.y for a in agents], dtype=float)
+        self.dir = np.array([a.dir for a in agents], dtype=float)
+        self.speed = np.array([getattr(a, 'speed', 0.0) for a in agents], dtype=float)
+        self.cell_x = np.array([a.cell.x for a in agents], dtype=int)
+        self.cell_y = np.array([a.cell.y for a in agents], dtype=int)
+
+    def sync(self):
+        """Write the arrays back to the Agent objects."""
+        grid = self.world.grid
+        for i, a in enumerate(self.agents):
+            cx = int(self.cell_x[i])
+            cy = int(self.cell_y[i])
+            if a.cell.x != cx or a.cell.y != cy:
+                a.cell = grid[cy][cx]
+            a.x = float(self.x[i])
+            a.y = float(self.y[i])
+            a.dir = float(self.dir[i])
 
+    def turn(self, amount):
+        self.dir = (self.dir + amount) % self.world.directions
 
-# GridNode sets up the pacman world for visualization
-class GridNode(nengo.Node):
-    def __init__(self, world, dt=0.001):
+    def step(self, dt=1.0):
+        """Move every agent speed * dt along its heading.
+
+        Returns a boolean array of the agents that moved.
+        """
+        return self.go_in_direction(self.dir, self.speed * dt)
+
+    def go_in_direction(self, dir, distance):
+        directions = self.world.directions
+        dir1 = np.floor(dir).astype(int) % directions
+        dir2 = (dir1 + 1) % directions
+        scale = (dir % 1)[:, None]
+        parity = self.cell_y % 2
+        v = (self.offsets[parity, dir1] * (1 - scale) +
+             self.offsets[parity, dir2] * scale)
+        distance = np.asarray(distance, dtype=float)
+        x = self.x + distance * v[:, 0]
+        y = self.y + distance * v[:, 1]
+
+        # closest of the current cell and its neighbours
+        cand = self.candidates[parity]
+        cand_x = self.cell_x[:, None] + cand[:, :, 0]
+        cand_y = self.cell_y[:, None] + cand[:, :, 1]
+        d2 = (x[:, None] - cand_x) ** 2 + (y[:, None] - cand_y) ** 2
+        best = np.argmin(d2, axis=1)
+        rows = np.arange(len(best))
+        world = self.world
+        cx = cand_x[rows, best].astype(int)
+        cy = cand_y[rows, best].astype(int)
+        if world.topology.wrap:
+            cx %= world.width
+            cy %= world.height
+            moved = (best == 0) | ~self.walls[cy, cx]
+        else:
+            inside = ((x >= -0.5) & (x < world.width - 0.5) &
+                      (y >= -0.5) & (y < world.height - 0.5))
+            np.clip(cx, 0, world.width - 1, out=cx)
+            np.clip(cy, 0, world.height - 1, out=cy)
+            moved = inside & ((best == 0) | ~self.walls[cy, cx])
+        self.x[moved] = x[moved]
+        self.y[moved] = y[moved]
+        self.cell_x[moved] = cx[moved]
+        self.cell_y[moved] = cy[moved]
+        return moved
+
+
+class ColourTracker(object):
+    """Turns the coloured cells agents stand on into events.
+
+    Keeps a cell field, by default cellcolor, as a flat array of colour ids
+    (0 for none) and the cell index and colour of every agent.  Each update
+    compares the agents' cell indices with the previous ones, and only the
+    agents that changed cell look their colour up.  An agent whose colour
+    changed gets an 'exit' event for the old colour and an 'enter' event for
+    the new one, colour 0 having none.  counts holds how many distinct
+    colours each agent has entered, events the (t, agent, kind, colour)
+    events not yet taken by pop_events(), and listeners are called with
+    each event as it happens.
+
+    Called with the time, as a node output or from a loop around
+    World.update, it reads the agents' cells; update() takes the flat cell
+    indices directly, such as cell_y * width + cell_x of an AgentBatch.
+    Changed colours are picked up through World.watch.
+    """
+
+    def __init__(self, world, agents=None, field='cellcolor'):
+        self.world = world
+        self.agents = list(world.agents if agents is None else agents)
+        self.field = field
+        self.dirty = world.watch()
+        self.ids = None
+        n = len(self.agents)
+        self.index = np.full(n, -1, dtype=np.int64)
+        self.colour = np.zeros(n, dtype=np.int64)
+        self.seen = np.zeros((n, 1), dtype=bool)
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.events = []
+        self.listeners = []
+
+    def close(self):
+        if self.dirty is not None:
+            self.world.unwatch(self.dirty)
+            self.dirty = None
+
+    def refresh(self):
+        """Bring the colour ids up to date with the cells marked dirty."""
+        world = self.world
+        if self.ids is None or None in self.dirty:
+            self.ids = np.array(world.get_array(self.field), dtype=np.int64).reshape(-1)
+        else:
+            for x, y in self.dirty:
+                self.ids[y * world.width + x] = getattr(world.grid[y][x], self.field)
+        self.dirty.clear()
+        top = int(self.ids.max(initial=0)) + 1
+        if top > self.seen.shape[1]:
+            seen = np.zeros((len(self.agents), top), dtype=bool)
+            seen[:, :self.seen.shape[1]] = self.seen
+            self.seen = seen
+
+    def __call__(self, t=None):
+        width = self.world.width
+        return self.update([a.cell.y * width + a.cell.x for a in self.agents], t)
+
+    def update(self, indices, t=None):
+        """
+        Move the agents to the cells at indices.
+        :return: the number of events
+        :rtype: int
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.dirty:
+            # colours may have changed under agents that did not move
+            self.refresh()
+            changed = np.arange(len(indices))
+        else:
+            changed = np.flatnonzero(indices != self.index)
+            if not len(changed):
+                return 0
+        self.index[changed] = indices[changed]
+        new = self.ids[indices[changed]]
+        old = self.colour[changed]
+        differ = new != old
+        if not differ.any():
+            return 0
+        changed = changed[differ]
+        self.colour[changed] = new[differ]
+        count = 0
+        for agent, before, after in zip(changed.tolist(), old[differ].tolist(),
+                                        new[differ].tolist()):
+            if before:
+                self._emit((t, agent, 'exit', before))
+                count += 1
+            if after:
+                if not self.seen[agent, after]:
+                    self.seen[agent, after] = True
+                    self.counts[agent] += 1
+                self._emit((t, agent, 'enter', after))
+                count += 1
+        return count
+
+    def _emit(self, event):
+        self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+
+    def pop_events(self):
+        """The events since the last call."""
+        events = self.events
+        self.events = []
+        return events
+
+    def checkpoint_state(self):
+        return dict(index=self.index, colour=self.colour, seen=self.seen, counts=self.counts)
+
+    def restore_state(self, state):
+        self.index = state['index'].astype(np.int64)
+        self.colour = state['colour'].astype(np.int64)
+        self.seen = state['seen'].astype(bool)
+        self.counts = state['counts'].astype(np.int64)
+        self.events = []
 
-        # The initalizer sets up the html layout for display
-        def svg(t):
-            last_t = getattr(svg, '_nengo_html_t_', None)
-            if last_t is None or t >= last_t + dt or t <= last_t:
-                svg._nengo_html_ = self.generate_svg(world)
-                svg._nengo_html_t_ = t
 
-        super(GridNode, self).__init__(svg)
+import nengo
 
-    # This function sets up an SVG (used to embed html code in the environment)
-    def generate_svg(self, world):
-        cells = []
-        # Runs through every cell in the world (walls & food)
-        for i in range(world.width):
-            for j in range(world.height):
-                cell = world.get_cell(i, j)
-                color = cell.color
-                if callable(color):
-                    color = color()
-
-                if color is not None:
-                    cells.append('<rect x=%d y=%d width=1 height=1 style="fill:%s"/>' %
-                                 (i, j, color))
-
-        # Runs through every agent in the world
+
+class SVGRenderer(object):
+    """Builds the SVG view of a World, re-rendering only what changed.
+
+    The coloured cells are cached as SVG fragments and only the cells the
+    World marks dirty (see World.watch) are re-coloured; the agents are
+    re-rendered only when one of them moved, turned or changed colour, and
+    the previous frame is returned as-is when nothing did.  With
+    incremental=False every frame is rebuilt from scratch.
+    """
+
+    def __init__(self, world, incremental=True):
+        self.world = world
+        self.incremental = incremental
+        self.dirty = world.watch() if incremental else None
+        self.cells = {}
+        self.cells_svg = None
+        self.agent_state = None
+        self.agents_svg = None
+        self.svg = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.cached_frames = 0
+        self.render_time = 0.0
+        self.bytes_built = 0
+        self.bytes_out = 0
+
+    def stats(self):
+        frames = max(self.frames, 1)
+        return dict(frames=self.frames,
+                    cached_frames=self.cached_frames,
+                    render_time=self.render_time,
+                    time_per_frame=self.render_time / frames,
+                    bytes_built_per_frame=self.bytes_built / float(frames),
+                    bytes_out_per_frame=self.bytes_out / float(frames))
+
+    def close(self):
+        if self.dirty is not None:
+            self.world.unwatch(self.dirty)
+            self.dirty = None
+
+    def cell_svg(self, cell):
+        color = cell.color
+        if callable(color):
+            color = color()
+        if color is None:
+            return None
+        return ('<rect x=%d y=%d width=1 height=1 style="fill:%s"/>' %
+                (cell.x, cell.y, color))
+
+    def agent_svg(self, agent, direction, color):
+        shape = getattr(agent, 'shape', 'triangle')
+        if shape == 'triangle':
+            return ('<polygon points="0.25,0.25 -0.25,0.25 0,-0.5"'
+                    ' style="fill:%s" transform="translate(%f,%f) rotate(%f)"/>'
+                    % (color, agent.x + 0.5, agent.y + 0.5, direction))
+        elif shape == 'circle':
+            return ('<circle '
+                    ' style="fill:%s" cx="%f" cy="%f" r="0.4"/>'
+                    % (color, agent.x + 0.5, agent.y + 0.5))
+
+    def update_cells(self):
+        world = self.world
+        built = 0
+        if not self.incremental or None in self.dirty:
+            self.cells = {}
+            for i in range(world.width):
+                for j in range(world.height):
+                    svg = self.cell_svg(world.get_cell(i, j))
+                    if svg is not None:
+                        self.cells[(i, j)] = svg
+                        built += len(svg)
+        else:
+            for (i, j) in self.dirty:
+                svg = self.cell_svg(world.get_cell(i, j))
+                if svg is None:
+                    self.cells.pop((i, j), None)
+                else:
+                    self.cells[(i, j)] = svg
+                    built += len(svg)
+        if self.dirty is not None:
+            self.dirty.clear()
+        self.cells_svg = ''.join(self.cells.values())
+        return built
+
+    def update_agents(self, state):
         agents = []
-        for agent in world.agents:
+        for agent, (x, y, direction, color) in zip(self.world.agents, state):
+            agents.append(self.agent_svg(agent, direction, color))
+        self.agent_state = state
+        self.agents_svg = ''.join(agents)
+        return len(self.agents_svg)
+
+    def render(self):
+        start = time.perf_counter()
+        world = self.world
 
-            # sets variables like agent direction, color and size
-            direction = agent.dir * 360.0 / world.directions
+        state = []
+        for agent in world.agents:
             color = getattr(agent, 'color', 'blue')
             if callable(color):
                 color = color()
+            state.append((agent.x, agent.y,
+                          agent.dir * 360.0 / world.directions, color))
+
+        built = 0
+        changed = False
+        if self.cells_svg is None or not self.incremental or self.dirty:
+            built += self.update_cells()
+            changed = True
+        if not self.incremental or state != self.agent_state:
+            built += self.update_agents(state)
+            changed = True
+
+        if changed:
+            # Sets up the environment as a HTML SVG
+            self.svg = ('''<svg style="background: white" width="100%%" height="100%%" viewbox="0 0 %d %d">
+            %s
+            %s
+            </svg>''' % (world.width, world.height, self.cells_svg, self.agents_svg))
+        else:
+            self.cached_frames += 1
 
-            shape = getattr(agent, 'shape', 'triangle')
+        self.frames += 1
+        self.bytes_built += built
+        self.bytes_out += len(self.svg)
+        self.render_time += time.perf_counter() - start
+        return self.svg
 
-            if shape == 'triangle':
 
-                agent_poly = ('<polygon points="0.25,0.25 -0.25,0.25 0,-0.5"'
-                              ' style="fill:%s" transform="translate(%f,%f) rotate(%f)"/>'
-                              % (color, agent.x + 0.5, agent.y + 0.5, direction))
+class GridOutput(object):
+    """Output function of a GridNode.
 
-            elif shape == 'circle':
-                agent_poly = ('<circle '
-                              ' style="fill:%s" cx="%f" cy="%f" r="0.4"/>'
-                              % (color, agent.x + 0.5, agent.y + 0.5))
+    Re-renders the world at most every dt seconds into _nengo_html_, which
+    is what nengo_gui's HTMLView displays.
+    """
 
-            agents.append(agent_poly)
+    def __init__(self, world, dt=0.001):
+        self.world = world
+        self.dt = dt
+        self.renderer = None
+        self._nengo_html_ = ''
+        self._nengo_html_t_ = None
+
+    def __call__(self, t):
+        last_t = self._nengo_html_t_
+        if last_t is None or t >= last_t + self.dt or t <= last_t:
+            self._nengo_html_ = self.generate_svg(self.world)
+            self._nengo_html_t_ = t
 
-        # Sets up the environment as a HTML SVG
-        svg = '''<svg style="background: white" width="100%%" height="100%%" viewbox="0 0 %d %d">
-            %s
-            %s
-            </svg>''' % (world.width, world.height,
-                         ''.join(cells), ''.join(agents))
-        return svg
+    def generate_svg(self, world):
+        if self.renderer is None or self.renderer.world is not world:
+            if self.renderer is not None:
+                self.renderer.close()
+            self.renderer = SVGRenderer(world)
+        return self.renderer.render()
+
+
+# GridNode sets up the pacman world for visualization
+class GridNode(nengo.Node):
+    grid_output = None
+
+    def __init__(self, world, dt=0.001):
+
+        # The initalizer sets up the html layout for display
+        output = GridOutput(world, dt)
+        super(GridNode, self).__init__(output)
+        # nengo_gui replaces self.output, so keep our own reference
+        self.grid_output = output
+
+    @property
+    def renderer(self):
+        return self.grid_output.renderer
+
+    # This function sets up an SVG (used to embed html code in the environment)
+    def generate_svg(self, world):
+        return self.grid_output.generate_svg(world)
+
+
+class BridgeOutput(object):
+    """Output function of a SensorBridge.
+
+    Takes the agent's commands (speed, rotation, run) and returns its
+    sensors in one preallocated array: the radar distances, the colour of
+    its cell, its x, y and its heading.  With every > 1 the world is only
+    stepped every that many ticks, applying the commands summed over them,
+    and the sensors are held in between.
+    """
+
+    def __init__(self, world, body, radar=(-0.5, 0.0, 0.5), max_distance=4,
+                 dt=0.001, max_speed=10.0, max_rotate=10.0, every=1):
+        self.world = world
+        self.body = body
+        self.radar = tuple(radar)
+        self.max_distance = max_distance
+        self.dt = dt
+        self.max_speed = max_speed
+        self.max_rotate = max_rotate
+        self.every = every
+        self.ticks = 0
+        self.speed = 0.0
+        self.rotation = 0.0
+        self.output = np.zeros(len(self.radar) + 4)
+        self.sense()
+
+    def __call__(self, t, x):
+        speed, rotation, run = x
+        self.speed += speed * run
+        self.rotation += rotation * run
+        self.ticks += 1
+        if self.ticks >= self.every:
+            body = self.body
+            body.turn(self.rotation * self.dt * self.max_rotate)
+            body.go_forward(self.speed * self.dt * self.max_speed)
+            self.ticks = 0
+            self.speed = self.rotation = 0.0
+            self.sense()
+        return self.output
+
+    def sense(self):
+        body = self.body
+        output = self.output
+        directions = self.world.directions
+        n = len(self.radar)
+        for i, angle in enumerate(self.radar):
+            output[i] = body.detect((body.dir + angle) % directions,
+                                    max_distance=self.max_distance)[0]
+        output[n] = getattr(body.cell, 'cellcolor', 0)
+        output[n + 1] = body.x
+        output[n + 2] = body.y
+        output[n + 3] = body.dir
+
+    def checkpoint_state(self):
+        return dict(ticks=self.ticks, speed=self.speed, rotation=self.rotation,
+                    output=self.output)
+
+    def restore_state(self, state):
+        self.ticks = int(state['ticks'])
+        self.speed = float(state['speed'])
+        self.rotation = float(state['rotation'])
+        self.output[...] = state['output']
+
+
+# SensorBridge replaces the separate movement, radar and colour nodes with
+# one node, which is cheaper to call every step in long headless runs
+class SensorBridge(nengo.Node):
+    bridge_output = None
+    # slices of the output for each sensor
+    radar = None
+    colour = None
+    position = None
+    heading = None
+
+    def __init__(self, world, body, radar=(-0.5, 0.0, 0.5), max_distance=4,
+                 dt=0.001, max_speed=10.0, max_rotate=10.0, every=1, label=None):
+        output = BridgeOutput(world, body, radar, max_distance, dt, max_speed,
+                              max_rotate, every)
+        super(SensorBridge, self).__init__(output, size_in=3, size_out=len(output.output),
+                                           label=label)
+        self.bridge_output = output
+        n = len(output.radar)
+        self.radar = slice(0, n)
+        self.colour = slice(n, n + 1)
+        self.position = slice(n + 1, n + 3)
+        self.heading = slice(n + 3, n + 4)
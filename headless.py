@@ -0,0 +1,321 @@
+"""Run colour_critter trials without nengo_gui.
+
+Each trial builds a fresh world, critter and model from its parameters,
+runs nengo.Simulator for a fixed duration and records the outcome.  Trials
+can be fanned out over a process pool and the results are streamed to a
+CSV or JSONL file as they finish:
+
+    python headless.py --trials 1000 --duration 10 --out results.jsonl
+    python headless.py --map maze.txt --start random --max-colours 2 3 4 \\
+        --trials 50 --out sweep.csv
+    python headless.py --duration 3600 --cache-dir builds \\
+        --checkpoint-dir checkpoints --checkpoint-every 60
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+import checkpoint
+import colour_critter
+import decoder_cache
+import viewer
+
+fields = ('trial', 'seed', 'map', 'start_x', 'start_y', 'dir', 'max_colours',
+          'duration', 'stopped', 'time_to_stop', 'colours_counted',
+          'colours_seen', 'time_to_count', 'stopped_correctly', 'path_length',
+          'neurons', 'build_time', 'run_time', 'decoder_hit_rate')
+
+
+_builder = colour_critter.CritterBuilder(memory=False)
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+
+def run_trial(trial=0, seed=0, map=None, map_name='mymap', start=(1, 2), dir=2,
+              max_colours=colour_critter.MAX_COLOURS, duration=10.0, dt=0.001,
+              stop_threshold=0.5, warmup=0.1, bridge=1, sensor_field=False, counter='neural',
+              builder=None,
+              checkpoint_dir=None, checkpoint_every=None, record_dir=None,
+              frames_dir=None, frame_every=40, frame_scale=4, model_params=None, view=None):
+    """
+    Builds and runs one trial.  It stopped correctly if it stopped no
+    sooner than it stood on its max_colours-th colour (time_to_count), or
+    never stood on that many colours and did not stop.
+    :param start: (x, y) of the starting cell, or None for a random free cell
+    :param stop_threshold: the critter counts as stopped once the decoded
+        output of the stop ensemble falls below this after warmup seconds
+    :param bridge: step the world through one grid.SensorBridge every this
+        many ticks; 0 for colour_critter's separate nodes
+    :param sensor_field: read the radar from a grid.SensorField
+    :param counter: 'neural', or 'reference' to count colours exactly with
+        a grid.ColourTracker instead, see colour_critter.build_model
+    :param builder: the CritterBuilder to build with, by default one per
+        process without a cache
+    :param checkpoint_dir: save the trial to trial-<trial>.npz here every
+        checkpoint_every seconds of simulated time, and resume from it if it
+        exists.  Resuming in a new process needs the same build, so the
+        builder needs a cache_dir; otherwise the trial starts over.
+    :param record_dir: record the critter to trial-<trial> here, see
+        recording.Recorder
+    :param frames_dir: save a PNG of the world to trial-<trial> here every
+        frame_every steps, frame_scale pixels per cell
+    :param model_params: D, n_neurons and the other build_model parameters
+        to build with, as a dict
+    :param view: a viewer.ViewServer to show the trial on as trial-<trial>,
+        which only works in the process running the server
+    :return: the outcome, with the keys in fields
+    :rtype: dict
+    """
+    if builder is None:
+        builder = _builder
+    start_build = time.perf_counter()
+    critter = builder.build(map=colour_critter.mymap if map is None else map,
+                            start=start, dir=dir, max_colours=max_colours,
+                            seed=seed, dt=dt, bridge=bridge, sensor_field=sensor_field,
+                            counter=counter, **(model_params or {}))
+    seed_everything(seed)
+    sim = critter.sim
+    recorders = []
+    if record_dir is not None:
+        recorders.append(critter.record(os.path.join(record_dir, 'trial-%d' % trial)))
+    if frames_dir is not None:
+        recorders.append(critter.export_frames(os.path.join(frames_dir, 'trial-%d' % trial),
+                                               scale=frame_scale, every=frame_every))
+    if view is not None:
+        recorders.append(critter.stream(view, 'trial-%d' % trial))
+    with sim:
+        build_time = time.perf_counter() - start_build
+        start_run = time.perf_counter()
+        if checkpoint_dir is None:
+            sim.run(duration)
+        else:
+            filename = os.path.join(checkpoint_dir, 'trial-%d.npz' % trial)
+            try:
+                checkpoint.run(sim, duration, critter.world, filename, every=checkpoint_every)
+            except checkpoint.CheckpointError:
+                checkpoint.run(sim, duration, critter.world, filename, every=checkpoint_every,
+                               resume=False)
+        run_time = time.perf_counter() - start_run
+        for recorder in recorders:
+            recorder.close()
+        t = sim.trange()
+        stop = sim.data[critter.stop_probe][:, 0]
+        counter = sim.data[critter.counter_probe][:, 0]
+
+    stopped = np.flatnonzero((t > warmup) & (stop < stop_threshold))
+    time_to_stop = float(t[stopped[0]]) if len(stopped) else None
+    times = critter.tracker.times
+    time_to_count = times[max_colours - 1] if len(times) >= max_colours else None
+    if time_to_count is None:
+        stopped_correctly = time_to_stop is None
+    else:
+        stopped_correctly = time_to_stop is not None and time_to_stop >= time_to_count
+    decoder_stats = critter.decoder_stats or {}
+    return dict(
+        trial=trial, seed=seed, map=map_name,
+        start_x=critter.tracker.start_x, start_y=critter.tracker.start_y,
+        dir=dir, max_colours=max_colours, duration=duration,
+        stopped=time_to_stop is not None, time_to_stop=time_to_stop,
+        colours_counted=int(round(counter[-1])),
+        colours_seen=len(critter.tracker.colours),
+        time_to_count=time_to_count, stopped_correctly=stopped_correctly,
+        path_length=critter.tracker.path_length,
+        neurons=sum(e.n_neurons for e in critter.model.all_ensembles),
+        build_time=build_time, run_time=run_time,
+        decoder_hit_rate=decoder_stats.get('hit_rate'))
+
+
+def _run_trial(kwargs):
+    return run_trial(**kwargs)
+
+
+def _init_worker(base_seed, cache_dir, decoder_dir=None, decoder_size=None):
+    global _builder
+    decoders = None
+    if decoder_dir is not None:
+        decoders = decoder_cache.DecoderCache(decoder_dir, size=decoder_size)
+    _builder = colour_critter.CritterBuilder(
+        cache_dir=cache_dir, memory=False, decoder_cache=decoders)
+    # trials seed themselves; this only keeps stray RNG use in a worker
+    # from being identical across workers
+    seed_everything(base_seed + os.getpid())
+
+
+def make_trials(maps, starts, max_colours, trials, duration, seed=0, dir=2, bridge=1,
+                sensor_field=False, counter='neural', checkpoint_dir=None, checkpoint_every=None,
+                record_dir=None, frames_dir=None, frame_every=40, frame_scale=4, view=None):
+    """
+    One set of run_trial arguments for each repeat of each combination of
+    map, start and max_colours.  Seeds depend only on the trial number, so
+    results do not depend on how trials are spread over workers.
+    """
+    combos = itertools.product(maps, starts, max_colours, range(trials))
+    for i, ((map_name, map), start, n_colours, repeat) in enumerate(combos):
+        yield dict(trial=i, seed=seed + i, map=map, map_name=map_name,
+                   start=start, dir=dir, max_colours=n_colours,
+                   duration=duration, bridge=bridge, sensor_field=sensor_field,
+                   counter=counter,
+                   checkpoint_dir=checkpoint_dir,
+                   checkpoint_every=checkpoint_every, record_dir=record_dir,
+                   frames_dir=frames_dir, frame_every=frame_every, frame_scale=frame_scale,
+                   view=view)
+
+
+class ResultWriter(object):
+    """Appends results to a CSV or JSONL file, flushing after each one."""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'w', newline='')
+        self.csv = None
+        if filename.endswith('.csv'):
+            self.csv = csv.DictWriter(self.file, fieldnames=fields)
+            self.csv.writeheader()
+
+    def write(self, result):
+        if self.csv is not None:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_trials(trials, out, workers=None, seed=0, cache_dir=None,
+               decoder_dir=None, decoder_size=None):
+    """
+    Runs the trials over a pool of workers, writing each result to out as
+    soon as it finishes.  Returns the number of trials run.
+    :param cache_dir: directory for CritterBuilder to keep built models in,
+        so reruns with the same parameters and seeds skip the build
+    :param decoder_dir: directory for a decoder_cache.DecoderCache of at
+        most decoder_size, shared by the workers
+    """
+    init_args = (seed, cache_dir, decoder_dir, decoder_size)
+    writer = ResultWriter(out)
+    count = 0
+    try:
+        if workers == 1:
+            _init_worker(*init_args)
+            results = map(_run_trial, trials)
+            for result in results:
+                writer.write(result)
+                count += 1
+        else:
+            with multiprocessing.Pool(workers, _init_worker, init_args) as pool:
+                for result in pool.imap_unordered(_run_trial, trials):
+                    writer.write(result)
+                    count += 1
+    finally:
+        writer.close()
+    return count
+
+
+def parse_start(text):
+    if text == 'random':
+        return None
+    x, y = text.split(',')
+    return int(x), int(y)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--map', nargs='*', default=[],
+                        help='ASCII map files (default: colour_critter.mymap)')
+    parser.add_argument('--start', nargs='*', type=parse_start, default=[(1, 2)],
+                        help='starting cells as x,y, or "random"')
+    parser.add_argument('--dir', type=int, default=2)
+    parser.add_argument('--max-colours', nargs='*', type=int,
+                        default=[colour_critter.MAX_COLOURS])
+    parser.add_argument('--trials', type=int, default=1,
+                        help='repeats of each map/start/max-colours combination')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--bridge', type=int, default=1,
+                        help='step the world every this many ticks through one '
+                             'bridge node (0: separate nodes, as in the GUI)')
+    parser.add_argument('--sensor-field', action='store_true',
+                        help='read the radar from a precomputed grid.SensorField')
+    parser.add_argument('--counter', choices=('neural', 'reference'), default='neural',
+                        help='count colours with the SPA model, or exactly with a '
+                             'grid.ColourTracker')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--out', default='results.jsonl',
+                        help='output file, .csv or .jsonl')
+    parser.add_argument('--cache-dir', default=None,
+                        help='keep built models here to skip rebuilding on reruns')
+    parser.add_argument('--decoder-cache', default=None,
+                        help='keep solved decoders here (default: nengo\'s cache)')
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help='checkpoint trials here and resume them on reruns '
+                             '(needs --cache-dir to resume after a restart)')
+    parser.add_argument('--checkpoint-every', type=float, default=None,
+                        help='seconds of simulated time between checkpoints '
+                             '(default: only at the end)')
+    parser.add_argument('--record-dir', default=None,
+                        help='record every step of each trial here, '
+                             'see recording.py for replaying them')
+    parser.add_argument('--frames-dir', default=None,
+                        help='save PNG frames of each trial here')
+    parser.add_argument('--frame-every', type=int, default=40,
+                        help='steps between frames')
+    parser.add_argument('--frame-scale', type=int, default=4,
+                        help='pixels per cell')
+    parser.add_argument('--view', type=int, default=None, metavar='PORT',
+                        help='show each trial live in a browser on this port, '
+                             'see viewer.py (runs the trials in this process)')
+    parser.add_argument('--decoder-cache-size', default='512 MB',
+                        help='evict least recently used decoders past this size')
+    args = parser.parse_args(args)
+
+    maps = [('mymap', colour_critter.mymap)]
+    if args.map:
+        maps = []
+        for filename in args.map:
+            with open(filename) as f:
+                maps.append((os.path.basename(filename), f.read()))
+
+    view = None
+    if args.view is not None:
+        if args.workers not in (None, 1):
+            parser.error('--view runs the trials in this process; drop --workers')
+        args.workers = 1
+        view = viewer.ViewServer(port=args.view).start()
+        print('watch at %s' % view.url)
+
+    trials = make_trials(maps, args.start, args.max_colours, args.trials,
+                         args.duration, seed=args.seed, dir=args.dir,
+                         bridge=args.bridge, sensor_field=args.sensor_field,
+                         counter=args.counter,
+                         checkpoint_dir=args.checkpoint_dir,
+                         checkpoint_every=args.checkpoint_every,
+                         record_dir=args.record_dir, frames_dir=args.frames_dir,
+                         frame_every=args.frame_every, frame_scale=args.frame_scale,
+                         view=view)
+    if args.checkpoint_dir is not None:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        count = run_trials(trials, args.out, workers=args.workers, seed=args.seed,
+                           cache_dir=args.cache_dir, decoder_dir=args.decoder_cache,
+                           decoder_size=args.decoder_cache_size)
+    finally:
+        if view is not None:
+            view.close()
+    print('%d trials in %.1fs -> %s' % (count, time.perf_counter() - start, args.out))
+
+
+if __name__ == '__main__':
+    main()
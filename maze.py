@@ -0,0 +1,323 @@
+"""Seeded maze and cave generation for grid.World.
+
+Generators return a dict of (height, width) arrays keyed by cell field,
+'wall' and 'cellcolor', which World.set_arrays takes as they are, which
+save() writes in the binary formats World(filename=...) opens and which
+to_text() turns into an ASCII map:
+
+    arrays = maze.generate(4096, 4096, method='prim', seed=1)
+    world = maze.make_world(colour_critter.Cell, arrays, directions=4)
+
+    python maze.py 4096 4096 --method backtracker --seed 1 --out maze.npz
+
+Mazes carve corridors between rooms on a lattice that matches the world's
+directions: odd (x, y) for square worlds and a staggered lattice for the
+hexagonal one.  The same seed always gives the same maze.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import grid
+
+methods = ('backtracker', 'prim', 'caves')
+
+
+def _room_layout(width, height, directions):
+    """The rooms of a maze and the corridors that may join them.
+
+    Returns a boolean (height, width) mask of rooms and, for every pair of
+    neighbouring rooms, the flat indices of both rooms and of the cell
+    between them.
+    """
+    if directions not in grid.direction_offsets:
+        raise grid.CellularException('Unknown directions %r' % directions)
+    rooms = np.zeros((height, width), dtype=bool)
+    if directions == 6:
+        # two steps in any hexagonal direction lands on another room
+        offsets = grid.direction_offsets[6]
+        half = (0, 1, 2)
+        rooms[1:height - 1:4, 1:width - 1:2] = True
+        rooms[3:height - 1:4, 2:width - 1:2] = True
+    else:
+        # corridors are always orthogonal, so 8 directions see the same maze
+        offsets = grid.direction_offsets[4]
+        half = (1, 2)
+        rooms[1:height - 1:2, 1:width - 1:2] = True
+
+    ry, rx = np.nonzero(rooms)
+    room, mid, other = [], [], []
+    for dir in half:
+        dx, dy = np.array([offsets[0][dir], offsets[1][dir]]).T
+        mx, my = rx + dx[ry % 2], ry + dy[ry % 2]
+        nx, ny = mx + dx[my % 2], my + dy[my % 2]
+        ok = (nx < width) & (ny < height)
+        ok[ok] = rooms[ny[ok], nx[ok]]
+        room.append(ry[ok] * width + rx[ok])
+        mid.append(my[ok] * width + mx[ok])
+        other.append(ny[ok] * width + nx[ok])
+    return rooms, np.concatenate(room), np.concatenate(mid), np.concatenate(other)
+
+
+def _carve(rooms, mids):
+    wall = ~rooms
+    wall.reshape(-1)[mids] = False
+    return wall
+
+
+def _renumber(rooms, *flat):
+    # flat cell indices to room numbers 0..n-1
+    number = np.full(rooms.size, -1, dtype=np.int64)
+    number[np.flatnonzero(rooms)] = np.arange(np.count_nonzero(rooms))
+    return [number[f] for f in flat]
+
+
+def backtracker(width, height, directions=4, seed=None, tile=64):
+    """A depth-first (recursive backtracker) maze: long winding corridors.
+
+    The rooms are split into tiles of tile x tile rooms and a depth-first
+    search runs in every tile at once, each with its own stack, one step
+    per tile per iteration.  The tiles are then joined by a random
+    spanning tree, as in prim(), so the whole maze is still a tree.
+    """
+    rng = np.random.RandomState(seed)
+    rooms, room, mid, other = _room_layout(width, height, directions)
+    n = np.count_nonzero(rooms)
+    if n == 0:
+        return ~rooms
+    a, b = _renumber(rooms, room, other)
+    ry, rx = np.nonzero(rooms)
+    size = 2 * tile
+    tiles_across = (width + size - 1) // size
+    tile_of = (ry // size) * tiles_across + rx // size
+    tile_ids, tile_of = np.unique(tile_of, return_inverse=True)
+    tile_of = tile_of.reshape(-1)
+
+    # the corridors of every room that stay within its tile, as a table
+    inner = tile_of[a] == tile_of[b]
+    ends = np.concatenate([a[inner], b[inner]])
+    starts = np.concatenate([b[inner], a[inner]])
+    cells = np.concatenate([mid[inner], mid[inner]])
+    order = np.argsort(ends, kind='stable')
+    ends, starts, cells = ends[order], starts[order], cells[order]
+    column = np.arange(len(ends)) - np.searchsorted(ends, ends)
+    most = column.max() + 1 if len(column) else 1
+    next_room = np.full((n + 1, most), n, dtype=np.int64)
+    corridor = np.zeros((n + 1, most), dtype=np.int64)
+    next_room[ends, column] = starts
+    corridor[ends, column] = cells
+
+    # start each tile's search from a random room in it
+    shuffled = rng.permutation(n)
+    first = np.full(len(tile_ids), n, dtype=np.int64)
+    np.minimum.at(first, tile_of[shuffled], np.arange(n))
+    start = shuffled[first]
+
+    visited = np.zeros(n + 1, dtype=bool)
+    visited[n] = True  # the padding in next_room
+    visited[start] = True
+    stack = np.zeros((len(start), np.bincount(tile_of).max()), dtype=np.int64)
+    stack[:, 0] = start
+    top = np.zeros(len(start), dtype=np.int64)
+    carved = []
+    live = np.arange(len(start))
+    while len(live):
+        current = stack[live, top[live]]
+        choices = ~visited[next_room[current]]
+        pick = np.argmax(rng.random_sample(choices.shape) * choices, axis=1)
+        move = choices[np.arange(len(live)), pick]
+        going = live[move]
+        step = next_room[current[move], pick[move]]
+        visited[step] = True
+        carved.append(corridor[current[move], pick[move]])
+        top[going] += 1
+        stack[going, top[going]] = step
+        top[live[~move]] -= 1
+        live = live[top[live] >= 0]
+
+    # join the tiles, along with any room its tile's search could not reach
+    component = np.arange(n)
+    visited = visited[:n]
+    component[visited] = start[tile_of[visited]]
+    order = rng.permutation(len(a))
+    chosen = _spanning_forest(component, a[order], b[order])
+    return _carve(rooms, np.concatenate(carved + [mid[order][chosen]]))
+
+
+def prim(width, height, directions=4, seed=None):
+    """A maze that is the minimum spanning tree of randomly weighted corridors.
+
+    This is the maze Prim's algorithm grows, with many short dead ends.
+    """
+    rng = np.random.RandomState(seed)
+    rooms, room, mid, other = _room_layout(width, height, directions)
+    a, b = _renumber(rooms, room, other)
+    # with distinct weights the spanning tree is unique, so it is the one
+    # Prim's algorithm grows
+    order = rng.permutation(len(a))
+    chosen = _spanning_forest(np.arange(np.count_nonzero(rooms)), a[order], b[order])
+    return _carve(rooms, mid[order][chosen])
+
+
+def _spanning_forest(component, a, b):
+    """Minimum spanning forest joining the components, by Boruvka's algorithm.
+
+    component labels every room with the room at the root of its component.
+    The corridors from room a to room b are listed in order of weight.
+    Returns which corridors are in the forest.
+    """
+    n = len(component)
+    chosen = np.zeros(len(a), dtype=bool)
+    edge = np.arange(len(a))
+    while True:
+        ca, cb = component[a], component[b]
+        live = ca != cb
+        if not live.any():
+            break
+        a, b, edge, ca, cb = a[live], b[live], edge[live], ca[live], cb[live]
+        # the cheapest corridor out of each component is the first listed
+        best = np.full(n, len(edge), dtype=np.int64)
+        np.minimum.at(best, ca, np.arange(len(edge)))
+        np.minimum.at(best, cb, np.arange(len(edge)))
+        has = np.flatnonzero(best < len(edge))
+        picked = best[has]
+        chosen[edge[picked]] = True
+        # merge each component into the one across its cheapest corridor;
+        # two components that picked the same corridor point at each other,
+        # so the lower numbered one becomes the root
+        parent = np.arange(n)
+        parent[has] = np.where(ca[picked] == has, cb[picked], ca[picked])
+        root = (parent[parent] == np.arange(n)) & (parent > np.arange(n))
+        parent[root] = np.flatnonzero(root)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        component = parent[component]
+    return chosen
+
+
+def caves(width, height, directions=8, seed=None, fill=0.45, steps=5):
+    """Caves grown by a cellular automaton from random noise.
+
+    Each step a cell becomes wall when most of its neighbours are walls and
+    open when most are open, keeping its state on a tie.  Cells past the
+    edge count as walls.  Caves are not guaranteed to be connected.
+    """
+    rng = np.random.RandomState(seed)
+    wall = rng.random_sample((height, width)) < fill
+    for i in range(steps):
+        count = neighbour_count(wall, directions)
+        wall = np.where(2 * count == directions, wall, 2 * count > directions)
+    wall[[0, -1], :] = True
+    wall[:, [0, -1]] = True
+    return wall
+
+
+def neighbour_count(wall, directions):
+    """Number of wall neighbours of every cell, without wrapping."""
+    height, width = wall.shape
+    padded = np.pad(wall, 1, mode='constant', constant_values=True).view(np.uint8)
+    count = np.zeros((height, width), dtype=np.uint8)
+    for parity in (0, 1):
+        for dx, dy in grid.direction_offsets[directions][parity]:
+            count[parity::2] += padded[1 + dy + parity:1 + dy + height:2,
+                                       1 + dx:1 + dx + width]
+    return count
+
+
+def place_colours(wall, density=0.02, colours=5, seed=None):
+    """Colour ids 1..colours scattered over the open cells.
+
+    :param density: fraction of open cells coloured, or a sequence with the
+        fraction for each colour
+    """
+    rng = np.random.RandomState(seed)
+    if np.ndim(density) == 0:
+        density = [float(density) / colours] * colours
+    edges = np.cumsum(density)
+    if len(edges) and edges[-1] > 1:
+        raise grid.CellularException('Colour densities add up to more than 1')
+    cellcolor = np.searchsorted(edges, rng.random_sample(wall.shape), side='right')
+    cellcolor += 1
+    cellcolor[(cellcolor > len(edges)) | wall] = 0
+    return cellcolor.astype(np.uint8)
+
+
+def generate(width, height, method='backtracker', directions=4, seed=None,
+             colour_density=0.02, colours=5, **kwargs):
+    """
+    Generates a maze with colour tiles.
+    :param method: one of methods
+    :param colour_density: fraction of open cells coloured, or a sequence
+        with the fraction for each colour
+    :param kwargs: passed on to the generator, e.g. fill and steps for caves
+    :return: the 'wall' and 'cellcolor' arrays
+    :rtype: dict
+    """
+    if method not in methods:
+        raise grid.CellularException('Unknown maze method %r' % method)
+    # separate streams so colours do not change the maze and vice versa
+    seeds = np.random.RandomState(seed).randint(2 ** 31, size=2)
+    wall = globals()[method](width, height, directions, seed=seeds[0], **kwargs)
+    return dict(wall=wall, cellcolor=place_colours(
+        wall, colour_density, colours, seed=seeds[1]))
+
+
+def make_world(cell, arrays, directions=4, storage='array'):
+    height, width = arrays['wall'].shape
+    world = grid.World(cell, width, height, directions=directions, storage=storage)
+    world.set_arrays(arrays)
+    return world
+
+
+def to_text(arrays, wall='#', colours=' GRBMY'):
+    """The maze as an ASCII map, in colour_critter's characters by default."""
+    codes = np.array([ord(c) for c in colours], dtype='<u4')[arrays['cellcolor']]
+    codes[arrays['wall']] = ord(wall)
+    text = np.empty((codes.shape[0], codes.shape[1] + 1), dtype='<u4')
+    text[:, :-1] = codes
+    text[:, -1] = ord('\n')
+    return text.tobytes().decode('utf-32-le')
+
+
+def save(arrays, filename):
+    """Write the maze as ASCII (.txt), an .npz archive or a .npy directory."""
+    if filename.endswith('.txt'):
+        with open(filename, 'w') as f:
+            f.write(to_text(arrays))
+    elif filename.endswith('.npz'):
+        np.savez_compressed(filename, **arrays)
+    else:
+        if not os.path.isdir(filename):
+            os.makedirs(filename)
+        for name, a in arrays.items():
+            np.save(os.path.join(filename, name + '.npy'), a)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('width', type=int)
+    parser.add_argument('height', type=int)
+    parser.add_argument('--method', choices=methods, default='backtracker')
+    parser.add_argument('--directions', type=int, choices=(4, 6, 8), default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--colour-density', type=float, default=0.02)
+    parser.add_argument('--colours', type=int, default=5)
+    parser.add_argument('--out', default='maze.txt',
+                        help='.txt, .npz, or a directory for .npy files')
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    arrays = generate(args.width, args.height, args.method, args.directions,
+                      args.seed, args.colour_density, args.colours)
+    save(arrays, args.out)
+    print('%dx%d %s maze in %.1fs -> %s' % (args.width, args.height, args.method,
+                                            time.perf_counter() - start, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""Run many worlds and their agents in lock-step in one process.
+
+WorldHost keeps the walls and cell colours of every world stacked in
+(worlds, height, width) arrays, padded to the largest world, and the
+position, heading and cell of every ContinuousAgent in them in flat
+arrays.  Each step moves all the agents at once, following the same rule as
+ContinuousAgent.go_in_direction, and casts every agent's radar rays in one
+batched walk over the stacked walls, giving the same distances as
+ContinuousAgent.cast_ray.  Its sensors are laid out per agent as
+grid.BridgeOutput's are: the radar distances, the colour of the agent's
+cell, its x, y and heading.
+
+    host = WorldHost(worlds)
+    for i in range(1000):
+        sensors = host.step(commands)    # (agents, 3) speed, rotation, run
+    host.sync()                          # move the Agent objects, to render
+
+The Agent objects are only moved by sync(); cells that change, such as
+walls added during a run, are picked up through World.watch.
+
+In nengo, HostNode runs the host as one node taking every agent's commands
+and giving every agent's sensors, and port(i) gives the slices of agent i
+to connect its own sub-network to; see colour_critter.make_population.
+Square worlds only, all with the same number of directions.
+"""
+import nengo
+import numpy as np
+
+import grid
+
+
+class _Changes(object):
+    """Collects the cells marked dirty in one of the host's worlds."""
+
+    def __init__(self, changed, index):
+        self.changed = changed
+        self.index = index
+
+    def add(self, key):
+        self.changed.add((self.index, key))
+
+
+class WorldHost(object):
+    """
+    Steps the agents of many worlds together.
+    :param worlds: the worlds, with their agents already added
+    :param radar: the radar's directions, relative to each agent's heading
+    :param every: only move the agents every this many steps, applying the
+        commands summed over them, as grid.BridgeOutput does
+    :param field: the cell attribute sensed as the colour
+    """
+
+    def __init__(self, worlds, radar=(-0.5, 0.0, 0.5), max_distance=4, dt=0.001,
+                 max_speed=10.0, max_rotate=10.0, every=1, field='cellcolor'):
+        self.worlds = list(worlds)
+        directions = set(world.directions for world in self.worlds)
+        if len(directions) != 1 or 6 in directions:
+            raise grid.CellularException(
+                'WorldHost needs square worlds with the same number of directions')
+        self.directions = directions.pop()
+        self.offsets = self.worlds[0].topology.table.astype(float)
+        self.candidates = np.concatenate([np.zeros((2, 1, 2)), self.offsets], axis=1)
+        self.radar = np.array(radar, dtype=float)
+        self.max_distance = max_distance
+        self.dt = dt
+        self.max_speed = max_speed
+        self.max_rotate = max_rotate
+        self.every = every
+        self.field = field
+
+        self.widths = np.array([world.width for world in self.worlds])
+        self.heights = np.array([world.height for world in self.worlds])
+        self.wrap = np.array([world.topology.wrap for world in self.worlds])
+        shape = (len(self.worlds), self.heights.max(), self.widths.max())
+        # padding outside a world is wall, which only bounded worlds reach
+        self.walls = np.ones(shape, dtype=bool)
+        self.colours = np.zeros(shape, dtype=np.int64)
+        self.changed = set()
+        self.watchers = []
+        for i, world in enumerate(self.worlds):
+            self.watchers.append(world.watch(_Changes(self.changed, i)))
+
+        self.agents = [agent for world in self.worlds for agent in world.agents]
+        self.agent_world = np.array([i for i, world in enumerate(self.worlds)
+                                     for agent in world.agents], dtype=np.int64)
+        n = len(self.agents)
+        self.ticks = 0
+        self.speed = np.zeros(n)
+        self.rotation = np.zeros(n)
+        self.output = np.zeros((n, len(self.radar) + 4))
+        self.seen = np.zeros((n, 1), dtype=bool)
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.refresh()
+        self.pull()
+        self.sense()
+
+    def close(self):
+        for world, watcher in zip(self.worlds, self.watchers):
+            world.unwatch(watcher)
+        self.watchers = []
+
+    def __len__(self):
+        return len(self.agents)
+
+    def refresh(self):
+        """Bring the stacked walls and colours up to date with the worlds."""
+        changed = self.changed
+        whole = set(i for i, key in changed if key is None)
+        for i in whole:
+            world = self.worlds[i]
+            h, w = world.height, world.width
+            self.walls[i, :h, :w] = world.get_array('wall')
+            self.colours[i, :h, :w] = world.get_array(self.field)
+        for i, key in changed:
+            if key is not None and i not in whole:
+                x, y = key
+                cell = self.worlds[i].grid[y][x]
+                self.walls[i, y, x] = cell.wall
+                self.colours[i, y, x] = getattr(cell, self.field, 0)
+        changed.clear()
+        top = int(self.colours.max(initial=0)) + 1
+        if top > self.seen.shape[1]:
+            seen = np.zeros((len(self.agents), top), dtype=bool)
+            seen[:, :self.seen.shape[1]] = self.seen
+            self.seen = seen
+
+    def pull(self):
+        """Read the state of the Agent objects into the arrays."""
+        agents = self.agents
+        self.x = np.array([a.x for a in agents], dtype=float)
+        self.y = np.array([a.y for a in agents], dtype=float)
+        self.dir = np.array([a.dir for a in agents], dtype=float)
+        self.cell_x = np.array([a.cell.x for a in agents], dtype=np.int64)
+        self.cell_y = np.array([a.cell.y for a in agents], dtype=np.int64)
+
+    def sync(self):
+        """Write the arrays back to the Agent objects."""
+        cell_x = self.cell_x.tolist()
+        cell_y = self.cell_y.tolist()
+        for i, (a, x, y, dir) in enumerate(zip(self.agents, self.x.tolist(), self.y.tolist(),
+                                               self.dir.tolist())):
+            if a.cell.x != cell_x[i] or a.cell.y != cell_y[i]:
+                a.cell = a.world.grid[cell_y[i]][cell_x[i]]
+            a.x = x
+            a.y = y
+            a.dir = dir
+
+    def go_forward(self, distance):
+        """Move every agent distance along its heading, unless a wall is in the way."""
+        directions = self.directions
+        dir1 = np.floor(self.dir).astype(np.int64) % directions
+        dir2 = (dir1 + 1) % directions
+        scale = (self.dir % 1)[:, None]
+        parity = self.cell_y & 1
+        v = self.offsets[parity, dir1] * (1 - scale) + self.offsets[parity, dir2] * scale
+        x = self.x + distance * v[:, 0]
+        y = self.y + distance * v[:, 1]
+
+        # closest of the current cell and its neighbours
+        cand = self.candidates[parity]
+        cand_x = self.cell_x[:, None] + cand[:, :, 0]
+        cand_y = self.cell_y[:, None] + cand[:, :, 1]
+        d2 = (x[:, None] - cand_x) ** 2 + (y[:, None] - cand_y) ** 2
+        best = np.argmin(d2, axis=1)
+        rows = np.arange(len(best))
+        world = self.agent_world
+        width = self.widths[world]
+        height = self.heights[world]
+        wrap = self.wrap[world]
+        cx = cand_x[rows, best].astype(np.int64)
+        cy = cand_y[rows, best].astype(np.int64)
+        cx = np.where(wrap, cx % width, np.clip(cx, 0, width - 1))
+        cy = np.where(wrap, cy % height, np.clip(cy, 0, height - 1))
+        inside = wrap | ((x >= -0.5) & (x < width - 0.5) & (y >= -0.5) & (y < height - 0.5))
+        moved = inside & ((best == 0) | ~self.walls[world, cy, cx])
+        self.x[moved] = x[moved]
+        self.y[moved] = y[moved]
+        self.cell_x[moved] = cx[moved]
+        self.cell_y[moved] = cy[moved]
+        return moved
+
+    def cast_rays(self, directions, max_distance):
+        """
+        Distances to the nearest wall from every agent, as cast_ray.
+        :param directions: (agents, rays) directions to cast in
+        :return: (agents, rays) distances, max_distance where none is in range
+        """
+        n, k = directions.shape
+        agent = np.repeat(np.arange(n), k)
+        d = directions.reshape(-1)
+        dir1 = d.astype(np.int64)
+        dir2 = (dir1 + 1) % self.directions
+        scale = d % 1
+        parity = self.cell_y[agent] & 1
+        o1 = self.offsets[parity, dir1]
+        o2 = self.offsets[parity, dir2]
+        dx = o2[:, 0] * scale + o1[:, 0] * (1 - scale)
+        dy = o2[:, 1] * scale + o1[:, 1] * (1 - scale)
+        length = np.sqrt(dx * dx + dy * dy)
+
+        # cells are centred on integer coordinates, so shift by half a cell
+        px = self.x[agent] + 0.5
+        py = self.y[agent] + 0.5
+        ix = np.floor(px).astype(np.int64)
+        iy = np.floor(py).astype(np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_x = np.where(dx > 0, (ix + 1 - px) / dx, np.where(dx < 0, (ix - px) / dx, np.inf))
+            t_y = np.where(dy > 0, (iy + 1 - py) / dy, np.where(dy < 0, (iy - py) / dy, np.inf))
+            dt_x = np.where(dx != 0, 1.0 / np.abs(dx), np.inf)
+            dt_y = np.where(dy != 0, 1.0 / np.abs(dy), np.inf)
+        step_x = np.sign(dx).astype(np.int64)
+        step_y = np.sign(dy).astype(np.int64)
+        world = self.agent_world[agent]
+
+        # walk every ray one cell boundary at a time, dropping the rays that
+        # have hit a wall or run out of range
+        distance = np.full(len(d), float(max_distance))
+        alive = np.arange(len(d))
+        state = (ix, iy, t_x, t_y, dt_x, dt_y, step_x, step_y, world, length)
+        while len(alive):
+            ix, iy, t_x, t_y, dt_x, dt_y, step_x, step_y, world, length = state
+            across = t_x < t_y
+            t = np.where(across, t_x, t_y)
+            ix = ix + np.where(across, step_x, 0)
+            iy = iy + np.where(across, 0, step_y)
+            t_x = t_x + np.where(across, dt_x, 0)
+            t_y = t_y + np.where(across, 0, dt_y)
+            within = t < max_distance
+            width = self.widths[world]
+            height = self.heights[world]
+            hit = self.walls[world, iy % height, ix % width]
+            # the edges of a bounded world stop rays like walls
+            hit |= ~self.wrap[world] & ((ix < 0) | (ix >= width) | (iy < 0) | (iy >= height))
+            hit &= within
+            distance[alive[hit]] = t[hit] * length[hit]
+            keep = within & ~hit
+            alive = alive[keep]
+            state = tuple(a[keep] for a in (ix, iy, t_x, t_y, dt_x, dt_y, step_x, step_y,
+                                            world, length))
+        return distance.reshape(n, k)
+
+    def sense(self):
+        """Fill output with every agent's sensors, and count the colours seen."""
+        if self.changed:
+            self.refresh()
+        k = len(self.radar)
+        output = self.output
+        directions = (self.dir[:, None] + self.radar) % self.directions
+        output[:, :k] = self.cast_rays(directions, self.max_distance)
+        colour = self.colours[self.agent_world, self.cell_y, self.cell_x]
+        output[:, k] = colour
+        output[:, k + 1] = self.x
+        output[:, k + 2] = self.y
+        output[:, k + 3] = self.dir
+        rows = np.flatnonzero(colour)
+        new = rows[~self.seen[rows, colour[rows]]]
+        if len(new):
+            self.seen[new, colour[new]] = True
+            self.counts[new] += 1
+
+    def step(self, commands):
+        """
+        Apply (agents, 3) commands of speed, rotation and run, and return
+        the (agents, sensors) output.
+        """
+        speed, rotation, run = commands.T
+        self.speed += speed * run
+        self.rotation += rotation * run
+        self.ticks += 1
+        if self.ticks >= self.every:
+            self.dir = (self.dir + self.rotation * self.dt * self.max_rotate) % self.directions
+            self.go_forward(self.speed * self.dt * self.max_speed)
+            self.ticks = 0
+            self.speed[:] = 0.0
+            self.rotation[:] = 0.0
+            self.sense()
+        return self.output
+
+    def __call__(self, t, x):
+        return self.step(x.reshape(-1, 3)).reshape(-1)
+
+    def checkpoint_state(self):
+        return dict(ticks=self.ticks, speed=self.speed, rotation=self.rotation, x=self.x,
+                    y=self.y, dir=self.dir, cell_x=self.cell_x, cell_y=self.cell_y,
+                    output=self.output, seen=self.seen, counts=self.counts)
+
+    def restore_state(self, state):
+        self.ticks = int(state['ticks'])
+        for name in ('speed', 'rotation', 'x', 'y', 'dir'):
+            setattr(self, name, state[name].astype(float))
+        self.cell_x = state['cell_x'].astype(np.int64)
+        self.cell_y = state['cell_y'].astype(np.int64)
+        self.output[...] = state['output']
+        self.seen = state['seen'].astype(bool)
+        self.counts = state['counts'].astype(np.int64)
+        self.sync()
+
+
+class HostCounter(object):
+    """
+    Node output giving, for every agent of a WorldHost, the number of
+    colours it has stood on and 1 until that reaches max_colours, then 0.
+    """
+
+    def __init__(self, host, max_colours):
+        self.host = host
+        self.max_colours = max_colours
+        self.output = np.zeros((len(host), 2))
+
+    def __call__(self, t):
+        counts = self.host.counts
+        self.output[:, 0] = counts
+        self.output[:, 1] = counts < self.max_colours
+        return self.output.reshape(-1)
+
+
+class AgentPort(object):
+    """
+    One agent's slices of a HostNode: command takes its speed, rotation and
+    run, and sensors, radar, colour, position and heading give its sensors.
+    """
+
+    def __init__(self, node, i):
+        k = node.host.output.shape[1]
+        n = len(node.host.radar)
+        start = i * k
+        self.command = node[3 * i:3 * i + 3]
+        self.sensors = node[start:start + k]
+        self.radar = node[start:start + n]
+        self.colour = node[start + n:start + n + 1]
+        self.position = node[start + n + 1:start + n + 3]
+        self.heading = node[start + n + 3:start + n + 4]
+
+
+class HostNode(nengo.Node):
+    """A WorldHost as one node: every agent's commands in, sensors out."""
+
+    host = None
+
+    def __init__(self, host, label=None):
+        super(HostNode, self).__init__(host, size_in=3 * len(host),
+                                       size_out=host.output.size, label=label)
+        self.host = host
+
+    def port(self, i):
+        return AgentPort(self, i)
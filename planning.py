@@ -0,0 +1,277 @@
+"""Shortest paths over a grid.World, with cached distance and flow fields.
+
+A Planner attached to a world makes Agent.go_towards follow shortest paths
+instead of greedily closing the straight-line distance:
+
+    planner = planning.Planner(world)
+    agent.go_towards(target)        # one step along a shortest path
+
+The first request for a target finds the distance from every cell to it
+(breadth-first, or Dijkstra when cells have entry costs) and the direction
+to step from every cell.  Both are cached per target, so any number of
+agents heading for the same cell take O(1) per step.  Paths follow the
+world's directions and wrap around its edges like the world does.  The
+cache is dropped when a wall (or cost) changes, which cells report through
+World.watch in either storage.
+"""
+import collections
+import heapq
+
+import numpy as np
+
+import grid
+
+methods = ('field', 'astar')
+
+
+class Planner(object):
+    """
+    :param world: the world to plan in; the planner attaches itself as
+        world.planner
+    :param cost: cost of entering each cell, as the name of a cell field or
+        a (height, width) array; by default every step costs 1
+    :param cache_size: number of targets to keep fields for
+    """
+
+    def __init__(self, world, cost=None, cache_size=32):
+        self.world = world
+        self.cost = cost
+        self.cache_size = cache_size
+        self.fields = collections.OrderedDict()
+        self.walls = None
+        self.costs = None
+        self.dirty = world.watch()
+        self.reset_stats()
+        world.planner = self
+
+    def close(self):
+        self.world.unwatch(self.dirty)
+        if self.world.planner is self:
+            self.world.planner = None
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    invalidations=self.invalidations, fields=len(self.fields),
+                    hit_rate=self.hits / float(lookups) if lookups else None)
+
+    def invalidate(self):
+        self.fields.clear()
+        self.walls = None
+        self.invalidations += 1
+
+    def _check(self):
+        # drop the cache if any cell the world marked dirty changed a wall
+        # or cost since the fields were built
+        if not self.dirty:
+            return
+        dirty = list(self.dirty)
+        self.dirty.clear()
+        if self.walls is None:
+            return
+        if None in dirty:
+            changed = not np.array_equal(self._walls(), self.walls)
+            if not changed and isinstance(self.cost, str):
+                changed = not np.array_equal(self._costs(), self.costs)
+        else:
+            changed = False
+            for x, y in dirty:
+                cell = self.world.grid[y][x]
+                if bool(getattr(cell, 'wall', False)) != self.walls[y, x]:
+                    changed = True
+                    break
+                if isinstance(self.cost, str) and getattr(
+                        cell, self.cost) != self.costs[y, x]:
+                    changed = True
+                    break
+        if changed:
+            self.invalidate()
+
+    def _walls(self):
+        return np.array(self.world.get_array('wall'), dtype=bool)
+
+    def _costs(self):
+        if self.cost is None:
+            return None
+        if isinstance(self.cost, str):
+            return np.array(self.world.get_array(self.cost), dtype=float)
+        return np.asarray(self.cost, dtype=float)
+
+    def _prepare(self):
+        self._check()
+        if self.walls is None:
+            self.walls = self._walls()
+            self.costs = self._costs()
+
+    def _index(self, cell, y=None):
+        if y is not None:
+            return int(y) * self.world.width + int(cell)
+        return cell.y * self.world.width + cell.x
+
+    def fields_for(self, target, y=None):
+        """The (distance, flow) fields for a target cell, or its x, y.
+
+        distance is the cost of getting from each cell to the target, -1
+        where it cannot be reached.  flow is the direction to step in from
+        each cell, -1 where there is none.
+        """
+        self._prepare()
+        index = self._index(target, y)
+        fields = self.fields.get(index)
+        if fields is not None:
+            self.fields.move_to_end(index)
+            self.hits += 1
+            return fields
+        self.misses += 1
+        if self.costs is None:
+            distance = self._breadth_first(index)
+        else:
+            distance = self._dijkstra(index)
+        fields = distance, self._flow(distance)
+        self.fields[index] = fields
+        while len(self.fields) > self.cache_size:
+            self.fields.popitem(last=False)
+        return fields
+
+    def distance_field(self, target, y=None):
+        return self.fields_for(target, y)[0]
+
+    def flow_field(self, target, y=None):
+        return self.fields_for(target, y)[1]
+
+    def _breadth_first(self, target):
+        # expands a whole frontier at a time; every cell's neighbours are
+        # its neighbours' neighbours too, so distances to the target are
+        # distances from it
+        world = self.world
+        neighbours = world.neighbour_index.reshape(-1, world.directions)
+        free = ~self.walls.reshape(-1)
+        distance = np.full(world.width * world.height, -1, dtype=np.int32)
+        distance[target] = 0
+        frontier = np.array([target])
+        step = 0
+        while len(frontier):
+            step += 1
+            near = neighbours[frontier].reshape(-1)
+            near = np.unique(near[free[near] & (distance[near] < 0)])
+            distance[near] = step
+            frontier = near
+        return distance.reshape(world.height, world.width)
+
+    def _dijkstra(self, target):
+        world = self.world
+        neighbours = world.neighbour_index.reshape(-1, world.directions).tolist()
+        free = (~self.walls.reshape(-1)).tolist()
+        cost = self.costs.reshape(-1).tolist()
+        distance = np.full(world.width * world.height, -1.0)
+        best = {target: 0.0}
+        queue = [(0.0, target)]
+        while queue:
+            d, index = heapq.heappop(queue)
+            if distance[index] >= 0:
+                continue
+            distance[index] = d
+            # stepping from a neighbour into this cell costs this cell's cost
+            d += cost[index]
+            for n in neighbours[index]:
+                if free[n] and distance[n] < 0 and d < best.get(n, np.inf):
+                    best[n] = d
+                    heapq.heappush(queue, (d, n))
+        return distance.reshape(world.height, world.width)
+
+    def _flow(self, distance):
+        world = self.world
+        flat = distance.reshape(-1).astype(float)
+        neighbours = world.neighbour_index.reshape(-1, world.directions)
+        via = flat[neighbours]
+        if self.costs is not None:
+            via = via + self.costs.reshape(-1)[neighbours]
+        via[flat[neighbours] < 0] = np.inf
+        flow = np.argmin(via, axis=1).astype(np.int8)
+        stuck = (flat <= 0) | ~np.isfinite(via.min(axis=1))
+        flow[stuck] = -1
+        return flow.reshape(world.height, world.width)
+
+    def next_direction(self, cell, target):
+        """Direction to step from cell towards target, or None if there is none."""
+        dir = int(self.flow_field(target)[cell.y, cell.x])
+        if dir < 0:
+            return None
+        return dir
+
+    def path(self, start, goal, method='field'):
+        """
+        The cells from start to goal along a shortest path.
+        :param method: 'field' follows the cached field for goal; 'astar'
+            searches just this path, which suits one-off queries in large
+            worlds where a whole field would be wasted
+        :return: list of cells, or None if goal cannot be reached
+        """
+        if method not in methods:
+            raise grid.CellularException('Unknown planning method %r' % method)
+        if method == 'astar':
+            return self._astar(start, goal)
+        flow = self.flow_field(goal)
+        if self.distance_field(goal)[start.y, start.x] < 0:
+            return None
+        cells = [start]
+        cell = start
+        while (cell.x, cell.y) != (goal.x, goal.y):
+            cell = cell.neighbours[flow[cell.y, cell.x]]
+            cells.append(cell)
+        return cells
+
+    def _heuristic(self, index, goal):
+        # lower bound on steps, going round the edges of wrapping worlds: any
+        # step changes x and y by at most one, and square worlds with 4
+        # directions change only one
+        world = self.world
+        dx = abs(index % world.width - goal % world.width)
+        dy = abs(index // world.width - goal // world.width)
+        if world.topology.wrap:
+            dx = min(dx, world.width - dx)
+            dy = min(dy, world.height - dy)
+        if world.directions == 4:
+            return dx + dy
+        return max(dx, dy)
+
+    def _astar(self, start, goal):
+        self._prepare()
+        world = self.world
+        neighbours = world.neighbour_index.reshape(-1, world.directions)
+        walls = self.walls.reshape(-1)
+        cost = None if self.costs is None else self.costs.reshape(-1)
+        scale = 1.0 if cost is None else max(float(cost[~walls].min()), 0.0)
+        source = self._index(start)
+        target = self._index(goal)
+        came_from = {source: None}
+        best = {source: 0.0}
+        queue = [(0.0, 0.0, source)]
+        while queue:
+            f, g, index = heapq.heappop(queue)
+            if index == target:
+                break
+            if g > best[index]:
+                continue
+            for n in neighbours[index].tolist():
+                if walls[n]:
+                    continue
+                step = g + (1.0 if cost is None else cost[n])
+                if step < best.get(n, np.inf):
+                    best[n] = step
+                    came_from[n] = index
+                    heapq.heappush(queue, (step + scale * self._heuristic(n, target), step, n))
+        if target not in came_from:
+            return None
+        cells = []
+        index = target
+        while index is not None:
+            cells.append(world.get_cell_at_index(index))
+            index = came_from[index]
+        cells.reverse()
+        return cells
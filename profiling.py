@@ -0,0 +1,228 @@
+"""Counters and timing histograms for the grid and colour_critter hot paths.
+
+Instrumentation is off until enabled and costs nothing while it is off:
+enable() swaps timed wrappers in for the methods listed in targets and
+disable() puts the originals back.  Functions that nengo holds on to
+directly, such as the module-level connection functions in colour_critter,
+are decorated with instrument() instead, which only checks a flag when
+profiling is off.
+
+    profiling.enable()
+    sim.run(1.0)
+    profiling.disable()
+    print(profiling.report())
+    profiling.save_json('profile.json')
+    profiling.save_folded('profile.folded')   # flamegraph.pl, speedscope
+
+Each call is counted, its time added to a log2 histogram, and its time
+less that of instrumented calls inside it is charged to its call stack,
+which is what the folded (flame graph) output holds.  report() breaks the
+time down per nengo.Simulator.step.
+"""
+import functools
+import importlib
+import json
+import threading
+import time
+
+# (module, attribute path, label) of the methods enable() wraps
+targets = (
+    ('nengo', 'Simulator.__init__', 'nengo.build'),
+    ('nengo', 'Simulator.step', 'nengo.step'),
+    ('grid', 'World.update', 'World.update'),
+    ('grid', 'ContinuousAgent.detect', 'ContinuousAgent.detect'),
+    ('grid', 'ContinuousAgent.go_in_direction', 'ContinuousAgent.go_in_direction'),
+    ('grid', 'GridNode.generate_svg', 'GridNode.generate_svg'),
+    ('grid', 'GridOutput.__call__', 'GridOutput'),
+    ('grid', 'SVGRenderer.render', 'SVGRenderer.render'),
+    ('grid', 'BridgeOutput.__call__', 'SensorBridge'),
+    ('grid', 'ColourTracker.update', 'ColourTracker'),
+    ('colour_critter', 'Movement.__call__', 'Movement'),
+    ('colour_critter', 'Radar.__call__', 'Radar'),
+    ('colour_critter', 'CurrentColour.__call__', 'CurrentColour'),
+    ('colour_critter', 'ColourConverter.__call__', 'ColourConverter'),
+    ('colour_critter', 'SpaToNengo.__call__', 'SpaToNengo'),
+    ('colour_critter', 'Inhibit.__call__', 'Inhibit'),
+    ('colour_critter', 'ReferenceCounter.__call__', 'ReferenceCounter'),
+    ('colour_critter', 'Tracker.__call__', 'Tracker'),
+)
+
+# the label report() divides times by the number of calls to
+step_label = 'nengo.step'
+
+_clock = time.perf_counter_ns
+
+
+class Stat(object):
+    """Calls to one label: count, total and self time in ns, log2 histogram."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.self_time = 0
+        # histogram[b] counts calls that took between 2**(b-1) and 2**b ns
+        self.histogram = [0] * 64
+
+    def add(self, elapsed, self_time):
+        self.calls += 1
+        self.total += elapsed
+        self.self_time += self_time
+        self.histogram[min(elapsed.bit_length(), 63)] += 1
+
+    def percentile(self, q):
+        """Upper bound, in ns, on the time of the q'th percentile call."""
+        seen = 0
+        for b, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= q / 100.0 * self.calls:
+                return 2 ** b
+        return 0
+
+
+class Profiler(object):
+    def __init__(self):
+        self.patched = []
+        self.local = threading.local()
+        self.reset()
+
+    @property
+    def enabled(self):
+        return bool(self.patched)
+
+    def reset(self):
+        self.stats = {}
+        self.stacks = {}
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def call(self, label, f, args, kwargs):
+        stack = self._stack()
+        # each frame is the call stack so far and the time spent in
+        # instrumented calls made from it
+        frame = [stack[-1][0] + (label,) if stack else (label,), 0]
+        stack.append(frame)
+        start = _clock()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            elapsed = _clock() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            self_time = elapsed - frame[1]
+            stat = self.stats.get(label)
+            if stat is None:
+                stat = self.stats[label] = Stat()
+            stat.add(elapsed, self_time)
+            self.stacks[frame[0]] = self.stacks.get(frame[0], 0) + self_time
+
+    def wrap(self, label, f):
+        def timed(*args, **kwargs):
+            return self.call(label, f, args, kwargs)
+        functools.update_wrapper(timed, f)
+        timed.profiled = f
+        return timed
+
+    def enable(self, targets=targets):
+        global active
+        if self.enabled:
+            return
+        for module, path, label in targets:
+            owner = importlib.import_module(module)
+            names = path.split('.')
+            for name in names[:-1]:
+                owner = getattr(owner, name)
+            name = names[-1]
+            had_own = name in owner.__dict__
+            original = getattr(owner, name)
+            self.patched.append((owner, name, original, had_own))
+            setattr(owner, name, self.wrap(label, original))
+        active = self
+
+    def disable(self):
+        global active
+        for owner, name, original, had_own in reversed(self.patched):
+            if had_own:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+        self.patched = []
+        if active is self:
+            active = None
+
+    def to_dict(self):
+        stats = {}
+        for label, stat in self.stats.items():
+            stats[label] = dict(
+                calls=stat.calls, total_s=stat.total * 1e-9,
+                self_s=stat.self_time * 1e-9,
+                mean_us=stat.total * 1e-3 / stat.calls,
+                p50_us=stat.percentile(50) * 1e-3,
+                p99_us=stat.percentile(99) * 1e-3,
+                histogram_ns=dict(('<%d' % 2 ** b, count)
+                                  for b, count in enumerate(stat.histogram) if count))
+        stacks = dict((';'.join(path), t * 1e-9) for path, t in self.stacks.items())
+        return dict(stats=stats, stacks_self_s=stacks)
+
+    def save_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def folded(self):
+        """Self time of every call stack in microseconds, one per line."""
+        lines = ['%s %d' % (';'.join(path), t // 1000)
+                 for path, t in sorted(self.stacks.items())]
+        return '\n'.join(lines) + '\n'
+
+    def save_folded(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.folded())
+
+    def report(self):
+        """A table of where the time goes per simulator step."""
+        step = self.stats.get(step_label)
+        steps = step.calls if step is not None else 0
+        lines = []
+        if steps:
+            lines.append('%d steps, %.1f us per step' % (steps, step.total * 1e-3 / steps))
+        lines.append('%-34s %9s %10s %10s %9s %9s %9s %6s' % (
+            'label', 'calls', 'total ms', 'self ms', 'mean us', 'p99 us',
+            'us/step', '%step'))
+        for label, stat in sorted(self.stats.items(), key=lambda item: -item[1].self_time):
+            per_step = share = ''
+            if steps:
+                per_step = '%9.1f' % (stat.total * 1e-3 / steps)
+                share = '%5.1f%%' % (100.0 * stat.total / step.total)
+            lines.append('%-34s %9d %10.1f %10.1f %9.1f %9.1f %9s %6s' % (
+                label, stat.calls, stat.total * 1e-6, stat.self_time * 1e-6,
+                stat.total * 1e-3 / stat.calls, stat.percentile(99) * 1e-3,
+                per_step, share))
+        return '\n'.join(lines)
+
+
+# the enabled Profiler, which instrument() reports to
+active = None
+
+profiler = Profiler()
+enable = profiler.enable
+disable = profiler.disable
+reset = profiler.reset
+report = profiler.report
+save_json = profiler.save_json
+save_folded = profiler.save_folded
+
+
+def instrument(label):
+    """Decorator timing a function whenever a profiler is enabled."""
+    def decorate(f):
+        @functools.wraps(f)
+        def instrumented(*args, **kwargs):
+            if active is None:
+                return f(*args, **kwargs)
+            return active.call(label, f, args, kwargs)
+        return instrumented
+    return decorate
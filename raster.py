@@ -0,0 +1,340 @@
+"""Render a World straight to images, for batch runs without nengo_gui.
+
+Rasteriser draws the same picture as grid.SVGRenderer into a numpy RGB
+array: cell colours come from Cell.color as for SVG, but are worked out
+once per distinct combination of cell fields and looked up for the whole
+grid at once, and only changed cells are redrawn between frames.  Agents
+are stamped from precomputed masks of their shape at 64 headings.
+
+FrameWriter saves frames while a simulation runs.  Called every tick (as
+a node output, or from a loop around World.update), it renders every
+so many ticks: on the caller's thread it only updates the cell colours and
+copies them and the agents' positions into a free buffer; scaling, drawing
+agents and PNG compression happen on a worker thread.  With drop=True
+frames are skipped rather than waited for when the worker falls behind.
+
+    writer = critter.export_frames('frames', scale=4, every=40)
+    sim.run(10)
+    writer.close()
+
+Frames are written as frame-NNNNNN.png, or all to one frames.rgb file of
+raw 8-bit RGB, which can be turned into a video with
+
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r 25 -i frames.rgb out.mp4
+
+with W and H from the meta.json written alongside.  Recordings can be
+rendered too:
+
+    python raster.py run --every 10 --scale 4 --out frames
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+import grid
+import recording
+
+# colours Cell.color and agents may name, besides '#rrggbb' and '#rgb'
+named_colours = {
+    'black': (0, 0, 0), 'white': (255, 255, 255), 'grey': (128, 128, 128),
+    'gray': (128, 128, 128), 'red': (255, 0, 0), 'green': (0, 128, 0),
+    'lime': (0, 255, 0), 'blue': (0, 0, 255), 'yellow': (255, 255, 0),
+    'magenta': (255, 0, 255), 'cyan': (0, 255, 255), 'orange': (255, 165, 0),
+    'purple': (128, 0, 128), 'brown': (165, 42, 42), 'pink': (255, 192, 203),
+}
+
+background = (255, 255, 255)
+
+
+def rgb(colour):
+    """(r, g, b) of a colour name or hex string; None is the background."""
+    if colour is None:
+        return background
+    colour = colour.strip().lower()
+    if colour in named_colours:
+        return named_colours[colour]
+    if colour.startswith('#') and len(colour) in (4, 7):
+        digits = colour[1:]
+        if len(digits) == 3:
+            digits = ''.join(c * 2 for c in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    raise grid.CellularException('Unknown colour %r' % colour)
+
+
+def png(image, level=1):
+    """An (height, width, 3) uint8 image as PNG file contents."""
+    height, width = image.shape[:2]
+    # each row starts with its filter type, 0 for none
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), level)) +
+            chunk(b'IEND', b''))
+
+
+def _shape_masks(shape, scale, headings=64):
+    """(headings, k, k) masks of an agent centred in a k by k window."""
+    k = scale + 1
+    offsets = (np.arange(k) + 0.5 - k / 2.0) / scale
+    px, py = np.meshgrid(offsets, offsets)
+    masks = np.zeros((headings, k, k), dtype=bool)
+    for h in range(headings):
+        if shape == 'circle':
+            masks[h] = px * px + py * py <= 0.4 * 0.4
+            continue
+        # turn the pixels back by the heading and test them against the
+        # unrotated triangle (0.25, 0.25), (-0.25, 0.25), (0, -0.5)
+        angle = -2 * math.pi * h / headings
+        x = px * math.cos(angle) - py * math.sin(angle)
+        y = px * math.sin(angle) + py * math.cos(angle)
+        masks[h] = (y <= 0.25) & (np.abs(x) <= 0.25 * (y + 0.5) / 0.75)
+    return masks
+
+
+class Rasteriser(object):
+    """
+    Draws a world scale pixels per cell.
+    :param incremental: keep the cell colours between frames and only
+        redraw the cells marked dirty (see World.watch); without it every
+        cell is redrawn every frame, which also picks up changes that are
+        not marked, such as values mutated in place
+    """
+
+    headings = 64
+
+    def __init__(self, world, scale=4, incremental=True):
+        self.world = world
+        self.scale = scale
+        self.incremental = incremental
+        self.dirty = world.watch() if incremental else None
+        self.width = world.width * scale
+        self.height = world.height * scale
+        self.cells = np.empty((world.height, world.width, 3), dtype=np.uint8)
+        self.colours = {}
+        self.masks = {}
+        self.fresh = False
+
+    def close(self):
+        if self.dirty is not None:
+            self.world.unwatch(self.dirty)
+            self.dirty = None
+
+    def cell_rgb(self, cell):
+        color = cell.color
+        if callable(color):
+            color = color()
+        return rgb(color)
+
+    def update_cells(self):
+        """Bring the (height, width, 3) cell colours up to date."""
+        world = self.world
+        if self.fresh and self.incremental and None not in self.dirty:
+            for x, y in self.dirty:
+                self.cells[y, x] = self.cell_rgb(world.get_cell(x, y))
+        elif world.arrays is not None or world.Cell.array_fields is not grid.Cell.array_fields:
+            # Cell.color is called once per distinct combination of fields,
+            # which list-backed cells are taken to hold all their state in
+            # once their class lists its own
+            fields = world.Cell.array_fields
+            names = [name for name, dtype in fields]
+            keys, combos = grid._combination_keys([np.asarray(world.get_array(name), dtype)
+                                                   for name, dtype in fields])
+            lut = np.empty((len(combos), 3), dtype=np.uint8)
+            for i, combo in enumerate(combos):
+                colour = self.colours.get(combo)
+                if colour is None:
+                    scratch = world.Cell()
+                    for name, value in zip(names, combo):
+                        setattr(scratch, name, value)
+                    colour = self.colours[combo] = self.cell_rgb(scratch)
+                lut[i] = colour
+            np.take(lut, keys, axis=0, out=self.cells)
+        else:
+            for row in world.grid:
+                for cell in row:
+                    self.cells[cell.y, cell.x] = self.cell_rgb(cell)
+        if self.dirty is not None:
+            self.dirty.clear()
+        self.fresh = True
+        return self.cells
+
+    def agent_state(self):
+        """(x, y, heading, shape, rgb) of every agent."""
+        directions = self.world.directions
+        state = []
+        for agent in self.world.agents:
+            color = getattr(agent, 'color', 'blue')
+            if callable(color):
+                color = color()
+            heading = int(round(agent.dir * self.headings / directions)) % self.headings
+            state.append((agent.x, agent.y, heading, getattr(agent, 'shape', 'triangle'),
+                          rgb(color)))
+        return state
+
+    def draw(self, cells, agents, out=None):
+        """
+        Scale up cells into out, a (height, width, 3) uint8 array, and draw
+        agents, as given by agent_state(), over them.
+        """
+        s = self.scale
+        h, w = cells.shape[:2]
+        if out is None:
+            out = np.empty((h * s, w * s, 3), dtype=np.uint8)
+        out.reshape(h, s, w, s, 3)[...] = cells[:, None, :, None, :]
+        for x, y, heading, shape, colour in agents:
+            masks = self.masks.get(shape)
+            if masks is None:
+                masks = self.masks[shape] = _shape_masks(shape, s, self.headings)
+            mask = masks[heading]
+            k = mask.shape[0]
+            left = int(round((x + 0.5) * s - k / 2.0))
+            top = int(round((y + 0.5) * s - k / 2.0))
+            # clip the window to the image
+            x0, y0 = max(left, 0), max(top, 0)
+            x1, y1 = min(left + k, w * s), min(top + k, h * s)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            window = mask[y0 - top:y1 - top, x0 - left:x1 - left]
+            out[y0:y1, x0:x1][window] = colour
+        return out
+
+    def render(self, out=None):
+        """The world as it is now, as a (height, width, 3) uint8 array."""
+        return self.draw(self.update_cells(), self.agent_state(), out)
+
+
+class FrameWriter(object):
+    """
+    Renders world every so many calls and saves the frames to directory.
+    :param every: ticks between frames
+    :param format: 'png' for numbered PNG files, 'raw' for one RGB file
+    :param level: zlib compression level of the PNGs
+    :param buffers: frames that can wait for the worker at once
+    :param drop: skip frames while every buffer is waiting, rather than
+        wait for one
+    :param incremental: see Rasteriser
+    """
+
+    def __init__(self, world, directory, scale=4, every=1, format='png', level=1,
+                 buffers=4, drop=False, incremental=True):
+        if format not in ('png', 'raw'):
+            raise grid.CellularException('Unknown frame format %r' % format)
+        self.rasteriser = Rasteriser(world, scale, incremental)
+        self.directory = directory
+        self.every = every
+        self.format = format
+        self.level = level
+        self.drop = drop
+        self.ticks = 0
+        self.frames = 0
+        self.dropped = 0
+        self.error = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.raw = None
+        if format == 'raw':
+            self.raw = open(os.path.join(directory, 'frames.rgb'), 'wb')
+        r = self.rasteriser
+        self.cell_buffers = np.empty((buffers,) + r.cells.shape, dtype=np.uint8)
+        self.images = np.empty((buffers, r.height, r.width, 3), dtype=np.uint8)
+        self.free = queue.Queue()
+        for i in range(buffers):
+            self.free.put(i)
+        self.full = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, name='FrameWriter', daemon=True)
+        self.thread.start()
+
+    def __call__(self, t=None):
+        tick = self.ticks
+        self.ticks += 1
+        if tick % self.every:
+            return
+        if self.error is not None:
+            raise self.error
+        try:
+            slot = self.free.get(block=not self.drop)
+        except queue.Empty:
+            self.dropped += 1
+            return
+        r = self.rasteriser
+        np.copyto(self.cell_buffers[slot], r.update_cells())
+        self.full.put((self.frames, tick, slot, r.agent_state()))
+        self.frames += 1
+
+    def _worker(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                return
+            frame, tick, slot, agents = item
+            try:
+                if self.error is None:
+                    image = self.rasteriser.draw(self.cell_buffers[slot], agents,
+                                                 self.images[slot])
+                    if self.raw is not None:
+                        self.raw.write(image.tobytes())
+                    else:
+                        name = os.path.join(self.directory, 'frame-%06d.png' % frame)
+                        with open(name, 'wb') as f:
+                            f.write(png(image, self.level))
+            except Exception as e:
+                self.error = e
+            self.free.put(slot)
+
+    def close(self):
+        """Wait for the frames still being written."""
+        if self.thread is None:
+            return
+        self.full.put(None)
+        self.thread.join()
+        self.thread = None
+        self.rasteriser.close()
+        if self.raw is not None:
+            self.raw.close()
+        if self.error is not None:
+            raise self.error
+        r = self.rasteriser
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(dict(width=r.width, height=r.height, scale=r.scale,
+                           format=self.format, every=self.every, frames=self.frames,
+                           dropped=self.dropped), f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Render a recording to frames.')
+    parser.add_argument('recording', help='directory written by recording.Recorder')
+    parser.add_argument('--out', required=True, help='directory for the frames')
+    parser.add_argument('--every', type=int, default=10, help='ticks between frames')
+    parser.add_argument('--scale', type=int, default=4, help='pixels per cell')
+    parser.add_argument('--format', choices=('png', 'raw'), default='png')
+    args = parser.parse_args(args)
+
+    replay = recording.Replay(args.recording)
+    world = replay.make_world()
+    with FrameWriter(world, args.out, scale=args.scale, format=args.format) as writer:
+        for i in range(0, len(replay), args.every):
+            replay.apply(world, i)
+            writer()
+    print('wrote %d frames to %s' % (writer.frames, args.out))
+
+
+if __name__ == '__main__':
+    main()
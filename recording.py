@@ -0,0 +1,334 @@
+"""Record what agents do every tick, and replay it without simulating.
+
+A Recorder is called once per tick, from a nengo.Node or a loop around
+World.update, and logs each agent's x, y, heading, cell, cell colour and,
+optionally, a sensor array such as a SensorBridge's output.  Ticks go into
+a few preallocated chunk buffers; full chunks are written to disk as .npy
+files by a background thread while the next one fills, so memory stays the
+same however long the run.  If the writer falls behind, recording waits
+for a buffer rather than growing.  Each time an agent moves onto a cell of
+a different colour an event is logged as well.
+
+    recorder = critter.record('run')    # or Recorder(world, 'run')
+    sim.run(3600)
+    recorder.close()
+
+The directory holds meta.json, the world's cells as they were when
+recording started (cells.npz), ticks-NNNNNN.npy chunks and, for chunks in
+which colours changed, events-NNNNNN.npy.  Replay reads them back:
+
+    replay = Replay('run')
+    replay.events()                     # colour events of the whole run
+    model = replay_model('run')         # GridNode view, e.g. in nengo_gui
+
+    python recording.py run --every 50 --out frames
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+
+import nengo
+import numpy as np
+
+import checkpoint
+import grid
+
+event_dtype = np.dtype([('tick', np.int64), ('t', float), ('agent', np.int32),
+                        ('colour', np.int32)])
+
+
+def tick_dtype(n_agents, n_sensors=0):
+    """One row per tick, with a column per agent in each field."""
+    fields = [('tick', np.int64), ('t', float),
+              ('x', float, (n_agents,)), ('y', float, (n_agents,)),
+              ('dir', float, (n_agents,)),
+              ('cell_x', np.int32, (n_agents,)), ('cell_y', np.int32, (n_agents,)),
+              ('colour', np.int32, (n_agents,))]
+    if n_sensors:
+        fields.append(('sensors', float, (n_agents, n_sensors)))
+    return np.dtype(fields)
+
+
+def _chunk_files(directory, prefix):
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith(prefix) and name.endswith('.npy'))
+
+
+class Recorder(object):
+    """
+    Logs agents every time it is called with the time.
+    :param agents: the agents to record, by default all of world's
+    :param sensors: an array read every tick, of shape (n_sensors,) or
+        (n_agents, n_sensors), such as SensorBridge.bridge_output.output
+    :param chunk: ticks per file
+    :param buffers: chunk buffers to fill and write in turn
+    """
+
+    def __init__(self, world, directory, agents=None, sensors=None, chunk=4096, buffers=3):
+        self.world = world
+        self.agents = list(world.agents if agents is None else agents)
+        self.directory = directory
+        self.sensors = sensors
+        self.chunk = chunk
+        n_sensors = 0 if sensors is None else np.shape(sensors)[-1]
+        self.dtype = tick_dtype(len(self.agents), n_sensors)
+        self.buffers = np.zeros((buffers, chunk), dtype=self.dtype)
+        self.ticks = 0
+        self.chunks = 0
+        self.events = []
+        self.colours = [0] * len(self.agents)
+        self.error = None
+
+        os.makedirs(directory, exist_ok=True)
+        for name in _chunk_files(directory, 'ticks-') + _chunk_files(directory, 'events-'):
+            os.remove(os.path.join(directory, name))
+        world.save_binary(os.path.join(directory, 'cells.npz'))
+        self.meta = dict(
+            width=world.width, height=world.height, directions=world.directions,
+            wrap=world.topology.wrap,
+            cell=checkpoint.class_name(world.Cell),
+            agents=[checkpoint.class_name(type(a)) for a in self.agents],
+            chunk=chunk, sensors=n_sensors, ticks=None)
+        self._write_meta()
+
+        # buffers waiting to be filled, and full ones waiting to be written
+        self.free = queue.Queue()
+        for i in range(1, buffers):
+            self.free.put(i)
+        self.full = queue.Queue()
+        self._use(0)
+        self.thread = threading.Thread(target=self._writer, name='Recorder', daemon=True)
+        self.thread.start()
+
+    def _write_meta(self):
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    def _use(self, slot):
+        buffer = self.buffers[slot]
+        self.slot = slot
+        self.row = 0
+        self.columns = [buffer[name] for name in ('x', 'y', 'dir', 'cell_x', 'cell_y', 'colour')]
+        self.tick_column = buffer['tick']
+        self.t_column = buffer['t']
+        self.sensor_column = buffer['sensors'] if self.sensors is not None else None
+
+    def __call__(self, t):
+        row = self.row
+        self.tick_column[row] = self.ticks
+        self.t_column[row] = t
+        x, y, dir, cell_x, cell_y, colour = self.columns
+        for i, agent in enumerate(self.agents):
+            cell = agent.cell
+            c = getattr(cell, 'cellcolor', 0)
+            x[row, i] = agent.x
+            y[row, i] = agent.y
+            dir[row, i] = agent.dir
+            cell_x[row, i] = cell.x
+            cell_y[row, i] = cell.y
+            colour[row, i] = c
+            if c != self.colours[i]:
+                self.colours[i] = c
+                if c:
+                    self.events.append((self.ticks, t, i, c))
+        if self.sensor_column is not None:
+            self.sensor_column[row] = self.sensors
+        self.ticks += 1
+        self.row = row + 1
+        if self.row == self.chunk:
+            self._flush()
+            self._use(self.free.get())
+
+    def _flush(self):
+        if self.error is not None:
+            raise self.error
+        self.full.put((self.chunks, self.slot, self.row, self.events))
+        self.chunks += 1
+        self.events = []
+
+    def _writer(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                return
+            index, slot, rows, events = item
+            try:
+                if self.error is None:
+                    np.save(os.path.join(self.directory, 'ticks-%06d.npy' % index),
+                            self.buffers[slot, :rows])
+                    if events:
+                        np.save(os.path.join(self.directory, 'events-%06d.npy' % index),
+                                np.array(events, dtype=event_dtype))
+            except Exception as e:
+                self.error = e
+            self.free.put(slot)
+
+    def close(self):
+        """Write what is left and wait for the writer to finish."""
+        if self.thread is None:
+            return
+        if self.row:
+            self._flush()
+        self.full.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+        self.meta['ticks'] = self.ticks
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class Replay(object):
+    """A recording, read back one chunk at a time."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.files = [os.path.join(directory, name)
+                      for name in _chunk_files(directory, 'ticks-')]
+        if not self.files:
+            raise grid.CellularException('No ticks recorded in %s' % directory)
+        self.chunk_size = self.meta['chunk']
+        last = np.load(self.files[-1], mmap_mode='r')
+        self.length = self.chunk_size * (len(self.files) - 1) + len(last)
+        # the time of the first tick of each chunk
+        self.starts = [float(np.load(f, mmap_mode='r')['t'][0]) for f in self.files]
+        self.loaded = None
+        self.ticks = None
+
+    def __len__(self):
+        return self.length
+
+    def _load(self, chunk):
+        if self.loaded != chunk:
+            self.ticks = np.load(self.files[chunk])
+            self.loaded = chunk
+        return self.ticks
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        return self._load(i // self.chunk_size)[i % self.chunk_size]
+
+    def __iter__(self):
+        for chunk in range(len(self.files)):
+            for row in self._load(chunk):
+                yield row
+
+    def index(self, t):
+        """The last tick recorded at or before time t, or the first."""
+        chunk = max(np.searchsorted(self.starts, t, side='right') - 1, 0)
+        i = np.searchsorted(self._load(chunk)['t'], t, side='right') - 1
+        return chunk * self.chunk_size + max(int(i), 0)
+
+    def times(self):
+        return np.concatenate([np.load(f, mmap_mode='r')['t'] for f in self.files])
+
+    def events(self):
+        files = _chunk_files(self.directory, 'events-')
+        if not files:
+            return np.zeros(0, dtype=event_dtype)
+        return np.concatenate([np.load(os.path.join(self.directory, name))
+                               for name in files])
+
+    def make_world(self, storage='array'):
+        """A world with the recorded cells and agents, at the first tick."""
+        meta = self.meta
+        world = grid.World(checkpoint.load_class(meta['cell']), directions=meta['directions'],
+                           filename=os.path.join(self.directory, 'cells.npz'),
+                           storage=storage, wrap=meta.get('wrap', True))
+        for name in meta['agents']:
+            world.add(checkpoint.load_class(name)(), x=0, y=0, dir=0)
+        self.apply(world, 0)
+        return world
+
+    def apply(self, world, i):
+        """Move world's agents to where they were at tick i."""
+        row = self[i]
+        x, y, dir = row['x'].tolist(), row['y'].tolist(), row['dir'].tolist()
+        cell_x, cell_y = row['cell_x'].tolist(), row['cell_y'].tolist()
+        for k, agent in enumerate(world.agents):
+            cell = world.get_cell(cell_x[k], cell_y[k])
+            if agent.cell is not cell:
+                agent.cell = cell
+            agent.x = x[k]
+            agent.y = y[k]
+            agent.dir = dir[k]
+
+    def frames(self, world=None, every=1):
+        """(tick, t, svg) every so many ticks, rendered by grid.SVGRenderer."""
+        if world is None:
+            world = self.make_world()
+        renderer = grid.SVGRenderer(world)
+        try:
+            for i in range(0, self.length, every):
+                self.apply(world, i)
+                yield i, float(self[i]['t']), renderer.render()
+        finally:
+            renderer.close()
+
+
+class ReplayOutput(object):
+    """Node output moving world's agents to where they were at time t."""
+
+    def __init__(self, replay, world):
+        self.replay = replay
+        self.world = world
+
+    def __call__(self, t):
+        self.replay.apply(self.world, self.replay.index(t))
+
+
+def replay_model(directory, render_dt=0.005):
+    """
+    A network that replays a recording into a GridNode (model.env), for
+    nengo_gui or any other nengo frontend.
+    """
+    replay = Replay(directory)
+    world = replay.make_world()
+    model = nengo.Network(label='replay of %s' % directory)
+    with model:
+        model.replay = nengo.Node(ReplayOutput(replay, world), size_out=0)
+        model.env = grid.GridNode(world, dt=render_dt)
+    model.world = world
+    return model
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--every', type=int, default=100,
+                        help='ticks between frames')
+    parser.add_argument('--out', default=None,
+                        help='write SVG frames to this directory')
+    args = parser.parse_args(args)
+
+    replay = Replay(args.directory)
+    events = replay.events()
+    print('%d ticks of %d agents, %d colour events' % (
+        len(replay), len(replay.meta['agents']), len(events)))
+    for tick, t, agent, colour in events.tolist():
+        print('  t=%.3f agent %d on colour %d' % (t, agent, colour))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        count = 0
+        for i, t, svg in replay.frames(every=args.every):
+            with open(os.path.join(args.out, 'frame-%06d.svg' % i), 'w') as f:
+                f.write(svg)
+            count += 1
+        print('wrote %d frames to %s' % (count, args.out))
+
+
+if __name__ == '__main__':
+    main()
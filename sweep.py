@@ -0,0 +1,353 @@
+"""Sweep colour_critter's model parameters over many headless trials.
+
+The parameters build_model takes (D, n_neurons, radar_neurons,
+memory_threshold and memory_synapse) are searched over a grid of values, or
+sampled at random, and every point is run with a few seeds through
+headless.run_trial on a process pool.  Each finished (point, seed) result
+is appended to results.jsonl in the output directory as soon as it
+arrives, keyed on the parameters, the trial settings and the source of the
+model, so an interrupted sweep, or one given more values, points or seeds,
+only runs what it has not run before.  Editing colour_critter or grid
+starts afresh.  A point nengo cannot build is kept as an error; trials
+that failed any other way, such as running out of memory, are run again.
+
+For every point the sweep reports how often the counter matched the
+colours seen, how often the critter stopped correctly (see
+headless.run_trial), its neurons and the simulator steps per second, and
+picks the fastest point that stopped correctly often enough:
+
+    python sweep.py --out sweeps D=16,32,64 n_neurons=250,500,1000 --seeds 5
+    python sweep.py --out sweeps --random 40 radar_neurons=50:500 \\
+        memory_threshold=0.1:0.5 --seeds 3
+
+Values are listed as name=a,b,c; name=low:high is a range to sample from
+and only works with --random.  Parameters not given keep build_model's
+defaults.
+"""
+import argparse
+import csv
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import nengo
+import numpy as np
+
+import colour_critter
+import headless
+
+parameters = ('D', 'n_neurons', 'radar_neurons', 'memory_threshold', 'memory_synapse')
+
+# searched when no parameters are given
+default_space = dict(D=(16, 32), n_neurons=(250, 500, 1000), radar_neurons=(100, 250, 500))
+
+summary_fields = ('point', 'trials', 'errors', 'count_accuracy', 'stop_accuracy',
+                  'mean_time_to_stop', 'neurons', 'steps_per_second', 'build_time') + parameters
+
+
+def defaults():
+    """build_model's defaults for the swept parameters."""
+    signature = inspect.signature(colour_critter.build_model).parameters
+    return dict((name, signature[name].default) for name in parameters)
+
+
+class Range(object):
+    """
+    Values between low and high for random search, integers if both ends
+    are integers.
+    :param log: sample evenly on a log scale
+    """
+
+    def __init__(self, low, high, log=False):
+        self.low = low
+        self.high = high
+        self.log = log
+        self.integer = isinstance(low, int) and isinstance(high, int)
+
+    def sample(self, rng):
+        if self.log:
+            value = np.exp(rng.uniform(np.log(self.low), np.log(self.high)))
+        else:
+            value = rng.uniform(self.low, self.high)
+        return int(round(value)) if self.integer else float(value)
+
+    def __repr__(self):
+        return 'Range(%r, %r, log=%r)' % (self.low, self.high, self.log)
+
+
+def grid_points(space):
+    """Every combination of the values in space, a dict of name to values."""
+    for name, values in space.items():
+        if isinstance(values, Range):
+            raise ValueError('%s is a range; grids need a list of values' % name)
+    names = sorted(space)
+    base = defaults()
+    for combo in itertools.product(*(space[name] for name in names)):
+        yield dict(base, **dict(zip(names, combo)))
+
+
+def random_points(space, n, seed=0):
+    """
+    n points drawn from space, whose values are lists to choose from or
+    Ranges.  The same seed gives the same points, so asking for more only
+    adds to the end.
+    """
+    rng = random.Random(seed)
+    names = sorted(space)
+    base = defaults()
+    for i in range(n):
+        point = dict(base)
+        for name in names:
+            values = space[name]
+            if isinstance(values, Range):
+                point[name] = values.sample(rng)
+            else:
+                point[name] = rng.choice(list(values))
+        yield point
+
+
+def point_name(point):
+    return ' '.join('%s=%s' % (name, point[name]) for name in parameters)
+
+
+class ResultCache(object):
+    """
+    Finished trials, one JSON line each in directory/results.jsonl, by key.
+    A line cut short by an interrupted sweep is ignored, as are trials that
+    failed in a way that may not happen again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.filename = os.path.join(directory, 'results.jsonl')
+        self.records = {}
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('retry'):
+                        continue
+                    self.records[record['key']] = record
+        self.file = open(self.filename, 'a')
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def add(self, record):
+        self.records[record['key']] = record
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def make_tasks(points, seeds, trial=None):
+    """
+    run_point arguments for every seed of every point, each with the key
+    its result is cached under.
+    :param trial: run_trial arguments shared by all of them, such as
+        duration and max_colours
+    """
+    trial = dict(trial or {})
+    builder = colour_critter.CritterBuilder(memory=False)
+    for point in points:
+        for seed in seeds:
+            settings = dict(trial, seed=seed, model_params=sorted(point.items()))
+            yield dict(key=builder.key(settings), point=point, seed=seed, trial=trial)
+
+
+_builder = None
+
+
+def _init_worker(cache_dir):
+    global _builder
+    _builder = colour_critter.CritterBuilder(cache_dir=cache_dir, memory=False)
+
+
+def run_point(task):
+    """Runs one task from make_tasks and returns its record for the cache."""
+    record = dict(key=task['key'], point=task['point'], seed=task['seed'])
+    trial = task['trial']
+    try:
+        result = headless.run_trial(seed=task['seed'], builder=_builder,
+                                    model_params=task['point'], **trial)
+    except (ValueError, nengo.exceptions.NengoException) as e:
+        # a point nengo cannot build, such as a D too small for the
+        # vocabulary, fails the same way every time
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+        return record
+    except Exception as e:
+        # anything else, such as running out of memory or disk, may not
+        # happen again, so the task is run again by the next sweep
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+        record['retry'] = True
+        return record
+    steps = int(round(result['duration'] / trial.get('dt', 0.001)))
+    result['steps_per_second'] = steps / result['run_time']
+    record['result'] = result
+    return record
+
+
+def run(tasks, cache, workers=None, cache_dir=None):
+    """
+    Runs the tasks that are not in cache over a pool of workers, adding
+    each record to the cache as soon as it finishes.
+    :param cache_dir: directory for the workers' CritterBuilder
+    :return: the records of all the tasks, and how many were run
+    """
+    tasks = list(tasks)
+    todo = [task for task in tasks if task['key'] not in cache]
+    if todo:
+        if workers == 1:
+            _init_worker(cache_dir)
+            for record in map(run_point, todo):
+                cache.add(record)
+        else:
+            with multiprocessing.Pool(workers, _init_worker, (cache_dir,)) as pool:
+                for record in pool.imap_unordered(run_point, todo):
+                    cache.add(record)
+    return [cache[task['key']] for task in tasks], len(todo)
+
+
+def summarise(records):
+    """One row per point of the records, in the order they first appear."""
+    points = {}
+    for record in records:
+        name = point_name(record['point'])
+        points.setdefault(name, (record['point'], []))[1].append(record)
+
+    rows = []
+    for name, (point, group) in points.items():
+        results = [r['result'] for r in group if 'result' in r]
+        row = dict(point, point=name, trials=len(group), errors=len(group) - len(results))
+        if results:
+            stops = [r['time_to_stop'] for r in results if r['time_to_stop'] is not None]
+            row.update(
+                count_accuracy=np.mean([r['colours_counted'] == r['colours_seen']
+                                        for r in results]),
+                stop_accuracy=np.mean([r['stopped_correctly'] for r in results]),
+                mean_time_to_stop=np.mean(stops) if stops else None,
+                neurons=results[0]['neurons'],
+                steps_per_second=np.mean([r['steps_per_second'] for r in results]),
+                build_time=np.mean([r['build_time'] for r in results]))
+        rows.append(row)
+    return rows
+
+
+def cheapest(rows, min_accuracy=1.0):
+    """The fastest row that stopped correctly at least min_accuracy of the time."""
+    good = [row for row in rows if row.get('stop_accuracy', 0) >= min_accuracy]
+    if not good:
+        return None
+    return max(good, key=lambda row: row['steps_per_second'])
+
+
+def write_summary(rows, filename):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=summary_fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((name, row.get(name)) for name in summary_fields))
+
+
+def print_summary(rows, best=None):
+    print('%-75s %6s %6s %7s %9s' % ('point', 'count', 'stop', 'neurons', 'steps/s'))
+    for row in sorted(rows, key=lambda row: -row.get('steps_per_second', 0)):
+        if 'stop_accuracy' not in row:
+            print('%-75s  %d of %d trials failed' % (row['point'], row['errors'], row['trials']))
+            continue
+        print('%-75s %5.0f%% %5.0f%% %7d %9.0f%s' % (
+            row['point'], row['count_accuracy'] * 100, row['stop_accuracy'] * 100,
+            row['neurons'], row['steps_per_second'], '  <-' if row is best else ''))
+
+
+def parse_space(specs):
+    """name=a,b,c and name=low:high strings as a search space."""
+    def number(text):
+        value = float(text)
+        return int(value) if value.is_integer() and '.' not in text else value
+
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in parameters:
+            raise ValueError('%s is not one of %s' % (name, ', '.join(parameters)))
+        if ':' in values:
+            low, high = values.split(':')
+            space[name] = Range(number(low), number(high))
+        else:
+            space[name] = [number(v) for v in values.split(',')]
+    return space
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('space', nargs='*',
+                        help='name=a,b,c or name=low:high, for %s' % ', '.join(parameters))
+    parser.add_argument('--out', default='sweep',
+                        help='directory for results.jsonl and summary.csv')
+    parser.add_argument('--random', type=int, default=None,
+                        help='sample this many points rather than the whole grid')
+    parser.add_argument('--seeds', type=int, default=3, help='trials per point')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='first trial seed, and the seed of --random')
+    parser.add_argument('--map', default=None, help='ASCII map file')
+    parser.add_argument('--start', type=headless.parse_start, default=(1, 2))
+    parser.add_argument('--max-colours', type=int, default=colour_critter.MAX_COLOURS)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--bridge', type=int, default=1)
+    parser.add_argument('--counter', choices=('neural', 'reference'), default='neural',
+                        help='reference skips the neural colour stages, to tune '
+                             'navigation alone')
+    parser.add_argument('--min-accuracy', type=float, default=1.0,
+                        help='fraction of trials a point must stop correctly in')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='keep built models here, see headless.py')
+    args = parser.parse_args(args)
+
+    space = parse_space(args.space) if args.space else default_space
+    if args.random is None:
+        points = list(grid_points(space))
+    else:
+        points = list(random_points(space, args.random, args.seed))
+    trial = dict(start=args.start, max_colours=args.max_colours, duration=args.duration,
+                 bridge=args.bridge, counter=args.counter)
+    if args.map is not None:
+        with open(args.map) as f:
+            trial.update(map=f.read(), map_name=os.path.basename(args.map))
+    tasks = make_tasks(points, range(args.seed, args.seed + args.seeds), trial)
+
+    cache = ResultCache(args.out)
+    start = time.perf_counter()
+    try:
+        records, count = run(tasks, cache, workers=args.workers, cache_dir=args.cache_dir)
+    finally:
+        cache.close()
+    rows = summarise(records)
+    best = cheapest(rows, args.min_accuracy)
+    write_summary(rows, os.path.join(args.out, 'summary.csv'))
+    print_summary(rows, best)
+    print('%d points, %d trials run in %.1fs, %d from %s' % (
+        len(rows), count, time.perf_counter() - start, len(records) - count, cache.filename))
+    if best is None:
+        print('no point stopped correctly in %d%% of trials' % (args.min_accuracy * 100))
+    else:
+        print('cheapest: %s' % best['point'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture
+def colour_map():
+    """A 40x40 map of walls and colour tiles in colour_critter's characters."""
+    rng = np.random.RandomState(0)
+    chars = np.array(list(' GRBMY#'))
+    codes = rng.choice(len(chars), size=(40, 40), p=[0.63] + [0.014] * 5 + [0.3])
+    codes[[0, -1], :] = codes[:, [0, -1]] = len(chars) - 1
+    return '\n'.join(''.join(row) for row in chars[codes])
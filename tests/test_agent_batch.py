@@ -0,0 +1,50 @@
+"""AgentBatch moves agents exactly as ContinuousAgent.go_forward does."""
+import random
+
+import numpy as np
+import pytest
+
+import grid
+from colour_critter import Cell
+
+
+def spawn(world, n, seed=0):
+    random.seed(seed)
+    return grid.AgentBatch.spawn(world, n)
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+@pytest.mark.parametrize('directions', [4, 8])
+def test_batch_steps_match_agent_steps(colour_map, storage, directions):
+    world = grid.World(Cell, map=colour_map, directions=directions, storage=storage)
+    a = spawn(world, 30)
+    b = spawn(world, 30)
+    b.x[:], b.y[:], b.dir[:] = a.x, a.y, a.dir
+    b.cell_x[:], b.cell_y[:] = a.cell_x, a.cell_y
+    rng = np.random.RandomState(1)
+    turns = rng.uniform(-0.3, 0.3, size=(150, 30))
+    speeds = rng.uniform(0, 0.3, size=30)
+
+    b.speed[:] = speeds
+    for amounts in turns:
+        for agent, amount, speed in zip(a.agents, amounts.tolist(), speeds.tolist()):
+            agent.turn(amount)
+            agent.go_forward(speed)
+        b.turn(amounts)
+        b.step()
+    a.pull()
+    b.sync()
+
+    assert np.allclose(a.x, b.x) and np.allclose(a.y, b.y)
+    assert np.array_equal(a.cell_x, b.cell_x) and np.array_equal(a.cell_y, b.cell_y)
+    assert all(agent.cell is world.grid[agent.cell.y][agent.cell.x] for agent in b.agents)
+    assert not any(agent.cell.wall for agent in b.agents)
+
+
+def test_walls_stop_the_batch(colour_map):
+    world = grid.World(Cell, map=colour_map)
+    batch = spawn(world, 10)
+    batch.speed[:] = 1.0
+    for i in range(50):
+        batch.step()
+    assert not batch.walls[batch.cell_y, batch.cell_x].any()
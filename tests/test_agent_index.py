@@ -0,0 +1,110 @@
+"""AgentList keeps its index bookkeeping, and SpatialHash finds what a scan does."""
+import random
+
+import pytest
+
+import grid
+from colour_critter import Cell
+
+
+class Thing(object):
+    pass
+
+
+def check_indices(agents):
+    for i, agent in enumerate(agents):
+        assert agent.__dict__[agents.slot] == i
+
+
+def test_agent_list_swaps_the_last_agent_into_the_gap():
+    agents = grid.AgentList('_index')
+    things = [Thing() for i in range(5)]
+    for thing in things:
+        agents.append(thing)
+    agents.remove(things[1])
+    assert list(agents) == [things[0], things[4], things[2], things[3]]
+    assert '_index' not in things[1].__dict__
+    check_indices(agents)
+    agents.remove(things[3])
+    agents.remove(things[0])
+    assert list(agents) == [things[2], things[4]]
+    check_indices(agents)
+
+
+def test_agent_list_survives_changes_made_some_other_way():
+    agents = grid.AgentList('_index')
+    things = [Thing() for i in range(4)]
+    for thing in things:
+        agents.append(thing)
+    list.pop(agents, 0)
+    agents.remove(things[2])
+    assert list(agents) == [things[1], things[3]]
+    with pytest.raises(ValueError):
+        agents.remove(Thing())
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_world_and_cell_lists_follow_moves_and_removals(colour_map, storage):
+    world = grid.World(Cell, map=colour_map, storage=storage)
+    random.seed(0)
+    agents = [grid.ContinuousAgent() for i in range(40)]
+    for agent in agents:
+        world.add(agent, dir=0)
+    rng = random.Random(1)
+    for i in range(200):
+        agent = rng.choice(agents)
+        if agent.world is None:
+            world.add(agent, dir=0)
+        elif rng.random() < 0.3:
+            world.remove(agent)
+        else:
+            agent.cell = rng.choice(list(world.find_cells(lambda c: not c.wall)))
+
+    placed = [agent for agent in agents if agent.world is world]
+    assert sorted(map(id, world.agents)) == sorted(map(id, placed))
+    check_indices(world.agents)
+    for row in world.grid:
+        for cell in row:
+            check_indices(cell.agents)
+            assert all(agent.cell is cell for agent in cell.agents)
+    assert sum(len(cell.agents) for row in world.grid for cell in row) == len(placed)
+
+
+def scan(agents, x, y):
+    return sorted(((a.x - x) ** 2 + (a.y - y) ** 2, id(a), a) for a in agents)
+
+
+@pytest.mark.parametrize('bucket_size', [0.5, 1.0, 3.0])
+def test_spatial_hash_matches_a_scan(colour_map, bucket_size):
+    world = grid.World(Cell, map=colour_map)
+    random.seed(2)
+    agents = [grid.ContinuousAgent() for i in range(60)]
+    for agent in agents:
+        world.add(agent, dir=0)
+    spatial = grid.SpatialHash(world, bucket_size)
+    rng = random.Random(3)
+    for i in range(100):
+        agent = rng.choice(agents)
+        agent.go_forward(rng.uniform(0, 2))
+        agent.turn(rng.uniform(-1, 1))
+    world.remove(agents[0])
+    live = agents[1:]
+    assert len(spatial) == len(live)
+
+    for i in range(50):
+        x = rng.uniform(-2, world.width + 2)
+        y = rng.uniform(-2, world.height + 2)
+        radius = rng.uniform(0, 6)
+        expected = [a for d, _, a in scan(live, x, y) if d <= radius * radius]
+        assert sorted(map(id, spatial.within(x, y, radius))) == sorted(map(id, expected))
+
+        k = rng.randint(1, 8)
+        nearest = spatial.nearest(x, y, k)
+        distances = [d for d, _, a in scan(live, x, y)]
+        assert [d for d, _, a in scan(nearest, x, y)] == distances[:k]
+
+    exclude = live[0]
+    assert exclude not in spatial.nearest(exclude.x, exclude.y, 3, exclude=exclude)
+    assert exclude not in spatial.within(exclude.x, exclude.y, 2, exclude=exclude)
+    spatial.close()
+    assert world.spatial is None
@@ -0,0 +1,71 @@
+"""ContinuousAgent.cast_ray finds the first wall along a ray."""
+import math
+
+import pytest
+
+import grid
+from colour_critter import Cell
+
+box = """
+#######
+#     #
+#     #
+#     #
+#######
+"""
+
+
+def cast(map, x, y, direction, directions=4, max_distance=None):
+    world = grid.World(Cell, map=map, directions=directions)
+    agent = grid.ContinuousAgent()
+    world.add(agent, x=x, y=y, dir=0)
+    distance, cell = agent.cast_ray(direction, max_distance)
+    return distance, cell and (cell.x, cell.y)
+
+
+@pytest.mark.parametrize('direction, expected', [
+    (0, (1.5, (2, 0))),     # up
+    (1, (3.5, (6, 2))),     # right
+    (2, (1.5, (2, 4))),     # down
+    (3, (1.5, (0, 2))),     # left
+])
+def test_axis_aligned(direction, expected):
+    distance, cell = cast(box, 2, 2, direction)
+    assert distance == pytest.approx(expected[0])
+    assert cell == expected[1]
+
+
+def test_diagonal():
+    # down and to the right from (1, 2), meeting the bottom wall first
+    distance, cell = cast(box, 1, 2, 3, directions=8)
+    assert distance == pytest.approx(1.5 * math.sqrt(2))
+    assert cell == (2, 4)
+
+
+def test_fractional_direction_off_the_centre():
+    world = grid.World(Cell, map=box, directions=4)
+    agent = grid.ContinuousAgent()
+    world.add(agent, x=2, y=2, dir=0)
+    agent.x += 0.25
+    distance, cell = agent.cast_ray(1.5)
+    # (dx, dy) = (0.5, 0.5): the bottom wall at y = 3.5 is 3 steps on, by
+    # when x has reached 3.75
+    assert distance == pytest.approx(3 * math.sqrt(0.5))
+    assert (cell.x, cell.y) == (4, 4)
+
+
+def test_wraps_around_the_edge():
+    distance, cell = cast('#####\n  #  \n#####', 3, 1, 1)
+    assert distance == pytest.approx(3.5)
+    assert cell == (2, 1)
+
+
+def test_stops_at_a_corner_between_two_walls():
+    # walls touching only at a corner still block a ray through that corner
+    distance, cell = cast('#####\n# # #\n##  #\n#   #\n#####', 1, 1, 3, directions=8)
+    assert distance == pytest.approx(0.5 * math.sqrt(2))
+    assert cell in ((2, 1), (1, 2))
+
+
+def test_max_distance():
+    assert cast(box, 2, 2, 1, max_distance=2) == (2.0, None)
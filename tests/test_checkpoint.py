@@ -0,0 +1,71 @@
+"""A checkpoint that does not fit is refused before anything changes."""
+import nengo
+import numpy as np
+import pytest
+
+import checkpoint
+import grid
+
+
+def make(width=6, height=4, agent=grid.ContinuousAgent):
+    world = grid.World(grid.Cell, width=width, height=height, directions=4)
+    world.add(agent(), x=1, y=1, dir=0)
+    with nengo.Network(seed=0) as model:
+        stim = nengo.Node(np.sin)
+        ens = nengo.Ensemble(20, 1)
+        nengo.Connection(stim, ens)
+        probe = nengo.Probe(ens, synapse=0.01)
+    sim = nengo.Simulator(model, progress_bar=False)
+    return world, sim, probe
+
+
+def state(sim, probe):
+    return sim.n_steps, [value.copy() for signal, value in checkpoint._signals(sim)], \
+        len(sim.data[probe])
+
+
+@pytest.mark.parametrize('world', [
+    grid.World(grid.Cell, width=5, height=4, directions=4),
+    grid.World(grid.Cell, width=6, height=4, directions=4),
+])
+def test_mismatched_world_leaves_sim_untouched(tmpdir, world):
+    saved_world, sim, probe = make()
+    filename = str(tmpdir.join('run.npz'))
+    with sim:
+        sim.run(0.01)
+        checkpoint.save(filename, saved_world, sim)
+        sim.run(0.01)
+        if world.width == 6:
+            # the right size, but a different kind of agent
+            world.add(grid.Agent(), x=1, y=1, dir=0)
+        before = state(sim, probe)
+        with pytest.raises(checkpoint.CheckpointError):
+            checkpoint.restore(filename, world, sim)
+        after = state(sim, probe)
+    assert before[0] == after[0]
+    assert all(np.array_equal(a, b) for a, b in zip(before[1], after[1]))
+    assert before[2] == after[2]
+
+
+def test_restore_goes_back(tmpdir):
+    world, sim, probe = make()
+    filename = str(tmpdir.join('run.npz'))
+    with sim:
+        sim.run(0.01)
+        checkpoint.save(filename, world, sim)
+        saved = state(sim, probe)
+        world.agents[0].go_forward(0.5)
+        sim.run(0.01)
+        checkpoint.restore(filename, world, sim)
+        restored = state(sim, probe)
+    assert saved[0] == restored[0]
+    assert all(np.array_equal(a, b) for a, b in zip(saved[1], restored[1]))
+    assert world.agents[0].x == 1
+
+
+def test_simulators_without_the_internals_are_refused(tmpdir):
+    class Simulator(object):
+        pass
+
+    with pytest.raises(checkpoint.CheckpointError, match='_sim_data'):
+        checkpoint.save(str(tmpdir.join('run.npz')), sim=Simulator())
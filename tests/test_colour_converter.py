@@ -0,0 +1,87 @@
+"""The colour lookup tables give what the if/elif chains they replaced did."""
+import nengo.spa as spa
+import numpy as np
+import pytest
+
+import colour_critter
+
+colours = ['GREEN', 'RED', 'BLUE', 'MAGENTA', 'YELLOW']
+
+
+def old_converter(vocab, D, x):
+    if x == 1:
+        return vocab['GREEN'].v.reshape(D)
+    elif x == 2:
+        return vocab['RED'].v.reshape(D)
+    elif x == 3:
+        return vocab['BLUE'].v.reshape(D)
+    elif x == 4:
+        return vocab['MAGENTA'].v.reshape(D)
+    elif x == 5:
+        return vocab['YELLOW'].v.reshape(D)
+    else:
+        return vocab['WHITE'].v.reshape(D)
+
+
+def old_colour(cell):
+    if cell.wall:
+        return 'black'
+    elif cell.cellcolor == 1:
+        return 'green'
+    elif cell.cellcolor == 2:
+        return 'red'
+    elif cell.cellcolor == 3:
+        return 'blue'
+    elif cell.cellcolor == 4:
+        return 'magenta'
+    elif cell.cellcolor == 5:
+        return 'yellow'
+    return None
+
+
+@pytest.fixture
+def vocab():
+    vocab = spa.Vocabulary(16, rng=np.random.RandomState(0))
+    vocab.parse('+'.join(colours))
+    vocab.parse('WHITE')
+    vocab.parse('YES')
+    return vocab
+
+
+@pytest.mark.parametrize('x', [0, 1, 2, 3, 4, 5, 6, -1, 2.5, 0.999, 255])
+def test_converter_rows_match_the_old_outputs(vocab, x):
+    converter = colour_critter.ColourConverter(vocab, colours)
+    assert np.array_equal(converter(np.array([x], dtype=float)), old_converter(vocab, 16, x))
+
+
+def test_converter_rows_cannot_be_changed(vocab):
+    row = colour_critter.ColourConverter(vocab, colours)(np.array([1.0]))
+    with pytest.raises(ValueError):
+        row[0] = 0
+
+
+def test_spa_to_nengo_matches_the_old_output(vocab):
+    convert = colour_critter.SpaToNengo(vocab)
+    for x in (vocab['YES'].v, vocab['GREEN'].v, np.zeros(16)):
+        old = [1.] if vocab['YES'].dot(x) else [0.]
+        assert list(convert(x)) == old
+
+
+def test_palette_matches_the_old_cell_colours():
+    cell = colour_critter.Cell()
+    cell.wall = False
+    for c in range(7):
+        cell.cellcolor = c
+        assert cell.color() == old_colour(cell)
+    cell.wall = True
+    assert cell.color() == 'black'
+
+
+def test_palette_loads_and_saves_the_map_characters():
+    for char, c in zip(' GRBMY', range(6)):
+        cell = colour_critter.Cell()
+        cell.wall = False
+        cell.cellcolor = 0
+        cell.load(char)
+        assert cell.cellcolor == c
+        assert cell.save() == char
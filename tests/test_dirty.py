@@ -0,0 +1,77 @@
+"""Cell changes reach everything that watches the world, in both storages."""
+import nengo
+import pytest
+
+import colour_critter
+import grid
+
+
+def full_svg(world):
+    return sorted(grid.SVGRenderer(world, incremental=False).render().split('/>'))
+
+
+@pytest.fixture(params=['list', 'array'])
+def world(request):
+    return grid.World(colour_critter.Cell, map=colour_critter.mymap, directions=4,
+                      storage=request.param)
+
+
+def test_cell_changes_are_marked_dirty(world):
+    dirty = world.watch()
+    dirty.clear()
+    world.get_cell(3, 3).cellcolor = 2
+    world.get_cell(4, 4).wall = True
+    assert dirty == {(3, 3), (4, 4)}
+
+
+def test_placing_cells_and_agents_is_not_a_change(world):
+    dirty = world.watch()
+    dirty.clear()
+    world.add(grid.ContinuousAgent(), x=1, y=2, dir=0)
+    world.get_cell(3, 3).neighbours
+    assert not dirty
+
+
+def test_list_cells_only_report_while_watched():
+    class TickCell(grid.Cell):
+        def update(self):
+            self.wall = not self.wall
+
+    world = grid.World(TickCell, width=4, height=3)
+    assert '__setattr__' not in world.ListCell.__dict__
+    dirty = world.watch()
+    world.update()
+    dirty.clear()
+    world.get_cell(1, 2).wall = True
+    assert dirty == {(1, 2)}
+    world.unwatch(dirty)
+    assert '__setattr__' not in world.ListCell.__dict__
+
+
+def test_incremental_svg_follows_cell_changes(world):
+    renderer = grid.SVGRenderer(world)
+    renderer.render()
+    world.get_cell(3, 3).cellcolor = 2
+    world.get_cell(4, 4).wall = True
+    assert sorted(renderer.render().split('/>')) == full_svg(world)
+
+
+def test_grid_node_follows_cell_changes(world):
+    with nengo.Network():
+        output = grid.GridNode(world).output
+    output(0.0)
+    world.get_cell(1, 1).wall = False
+    world.get_cell(2, 1).cellcolor = 5
+    output(0.1)
+    assert sorted(output._nengo_html_.split('/>')) == full_svg(world)
+
+
+def test_colour_tracker_sees_colours_painted_under_agents(world):
+    agent = grid.ContinuousAgent()
+    world.add(agent, x=3, y=3, dir=0)
+    world.get_cell(3, 3).cellcolor = 0
+    tracker = grid.ColourTracker(world, [agent])
+    tracker(0.0)
+    world.get_cell(3, 3).cellcolor = 2
+    tracker(0.1)
+    assert tracker.events == [(0.1, 0, 'enter', 2)]
@@ -0,0 +1,55 @@
+"""ASCII, .npz and .npy maps round-trip through World in both storages."""
+import numpy as np
+import pytest
+
+import grid
+from colour_critter import Cell
+
+
+def same_fields(a, b):
+    return all(np.array_equal(a.get_array(name), b.get_array(name))
+               for name, dtype in Cell.array_fields)
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_ascii_round_trip(colour_map, storage):
+    world = grid.World(Cell, map=colour_map, storage=storage)
+    assert world.save() == colour_map + '\n'
+
+
+def test_storages_agree(colour_map):
+    assert same_fields(grid.World(Cell, map=colour_map, storage='list'),
+                       grid.World(Cell, map=colour_map, storage='array'))
+
+
+@pytest.mark.parametrize('name', ['map.npz', 'map'])
+def test_binary_round_trip(tmpdir, colour_map, name):
+    world = grid.World(Cell, map=colour_map, storage='array')
+    filename = str(tmpdir.join(name))
+    world.save_binary(filename)
+    loaded = grid.World(Cell, filename=filename)
+    assert loaded.storage == 'array'
+    assert same_fields(world, loaded)
+    assert loaded.save() == colour_map + '\n'
+    cell = loaded.get_cell(20, 20)
+    assert cell.wall == world.get_cell(20, 20).wall
+
+
+def test_binary_into_list_storage(tmpdir, colour_map):
+    world = grid.World(Cell, map=colour_map, storage='array')
+    filename = str(tmpdir.join('map.npz'))
+    world.save_binary(filename)
+    assert same_fields(world, grid.World(Cell, filename=filename, storage='list'))
+
+
+class UnlistedCell(Cell):
+    def load(self, char):
+        super(UnlistedCell, self).load(char)
+        self.food = char == 'F'
+
+
+def test_array_storage_rejects_fields_it_cannot_hold():
+    with pytest.raises(grid.CellularException, match='food'):
+        grid.World(UnlistedCell, map='#F#\n# #', storage='array')
+    world = grid.World(UnlistedCell, map='#F#\n# #', storage='list')
+    assert world.get_cell(1, 0).food
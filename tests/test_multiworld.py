@@ -0,0 +1,15 @@
+"""WorldHost picks up cell changes from worlds in both storages."""
+import colour_critter
+import multiworld
+
+
+def test_host_follows_cell_changes():
+    worlds = [colour_critter.make_world(storage=storage) for storage in ('list', 'array')]
+    host = multiworld.WorldHost(worlds)
+    for world in worlds:
+        world.get_cell(3, 3).wall = True
+        world.get_cell(4, 4).cellcolor = 5
+    host.sense()
+    for i, world in enumerate(worlds):
+        assert host.walls[i, 3, 3]
+        assert host.colours[i, 4, 4] == 5
@@ -0,0 +1,32 @@
+"""Planner paths follow wall changes in both storages."""
+import pytest
+
+import grid
+import planning
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_new_wall_is_planned_around(storage):
+    world = grid.World(grid.Cell, width=8, height=3, directions=4, storage=storage)
+    for y in range(3):
+        # so that the shortest way is not round the edge
+        world.get_cell(7, y).wall = True
+    planner = planning.Planner(world)
+    start, goal = world.get_cell(0, 1), world.get_cell(6, 1)
+    assert (3, 1) in [(c.x, c.y) for c in planner.path(start, goal)]
+    world.get_cell(3, 1).wall = True
+    path = [(c.x, c.y) for c in planner.path(start, goal)]
+    assert (3, 1) not in path
+    assert path[-1] == (6, 1)
+    assert planner.invalidations == 1
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_unrelated_change_keeps_the_cache(storage):
+    world = grid.World(grid.Cell, width=8, height=3, directions=4, storage=storage)
+    planner = planning.Planner(world)
+    planner.path(world.get_cell(0, 1), world.get_cell(6, 1))
+    world.get_cell(3, 1).wall = False
+    planner.path(world.get_cell(0, 1), world.get_cell(6, 1))
+    assert planner.invalidations == 0
+    assert planner.misses == 1
@@ -0,0 +1,90 @@
+"""profiling.enable() wraps its targets and disable() puts the originals back."""
+import importlib
+
+import pytest
+
+import grid
+import profiling
+from colour_critter import Cell
+
+
+def owners():
+    """(owner, name, whether the owner defines it itself, value) of every target."""
+    found = []
+    for module, path, label in profiling.targets:
+        owner = importlib.import_module(module)
+        names = path.split('.')
+        for name in names[:-1]:
+            owner = getattr(owner, name)
+        name = names[-1]
+        found.append((owner, name, name in owner.__dict__, getattr(owner, name)))
+    return found
+
+
+@pytest.fixture
+def profiler():
+    profiler = profiling.Profiler()
+    yield profiler
+    profiler.disable()
+
+
+def test_disable_restores_the_original_methods(profiler):
+    before = owners()
+    profiler.enable()
+    assert profiler.enabled and profiling.active is profiler
+    for owner, name, own, value in before:
+        assert owner.__dict__[name].profiled is value
+
+    profiler.disable()
+    assert not profiler.enabled and profiling.active is None
+    for (owner, name, own, value), (o, n, own_after, after) in zip(before, owners()):
+        assert own_after == own
+        assert after is value
+
+
+def test_enabling_twice_wraps_once(profiler):
+    original = grid.World.__dict__['update']
+    profiler.enable()
+    profiler.enable()
+    assert grid.World.update.profiled is original
+    profiler.disable()
+    assert grid.World.__dict__['update'] is original
+
+
+def test_calls_are_counted_only_while_enabled(profiler):
+    world = grid.World(Cell, map='####\n#  #\n####')
+    agent = grid.ContinuousAgent()
+    world.add(agent, x=1, y=1, dir=1)
+    world.update()
+    profiler.enable()
+    for i in range(3):
+        world.update()
+        agent.go_forward(0.1)
+    profiler.disable()
+    world.update()
+
+    assert profiler.stats['World.update'].calls == 3
+    assert profiler.stats['ContinuousAgent.go_in_direction'].calls == 3
+    stat = profiler.stats['World.update']
+    assert 0 <= stat.self_time <= stat.total
+    assert sum(stat.histogram) == stat.calls
+
+
+def test_instrumented_functions_report_to_the_enabled_profiler(profiler):
+    @profiling.instrument('inner')
+    def inner():
+        return 1
+
+    @profiling.instrument('outer')
+    def outer():
+        return inner() + inner()
+
+    assert outer() == 2
+    assert profiler.stats == {}
+    profiler.enable(targets=())
+    outer()
+    profiler.disable()
+    outer()
+    assert profiler.stats['outer'].calls == 1
+    assert profiler.stats['inner'].calls == 2
+    assert set(profiler.stacks) == {('outer',), ('outer', 'inner')}
@@ -0,0 +1,54 @@
+"""Rasteriser frames follow cell changes in both storages."""
+import pytest
+
+import colour_critter
+import grid
+import raster
+
+
+class BagCell(grid.Cell):
+    """A cell whose colour depends on a list changed in place."""
+
+    def load(self, char):
+        self.wall = char == '#'
+        self.food = []
+
+    def color(self):
+        return 'black' if self.wall else ('green' if self.food else 'white')
+
+
+def full_frame(world):
+    return raster.Rasteriser(world, incremental=False).render().copy()
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_frames_follow_cell_changes(storage):
+    world = colour_critter.make_world(storage=storage)
+    rasteriser = raster.Rasteriser(world)
+    rasteriser.render()
+    world.get_cell(3, 3).cellcolor = 2
+    world.get_cell(4, 4).wall = True
+    assert (rasteriser.render() == full_frame(world)).all()
+
+
+def test_storages_draw_the_same_picture():
+    frames = [full_frame(colour_critter.make_world(storage=storage))
+              for storage in ('list', 'array')]
+    assert (frames[0] == frames[1]).all()
+
+
+def test_list_cells_are_coloured_per_combination_of_fields():
+    world = colour_critter.make_world()
+    rasteriser = raster.Rasteriser(world)
+    cells = rasteriser.update_cells()
+    for row in world.grid:
+        for cell in row:
+            assert tuple(cells[cell.y, cell.x]) == rasteriser.cell_rgb(cell)
+
+
+def test_full_redraws_see_unmarked_changes():
+    world = grid.World(BagCell, map='#####\n#   #\n#####', directions=4)
+    rasteriser = raster.Rasteriser(world, incremental=False)
+    rasteriser.render()
+    world.get_cell(2, 1).food.append('seed')
+    assert (rasteriser.render() == full_frame(world)).all()
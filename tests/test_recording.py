@@ -0,0 +1,100 @@
+"""What a Recorder writes, Replay reads back tick for tick."""
+import json
+import os
+
+import numpy as np
+import pytest
+
+import colour_critter
+import grid
+import recording
+
+
+def run(world, agents, recorder, ticks, sensors=None):
+    """Moves the agents about for ticks, recording them; returns what was seen."""
+    rng = np.random.RandomState(0)
+    seen = []
+    for tick in range(ticks):
+        for agent in agents:
+            agent.turn(rng.uniform(-0.5, 0.5))
+            agent.go_forward(0.2)
+        if sensors is not None:
+            sensors[:] = rng.uniform(size=sensors.shape)
+        recorder(tick * 0.001)
+        seen.append([(a.x, a.y, a.dir, a.cell.x, a.cell.y, a.cell.cellcolor) for a in agents]
+                    + [None if sensors is None else sensors.copy()])
+    return seen
+
+
+@pytest.fixture
+def world():
+    world = colour_critter.make_world()
+    for x, y in ((1, 2), (3, 3)):
+        world.add(grid.ContinuousAgent(), x=x, y=y, dir=1)
+    return world
+
+
+@pytest.mark.parametrize('ticks', [20, 21, 5])
+def test_replay_reads_back_every_tick(tmp_path, world, ticks):
+    directory = str(tmp_path / 'run')
+    sensors = np.zeros((2, 3))
+    recorder = recording.Recorder(world, directory, sensors=sensors, chunk=7, buffers=2)
+    seen = run(world, world.agents, recorder, ticks, sensors)
+    recorder.close()
+
+    with open(os.path.join(directory, 'meta.json')) as f:
+        assert json.load(f)['ticks'] == ticks
+    replay = recording.Replay(directory)
+    assert len(replay) == ticks
+    assert len(replay.files) == (ticks + 6) // 7
+    for i, row in enumerate(replay):
+        assert row['tick'] == i and row['t'] == i * 0.001
+        for k, (x, y, dir, cell_x, cell_y, colour) in enumerate(seen[i][:-1]):
+            assert (row['x'][k], row['y'][k], row['dir'][k]) == (x, y, dir)
+            assert (row['cell_x'][k], row['cell_y'][k], row['colour'][k]) == (
+                cell_x, cell_y, colour)
+        assert np.array_equal(row['sensors'], seen[i][-1])
+    assert replay[-1]['tick'] == ticks - 1
+    assert replay.index(0.0105) == min(10, ticks - 1)
+
+
+def test_close_flushes_the_last_partial_chunk(tmp_path, world):
+    directory = str(tmp_path / 'run')
+    recorder = recording.Recorder(world, directory, chunk=1000)
+    run(world, world.agents, recorder, 10)
+    assert recording._chunk_files(directory, 'ticks-') == []
+    recorder.close()
+    assert recording._chunk_files(directory, 'ticks-') == ['ticks-000000.npy']
+    assert len(recording.Replay(directory)) == 10
+    recorder.close()
+
+
+def test_colour_events_are_logged_on_entering_a_colour(tmp_path, world):
+    directory = str(tmp_path / 'run')
+    agent = world.agents[0]
+    recorder = recording.Recorder(world, directory, agents=[agent], chunk=4)
+    coloured = next(iter(world.find_cells(lambda c: c.cellcolor and not c.wall)))
+    plain = world.get_cell(1, 2)
+    for tick, cell in enumerate([plain, coloured, coloured, plain, coloured, plain]):
+        agent.cell = cell
+        recorder(tick * 0.5)
+    recorder.close()
+
+    events = recording.Replay(directory).events()
+    assert events['tick'].tolist() == [1, 4]
+    assert events['t'].tolist() == [0.5, 2.0]
+    assert events['colour'].tolist() == [coloured.cellcolor] * 2
+    assert events['agent'].tolist() == [0, 0]
+
+
+def test_replayed_world_follows_the_recording(tmp_path, world):
+    directory = str(tmp_path / 'run')
+    with recording.Recorder(world, directory, chunk=8) as recorder:
+        seen = run(world, world.agents, recorder, 30)
+    replay = recording.Replay(directory)
+    copy = replay.make_world(storage='list')
+    assert copy.save() == world.save()
+    for i in (0, 17, 29):
+        replay.apply(copy, i)
+        for agent, state in zip(copy.agents, seen[i]):
+            assert (agent.x, agent.y, agent.dir, agent.cell.x, agent.cell.y) == state[:5]
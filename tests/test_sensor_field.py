@@ -0,0 +1,84 @@
+"""SensorField reads against exact rays, and its incremental updates."""
+import random
+
+import numpy as np
+import pytest
+
+import grid
+import maze
+from colour_critter import Cell
+
+max_distance = 4
+
+
+def make_world(storage='array', size=32):
+    arrays = maze.generate(size, size, 'prim', seed=1, colour_density=0.05)
+    return grid.World(Cell, map=maze.to_text(arrays), directions=4, storage=storage)
+
+
+def open_cells(world):
+    return [c for c in world.find_cells(lambda c: not c.wall)]
+
+
+def place(agent, cell, x, y):
+    agent.cell = cell
+    agent.x = x
+    agent.y = y
+
+
+def exact_and_read(agent, direction):
+    exact = agent.cast_ray(direction, max_distance)
+    read = agent.detect(direction, max_distance, method='field')
+    return exact[0], read[0]
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.uint8, np.uint16])
+def test_samples_match_cast_ray(dtype):
+    world = make_world()
+    agent = grid.ContinuousAgent()
+    world.add(agent, dir=0)
+    field = grid.SensorField(world, max_distance, resolution=2, headings=32, dtype=dtype)
+    # integer tables hold distances in steps of field.unit
+    quantum = field.unit if field.dtype.kind in 'ui' else 0.0
+    rng = random.Random(0)
+    cells = open_cells(world)
+    for i in range(500):
+        cell = rng.choice(cells)
+        place(agent, cell, cell.x - 0.5 + (rng.randrange(2) + 0.5) / 2,
+              cell.y - 0.5 + (rng.randrange(2) + 0.5) / 2)
+        exact, read = exact_and_read(agent, rng.randrange(32) / field.per_direction)
+        assert abs(exact - read) <= quantum + 1e-4
+
+
+def test_random_reads_are_mostly_within_the_bound():
+    world = make_world()
+    agent = grid.ContinuousAgent()
+    world.add(agent, dir=0)
+    resolution = 4
+    grid.SensorField(world, max_distance, resolution=resolution, headings=64)
+    rng = random.Random(1)
+    cells = open_cells(world)
+    errors = []
+    for i in range(2000):
+        cell = rng.choice(cells)
+        place(agent, cell, cell.x + rng.uniform(-0.5, 0.5), cell.y + rng.uniform(-0.5, 0.5))
+        exact, read = exact_and_read(agent, rng.uniform(0, world.directions))
+        errors.append(abs(exact - read))
+    # a read is from a sample up to one sample width away, in a heading up
+    # to half a heading step off; rays grazing corners are out by more
+    assert np.mean(np.array(errors) <= 1.5 / resolution) >= 0.9
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_incremental_update_matches_rebuild(storage):
+    world = make_world(storage)
+    agent = grid.ContinuousAgent()
+    world.add(agent, dir=0)
+    field = grid.SensorField(world, max_distance, resolution=2, headings=32)
+    world.get_cell(9, 9).wall = not world.get_cell(9, 9).wall
+    world.get_cell(20, 12).wall = not world.get_cell(20, 12).wall
+    agent.detect(0.0, max_distance, method='field')
+    assert (field.rebuilds, field.updates) == (1, 1)
+    updated = field.table.copy()
+    field.rebuild()
+    assert np.array_equal(updated, field.table)
@@ -0,0 +1,31 @@
+"""Which failed sweep trials are cached and which are run again."""
+import nengo
+import pytest
+
+import headless
+import sweep
+
+
+def failing_trial(error):
+    def run_trial(**kwargs):
+        raise error
+    return run_trial
+
+
+@pytest.mark.parametrize('error, cached', [
+    (nengo.exceptions.ValidationError('too small for the vocabulary', 'D'), True),
+    (nengo.exceptions.BuildError('cannot build'), True),
+    (MemoryError(), False),
+    (OSError('disk full'), False),
+])
+def test_only_build_errors_are_cached(tmpdir, monkeypatch, error, cached):
+    monkeypatch.setattr(headless, 'run_trial', failing_trial(error))
+    cache = sweep.ResultCache(str(tmpdir))
+    tasks = list(sweep.make_tasks([dict(D=4)], [0]))
+    records, run = sweep.run(tasks, cache, workers=1)
+    cache.close()
+    assert run == 1
+    assert 'error' in records[0]
+    reloaded = sweep.ResultCache(str(tmpdir))
+    assert (tasks[0]['key'] in reloaded) == cached
+    reloaded.close()
@@ -0,0 +1,101 @@
+"""Topology neighbour tables agree with the wrap arithmetic they replaced."""
+import numpy as np
+import pytest
+
+import grid
+from colour_critter import Cell
+
+old_offsets = {
+    4: (((0, -1), (1, 0), (0, 1), (-1, 0)),) * 2,
+    6: (((1, 0), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1)),
+        ((1, 0), (1, 1), (0, 1), (-1, 0), (0, -1), (1, -1))),
+    8: (((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)),) * 2,
+}
+
+
+def old_point(width, height, directions, x, y, dir):
+    dx, dy = old_offsets[directions][y % 2][dir]
+
+    x2 = x + dx
+    y2 = y + dy
+
+    if x2 < 0:
+        x2 += width
+    if y2 < 0:
+        y2 += height
+    if x2 >= width:
+        x2 -= width
+    if y2 >= height:
+        y2 -= height
+
+    return x2, y2
+
+
+def bounded_point(width, height, directions, x, y, dir):
+    dx, dy = old_offsets[directions][y % 2][dir]
+    if 0 <= x + dx < width and 0 <= y + dy < height:
+        return x + dx, y + dy
+    return x, y
+
+
+def cells(world):
+    for y in range(world.height):
+        for x in range(world.width):
+            yield x, y
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+@pytest.mark.parametrize('directions', [4, 6, 8])
+@pytest.mark.parametrize('wrap', [True, False])
+def test_neighbours_match_the_old_arithmetic(directions, storage, wrap):
+    width, height = 7, 6
+    world = grid.World(Cell, width, height, directions=directions, storage=storage, wrap=wrap)
+    expect = old_point if wrap else bounded_point
+    index = world.topology.neighbour_index
+    assert index.shape == (height, width, directions)
+    for x, y in cells(world):
+        cell = world.grid[y][x]
+        for dir in range(directions):
+            x2, y2 = expect(width, height, directions, x, y, dir)
+            assert world.get_point_in_direction(x, y, dir) == (x2, y2)
+            assert tuple(world.get_offset_in_direction(x, y, dir)) == \
+                old_offsets[directions][y % 2][dir]
+            assert cell.neighbours[dir] is world.grid[y2][x2]
+            assert index[y, x, dir] == y2 * width + x2
+
+
+@pytest.mark.parametrize('directions', [4, 6, 8])
+@pytest.mark.parametrize('wrap', [True, False])
+def test_bulk_lookups_match_single_ones(directions, wrap):
+    topology = grid.topologies[directions](7, 6, wrap)
+    ys, xs = np.mgrid[0:6, 0:7]
+    for dir in range(directions):
+        px, py = topology.points(xs, ys, dir)
+        for x, y in zip(xs.ravel().tolist(), ys.ravel().tolist()):
+            assert (px[y, x], py[y, x]) == topology.point(x, y, dir)
+    flat = np.arange(7 * 6)
+    assert np.array_equal(topology.neighbours(flat), topology.neighbour_index.reshape(42, -1))
+    assert np.array_equal(topology.neighbours(flat, 1), topology.neighbour_index[:, :, 1].ravel())
+
+
+def test_unknown_direction_counts_are_refused():
+    with pytest.raises(grid.CellularException):
+        grid.World(Cell, 5, 5, directions=5)
+
+
+def test_bounded_worlds_stop_agents_at_the_edge():
+    world = grid.World(Cell, 5, 5, directions=4, wrap=False)
+    agent = grid.ContinuousAgent()
+    world.add(agent, x=4, y=2, dir=1)
+    assert agent.go_forward(0.4)
+    assert not agent.go_forward(0.4)
+    assert (agent.x, agent.cell.x) == (4.4, 4)
+
+    distance, cell = agent.cast_ray(3)
+    assert distance == pytest.approx(4.9)
+    assert (cell.x, cell.y) == (0, 2)
+    assert agent.cast_ray(1) == (pytest.approx(0.1), agent.cell)
+
+    batch = grid.AgentBatch(world, [agent])
+    batch.speed[:] = 0.4
+    assert not batch.step().any()
@@ -0,0 +1,26 @@
+"""WorldStream sends the cells that changed, in both storages."""
+import struct
+
+import pytest
+
+import colour_critter
+import viewer
+
+
+def changed_cells(stream, last):
+    frame, version = stream.frame(last)
+    kind, version, width, height, cells, agents = struct.unpack_from('<BIHHII', frame)
+    return cells
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_stream_sends_changed_cells(storage):
+    world = colour_critter.make_world(storage=storage)
+    stream = viewer.WorldStream(world)
+    last = stream.version
+    stream.capture(block=True)
+    assert changed_cells(stream, last) == 0
+    world.get_cell(3, 3).wall = not world.get_cell(3, 3).wall
+    stream.capture(block=True)
+    assert changed_cells(stream, last) == 1
+    stream.close()
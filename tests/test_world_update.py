@@ -0,0 +1,62 @@
+"""World.update evolves the same way in every storage and update path."""
+import numpy as np
+import pytest
+
+import grid
+
+
+class LifeCell(grid.Cell):
+    alive = False
+    array_fields = grid.Cell.array_fields + (('alive', np.bool_),)
+
+    def update(self):
+        n = 0
+        for c in self.neighbours:
+            if c.alive:
+                n += 1
+        self.alive = n == 3 or (self.alive and n == 2)
+
+
+class BatchedLifeCell(LifeCell):
+    @classmethod
+    def update_arrays(cls, world, old, new):
+        n = world.neighbour_sum(old['alive'].view(np.uint8))
+        new['alive'][...] = (n == 3) | (old['alive'] & (n == 2))
+
+
+def make_world(cell, size, storage):
+    world = grid.World(cell, width=size, height=size, storage=storage)
+    alive = np.random.RandomState(0).rand(size, size) < 0.3
+    for y, row in enumerate(world.grid):
+        for x, c in enumerate(row):
+            c.alive = bool(alive[y, x])
+    return world
+
+
+def test_paths_agree():
+    worlds = [make_world(LifeCell, 32, 'list'), make_world(LifeCell, 32, 'array'),
+              make_world(BatchedLifeCell, 32, 'array')]
+    for i in range(10):
+        for world in worlds:
+            world.update()
+    alive = [np.asarray(world.get_array('alive')) for world in worlds]
+    assert alive[0].any()
+    assert (alive[0] == alive[1]).all()
+    assert (alive[0] == alive[2]).all()
+
+
+class FailingCell(LifeCell):
+    def update(self):
+        if self.x == 3:
+            raise RuntimeError('update failed')
+        super(FailingCell, self).update()
+
+
+def test_failed_update_leaves_cells_on_the_arrays():
+    world = make_world(FailingCell, 8, 'array')
+    with pytest.raises(RuntimeError):
+        world.update()
+    assert isinstance(world.ViewCell.__dict__['alive'], grid.ArrayField)
+    cell = world.get_cell(1, 1)
+    cell.alive = True
+    assert world.arrays['alive'][1, 1]
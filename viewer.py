@@ -0,0 +1,429 @@
+"""Watch worlds live in a browser, without nengo_gui.
+
+ViewServer is a small HTTP and WebSocket server running an asyncio loop
+on its own thread.  Each world it shows has a WorldStream, called every
+tick by the simulation like a recording.Recorder: while anyone is
+watching, and at most max_fps times a second, it brings the cell colours
+up to date (through raster.Rasteriser, so only changed cells are worked
+out), numbers the cells that changed with the new version and copies the
+agents.  It never waits for the server: if a client is being sent a frame
+at that moment the tick is skipped and the changes are picked up the next
+time.
+
+Every client is sent frames at its own rate: its first frame holds every
+cell, and later ones only the cells changed since the version it last
+got, and all the agents.  A slow client only falls behind itself, and
+skips versions rather than queueing them.
+
+    server = ViewServer(port=8765).start()
+    critter.stream(server)          # or server.stream(world) and call it
+    sim.run(3600)                   # while watching http://localhost:8765/
+
+headless.py --view 8765 does the same for its trials, and recordings can
+be replayed to it:
+
+    python viewer.py records/trial-0 --port 8765 --speed 2
+
+Frames are binary WebSocket messages, little-endian: a header of kind (0
+for every cell, 1 for changes), version, width and height (uint16), the
+number of cells and of agents (uint32); the flat index of each cell
+(uint32), their colours as RGB bytes; then for each agent x and y
+(float32), heading in 64ths of a turn, shape (0 triangle, 1 circle) and
+RGB bytes.  A client can send the text 'fps N' to change its rate.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+import raster
+import recording
+
+agent_dtype = np.dtype([('x', '<f4'), ('y', '<f4'), ('heading', 'u1'), ('shape', 'u1'),
+                        ('rgb', 'u1', 3)])
+shapes = {'triangle': 0, 'circle': 1}
+
+_accept_guid = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class WorldStream(object):
+    """
+    A world's changes for ViewServer, captured every time it is called
+    with the time while anyone is watching.
+    :param max_fps: most captures a second of wall-clock time
+    """
+
+    def __init__(self, world, name='world', max_fps=30):
+        self.world = world
+        self.name = name
+        self.interval = 1.0 / max_fps
+        self.rasteriser = raster.Rasteriser(world, scale=1)
+        self.dirty = world.watch()
+        self.lock = threading.Lock()
+        self.version = 0
+        self.cell_version = np.zeros(world.width * world.height, dtype=np.int64)
+        self.agents = np.zeros(0, dtype=agent_dtype)
+        self.clients = 0
+        self.captured = None
+        self.captures = 0
+        self.skipped = 0
+        self.capture()
+
+    def close(self):
+        self.rasteriser.close()
+        if self.dirty is not None:
+            self.world.unwatch(self.dirty)
+            self.dirty = None
+
+    def __call__(self, t=None):
+        if not self.clients:
+            return
+        if time.perf_counter() - self.captured < self.interval:
+            return
+        self.capture()
+
+    def capture(self, block=False):
+        """Take the world's changes as a new version, unless the server is reading them."""
+        if not self.lock.acquire(block):
+            self.skipped += 1
+            return False
+        try:
+            self.rasteriser.update_cells()
+            version = self.version + 1
+            if None in self.dirty:
+                self.cell_version[:] = version
+            else:
+                width = self.world.width
+                for x, y in self.dirty:
+                    self.cell_version[y * width + x] = version
+            self.dirty.clear()
+            state = self.rasteriser.agent_state()
+            agents = np.zeros(len(state), dtype=agent_dtype)
+            for i, (x, y, heading, shape, rgb) in enumerate(state):
+                agents[i] = (x, y, heading, shapes.get(shape, 0), rgb)
+            self.agents = agents
+            self.version = version
+        finally:
+            self.lock.release()
+        self.captured = time.perf_counter()
+        self.captures += 1
+        return True
+
+    def frame(self, last=0):
+        """
+        The frame taking a client from version last to the latest.
+        :return: the frame and its version
+        """
+        with self.lock:
+            version = self.version
+            if last:
+                index = np.flatnonzero(self.cell_version > last)
+            else:
+                index = np.arange(len(self.cell_version))
+            rgb = self.rasteriser.cells.reshape(-1, 3)[index]
+            agents = self.agents
+        world = self.world
+        header = struct.pack('<BIHHII', 1 if last else 0, version, world.width,
+                             world.height, len(index), len(agents))
+        return b''.join([header, index.astype('<u4').tobytes(), rgb.tobytes(),
+                         agents.tobytes()]), version
+
+
+def encode(payload, opcode=2):
+    """The header of an unmasked, unfragmented WebSocket message."""
+    n = len(payload)
+    if n < 126:
+        return struct.pack('!BB', 0x80 | opcode, n)
+    if n < 65536:
+        return struct.pack('!BBH', 0x80 | opcode, 126, n)
+    return struct.pack('!BBQ', 0x80 | opcode, 127, n)
+
+
+async def read_message(reader, limit=65536):
+    """(opcode, payload) of the next message from a client."""
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0f
+    n = head[1] & 0x7f
+    if n == 126:
+        n = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if n > limit:
+        raise ConnectionError('message of %d bytes' % n)
+    mask = await reader.readexactly(4) if head[1] & 0x80 else None
+    data = await reader.readexactly(n)
+    if mask is not None:
+        data = (np.frombuffer(data, dtype=np.uint8) ^
+                np.resize(np.frombuffer(mask, dtype=np.uint8), n)).tobytes()
+    return opcode, data
+
+
+class ViewServer(object):
+    """
+    Serves a page drawing the streams at http://host:port/?world=name,
+    and their frames at ws://host:port/ws?world=name&fps=N.
+    :param fps: frames a second for clients that do not ask for a rate
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, fps=10, max_fps=30):
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.max_fps = max_fps
+        self.streams = {}
+        self.loop = None
+        self.thread = None
+        self.server = None
+
+    def stream(self, world, name=None):
+        """Start showing world; call the WorldStream returned every tick."""
+        if name is None:
+            name = 'world' if not self.streams else 'world-%d' % len(self.streams)
+        stream = self.streams[name] = WorldStream(world, name, self.max_fps)
+        return stream
+
+    def start(self):
+        """Run the server on its own thread; port 0 picks a free port."""
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._connect, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name='ViewServer', daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def close(self):
+        if self.thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        self.thread.join()
+        self.thread = None
+        for stream in self.streams.values():
+            stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def _shutdown(self):
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % (self.host, self.port)
+
+    async def _connect(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            lines = request.decode('latin-1').split('\r\n')
+            method, target = lines[0].split(' ')[:2]
+            headers = dict((k.strip().lower(), v.strip()) for k, _, v in
+                           (line.partition(':') for line in lines[1:] if line))
+            url = urllib.parse.urlsplit(target)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            if url.path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                name = query.get('world') or next(iter(self.streams), None)
+                if name not in self.streams:
+                    self._respond(writer, '404 Not Found', 'text/plain', b'no such world')
+                else:
+                    await self._websocket(reader, writer, headers, self.streams[name],
+                                          float(query.get('fps', self.fps)))
+            elif url.path == '/':
+                self._respond(writer, '200 OK', 'text/html; charset=utf-8', page.encode())
+            elif url.path == '/streams':
+                self._respond(writer, '200 OK', 'application/json',
+                              json.dumps(sorted(self.streams)).encode())
+            else:
+                self._respond(writer, '404 Not Found', 'text/plain', b'not found')
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # the server is closing
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, writer, status, content_type, body):
+        writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n'
+                      'Connection: close\r\n\r\n' % (status, content_type, len(body))).encode())
+        writer.write(body)
+
+    async def _websocket(self, reader, writer, headers, stream, fps):
+        key = headers.get('sec-websocket-key', '').encode()
+        accept = base64.b64encode(hashlib.sha1(key + _accept_guid).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                      'Connection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n' % accept).encode())
+        client = dict(interval=1.0 / min(max(fps, 0.1), self.max_fps), closed=asyncio.Event())
+        listener = asyncio.ensure_future(self._listen(reader, writer, client))
+        stream.clients += 1
+        try:
+            last = 0
+            while not client['closed'].is_set():
+                started = self.loop.time()
+                if stream.version > last:
+                    frame, last = stream.frame(last)
+                    writer.write(encode(frame))
+                    writer.write(frame)
+                    await writer.drain()
+                wait = client['interval'] - (self.loop.time() - started)
+                try:
+                    await asyncio.wait_for(client['closed'].wait(), max(0.0, wait))
+                except asyncio.TimeoutError:
+                    pass
+        except ConnectionError:
+            pass
+        finally:
+            stream.clients -= 1
+            listener.cancel()
+
+    async def _listen(self, reader, writer, client):
+        try:
+            while True:
+                opcode, data = await read_message(reader)
+                if opcode == 8:
+                    writer.write(encode(data[:2], 8) + data[:2])
+                    break
+                elif opcode == 9:
+                    writer.write(encode(data, 10) + data)
+                elif opcode == 1 and data.startswith(b'fps '):
+                    fps = min(max(float(data[4:]), 0.1), self.max_fps)
+                    client['interval'] = 1.0 / fps
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        client['closed'].set()
+
+
+page = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>world</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+#view { position: relative; }
+#view canvas { position: absolute; left: 0; top: 0; image-rendering: pixelated; }
+</style></head>
+<body><div id="status">connecting</div><div id="view">
+<canvas id="cells"></canvas><canvas id="agents"></canvas></div>
+<script>
+const params = new URLSearchParams(location.search);
+const scale = +(params.get('scale') || 8);
+const cells = document.getElementById('cells'), agents = document.getElementById('agents');
+const ctx = cells.getContext('2d'), actx = agents.getContext('2d');
+const status = document.getElementById('status');
+let image = null, frames = 0;
+const ws = new WebSocket('ws://' + location.host + '/ws?world=' +
+                         encodeURIComponent(params.get('world') || '') +
+                         '&fps=' + (params.get('fps') || 10));
+ws.binaryType = 'arraybuffer';
+ws.onclose = () => { status.textContent = 'disconnected'; };
+ws.onmessage = (event) => {
+  const v = new DataView(event.data);
+  const version = v.getUint32(1, true), w = v.getUint16(5, true), h = v.getUint16(7, true);
+  const nc = v.getUint32(9, true), na = v.getUint32(13, true);
+  if (!image || image.width != w || image.height != h) {
+    cells.width = w; cells.height = h;
+    agents.width = w * scale; agents.height = h * scale;
+    cells.style.width = agents.style.width = w * scale + 'px';
+    cells.style.height = agents.style.height = h * scale + 'px';
+    document.getElementById('view').style.height = h * scale + 'px';
+    image = ctx.createImageData(w, h);
+  }
+  const px = image.data;
+  let o = 17;
+  for (let i = 0; i < nc; i++) {
+    const c = v.getUint32(o + 4 * i, true) * 4, p = o + 4 * nc + 3 * i;
+    px[c] = v.getUint8(p); px[c + 1] = v.getUint8(p + 1); px[c + 2] = v.getUint8(p + 2);
+    px[c + 3] = 255;
+  }
+  o += 7 * nc;
+  ctx.putImageData(image, 0, 0);
+  actx.clearRect(0, 0, agents.width, agents.height);
+  for (let i = 0; i < na; i++, o += 13) {
+    const x = v.getFloat32(o, true), y = v.getFloat32(o + 4, true);
+    actx.fillStyle = 'rgb(' + v.getUint8(o + 10) + ',' + v.getUint8(o + 11) + ',' +
+                     v.getUint8(o + 12) + ')';
+    actx.save();
+    actx.translate((x + 0.5) * scale, (y + 0.5) * scale);
+    actx.beginPath();
+    if (v.getUint8(o + 9)) {
+      actx.arc(0, 0, 0.4 * scale, 0, 2 * Math.PI);
+    } else {
+      actx.rotate(2 * Math.PI * v.getUint8(o + 8) / 64);
+      actx.moveTo(0.25 * scale, 0.25 * scale);
+      actx.lineTo(-0.25 * scale, 0.25 * scale);
+      actx.lineTo(0, -0.5 * scale);
+    }
+    actx.fill();
+    actx.restore();
+  }
+  frames += 1;
+  status.textContent = 'version ' + version + ', ' + frames + ' frames, ' + nc +
+    ' cells in the last';
+};
+</script></body></html>
+"""
+
+
+def replay(directory, server, speed=1.0, loop=False):
+    """Play a recording to server in (speed times) real time."""
+    source = recording.Replay(directory)
+    world = source.make_world()
+    stream = server.stream(world, name=os.path.basename(os.path.normpath(directory)))
+    times = source.times()
+    while True:
+        start = time.perf_counter()
+        i = 0
+        while i < len(source) - 1:
+            t = times[0] + (time.perf_counter() - start) * speed
+            i = source.index(t)
+            source.apply(world, i)
+            stream(t)
+            time.sleep(stream.interval)
+        if not loop:
+            return
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Replay a recording to a browser.')
+    parser.add_argument('recording', help='directory written by recording.Recorder')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='simulated seconds per second')
+    parser.add_argument('--loop', action='store_true', help='replay it forever')
+    args = parser.parse_args(args)
+
+    with ViewServer(args.host, args.port).start() as server:
+        print('watch at %s' % server.url)
+        replay(args.recording, server, args.speed, args.loop)
+        if not args.loop:
+            input('finished; press enter to stop the server')
+
+
+if __name__ == '__main__':
+    main()